@@ -0,0 +1,41 @@
+"""
+Archive old terminal payments for AgaPay
+
+Moves SUCCESS payments older than ARCHIVE_AFTER_DAYS, and FAILED/CANCELLED
+ones of that age left unchanged for ARCHIVE_SETTLEMENT_DAYS, out of the hot
+tables into compressed monthly segments under ARCHIVE_DIR. Safe to run
+repeatedly (e.g. from cron) while the API is serving traffic.
+"""
+import argparse
+from database_simple import SessionLocal, engine
+from models import models
+from services.archive import PaymentArchiver
+
+
+def archive_payments(older_than_days=None, batch_size=None, max_batches=None, settlement_days=None):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        archiver = PaymentArchiver(
+            older_than_days=older_than_days, batch_size=batch_size, settlement_days=settlement_days
+        )
+        result = archiver.run(db, max_batches=max_batches)
+        print(f"Archived {result['archived']} payments in {result['batches']} batches")
+        if result["conflict"]:
+            print(f"Stopped early: {result['conflict']}")
+        print(f"Cutoff: {archiver.cutoff().isoformat()}")
+        print(f"Archive directory: {archiver.archive_dir}")
+    except Exception as e:
+        print(f"Error archiving payments: {e}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old terminal payments")
+    parser.add_argument("--older-than-days", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--settlement-days", type=int, default=None)
+    args = parser.parse_args()
+    archive_payments(args.older_than_days, args.batch_size, args.max_batches, args.settlement_days)
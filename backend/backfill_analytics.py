@@ -0,0 +1,35 @@
+"""
+Backfill revenue analytics rollups for AgaPay
+
+Rebuilds the hourly and daily payment_rollups buckets for a date range from
+the payments table. New status transitions are folded in as they happen, so
+this is only needed for history that predates the rollups or after repairs.
+Days holding archived payments are refused, as their rollups cannot be
+rebuilt from the payments table.
+"""
+import argparse
+from datetime import datetime, timedelta
+from database_simple import SessionLocal, engine
+from models import models
+from services.analytics import backfill
+
+
+def backfill_analytics(start, end):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        written = backfill(db, start, end)
+        print(f"Rebuilt {written} rollup buckets for {start.date()} to {end.date()}")
+    except Exception as e:
+        print(f"Error backfilling analytics: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill payment analytics rollups")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime.utcnow() - timedelta(days=30))
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime.utcnow())
+    args = parser.parse_args()
+    backfill_analytics(args.start, args.end)
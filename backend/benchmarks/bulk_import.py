@@ -0,0 +1,113 @@
+"""
+Throughput benchmark for bulk user import
+
+Writes a synthetic members CSV (with a sprinkling of duplicate and invalid
+rows), then imports it into a throwaway SQLite database twice: one row at a
+time the way POST /api/auth/register does it, and through
+services.bulk_import. bcrypt cost dominates both, so rows are hashed with
+--rounds (default 4) and the production cost is reported separately.
+
+    python -m benchmarks.bulk_import --rows 100000
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import models
+from models.models import User
+from schemas.user import UserCreate
+from services.bulk_import import BulkImporter, _hash_passwords, pwd_context
+
+
+def write_members(path: str, rows: int) -> None:
+    rng = random.Random(7)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["email", "phone", "full_name", "password"])
+        for i in range(rows):
+            roll = rng.random()
+            if roll < 0.01 and i:
+                j = rng.randrange(i)  # duplicate of an earlier member
+                writer.writerow([f"member{j}@example.com", f"024{j:07d}", "Duplicate", "pass1234"])
+            elif roll < 0.02:
+                writer.writerow([f"member{i}@example.com", f"555{i:07d}", "Bad Phone", "pass1234"])
+            else:
+                writer.writerow([f"member{i}@example.com", f"024{i:07d}", f"Member {i}", f"pass{i:06d}"])
+
+
+def fresh_session():
+    path = os.path.join(tempfile.mkdtemp(), "import_bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def import_one_at_a_time(db, path: str, rows: int, rounds: int) -> int:
+    """What /register does per row: validate, uniqueness query, hash, insert, commit"""
+    created = 0
+    handler = pwd_context.handler("bcrypt").using(rounds=rounds)
+    with open(path, newline="") as f:
+        for row in list(csv.DictReader(f))[:rows]:
+            try:
+                user = UserCreate.model_validate(row)
+            except ValueError:
+                continue
+            if db.query(User).filter((User.email == user.email) | (User.phone == user.phone)).first():
+                continue
+            db.add(User(
+                email=user.email, phone=user.phone, full_name=user.full_name,
+                hashed_password=handler.hash(user.password)
+            ))
+            db.commit()
+            created += 1
+    return created
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--baseline-rows", type=int, default=2_000, help="rows for the one-at-a-time run")
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt cost used during the benchmark")
+    parser.add_argument("--workers", type=int, default=0, help="hashing processes, 0 = one per CPU")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "members.csv")
+    write_members(path, args.rows)
+
+    started = time.perf_counter()
+    _hash_passwords(["pass000000"] * 5)
+    production_hash = (time.perf_counter() - started) / 5
+    print(f"bcrypt at production cost: {production_hash * 1000:.0f}ms per password per CPU")
+
+    db = fresh_session()
+    started = time.perf_counter()
+    created = import_one_at_a_time(db, path, args.baseline_rows, args.rounds)
+    elapsed = time.perf_counter() - started
+    db.close()
+    print(f"one at a time: {args.baseline_rows:,} rows, {created:,} created in {elapsed:.1f}s "
+          f"({args.baseline_rows / elapsed:,.0f} rows/s)")
+
+    importer = BulkImporter(chunk_size=args.chunk_size, hash_workers=args.workers, max_errors=10)
+    db = fresh_session()
+    started = time.perf_counter()
+    with open(path, "rb") as stream:
+        report = importer.import_users(db, stream, "csv", rounds=args.rounds)
+    elapsed = time.perf_counter() - started
+    importer.shutdown()
+    db.close()
+    print(f"bulk ({importer.hash_workers} hash workers): {report['total']:,} rows, {report['created']:,} created, "
+          f"{report['conflicts']:,} conflicts, {report['invalid']:,} invalid in {elapsed:.1f}s "
+          f"({report['total'] / elapsed:,.0f} rows/s)")
+    print(f"at production cost, hashing alone needs ~{report['created'] * production_hash / importer.hash_workers:.0f}s "
+          f"with {importer.hash_workers} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Latency benchmark for GET /api/collections/search
+
+Seeds a throwaway SQLite database with synthetic collections, builds the FTS5
+index and times ranked prefix queries through services.search.
+
+    python -m benchmarks.collection_search --rows 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from models import models
+from services.search import ensure_search_index, search_collections
+
+WORDS = (
+    "church building fund school fees wedding funeral harvest thanksgiving youth "
+    "choir project medical support community borehole library scholarship accra "
+    "kumasi tamale cape coast savings group association welfare outreach mission "
+    "roof repairs uniforms books orphanage hospital relief emergency festival"
+).split()
+
+QUERIES = ["church", "chu", "school fees", "wed", "medical support", "borehole kum", "zzz"]
+
+
+def vocabulary(rng: random.Random, size: int = 20_000):
+    """Named words mixed into a Zipf-distributed pseudo-word vocabulary"""
+    words = ["".join(rng.choices("abcdefghijklmnoprstuwy", k=rng.randint(4, 9))) for _ in range(size)]
+    for word in WORDS:
+        words.insert(rng.randint(20, 2_000), word)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    return words, cum_weights
+
+
+def seed(engine, rows: int, batch: int = 50_000) -> None:
+    rng = random.Random(42)
+    words, cum_weights = vocabulary(rng)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, phone, full_name, hashed_password, is_active, status) "
+            "VALUES (1, 'bench@agapay.com', '0200000000', 'Bench', 'x', 1, 'ACTIVE')"
+        ))
+    insert = text(
+        "INSERT INTO collections (title, description, current_amount, currency, status, is_public, created_by) "
+        "VALUES (:title, :description, 0, 'GHS', :status, :is_public, 1)"
+    )
+    for start in range(0, rows, batch):
+        chunk = [
+            {
+                "title": " ".join(rng.choices(words, cum_weights=cum_weights, k=3)).title(),
+                "description": " ".join(rng.choices(words, cum_weights=cum_weights, k=12)),
+                "status": "ACTIVE" if rng.random() < 0.9 else "EXPIRED",
+                "is_public": rng.random() < 0.8,
+            }
+            for _ in range(min(batch, rows - start))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert, chunk)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "search_bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+
+    started = time.perf_counter()
+    seed(engine, args.rows)
+    print(f"Seeded {args.rows:,} collections (index maintained by triggers) in {time.perf_counter() - started:.1f}s")
+
+    db = sessionmaker(bind=engine)()
+    print(f"{'query':<16}{'hits':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for query in QUERIES:
+        timings = []
+        for i in range(args.repeat):
+            skip = (i % 5) * args.limit  # exercise pagination too
+            begin = time.perf_counter()
+            results = search_collections(db, query, skip=skip, limit=args.limit)
+            timings.append((time.perf_counter() - begin) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{query:<16}{len(results):>6}{statistics.median(timings):>10.2f}{p95:>10.2f}{timings[-1]:>10.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Deterministic synthetic dataset for benchmarks
+
+Seeds users, collections and payments with a fixed RNG seed, so two runs with
+the same arguments produce exactly the same rows and benchmark numbers
+from different commits are comparable.
+
+    python -m benchmarks.dataset --db /tmp/bench.db --users 1000000 --collections 200000 --payments 5000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.engine import Engine
+
+from models import models
+from models.models import (
+    User, Collection, Payment, CollectionStatus, PaymentStatus, PaymentMethod, MobileMoneyProvider
+)
+
+EPOCH = datetime(2024, 1, 1)
+SPAN_SECONDS = 365 * 86400
+
+# A real bcrypt hash of "benchmark", shared by every user; hashing per row
+# would make seeding millions of users take hours
+PASSWORD_HASH = "$2b$04$oAkDmQDV2y.R4hIEAdl9B.T5ox60JOfl6N/wJ0awyn5dF94x99kFm"
+
+STATUS_WEIGHTS = [
+    (PaymentStatus.SUCCESS, 70),
+    (PaymentStatus.FAILED, 15),
+    (PaymentStatus.PENDING, 8),
+    (PaymentStatus.PROCESSING, 2),
+    (PaymentStatus.CANCELLED, 5),
+]
+TERMS = (
+    "church building fund school fees wedding funeral harvest youth choir medical "
+    "community borehole library scholarship welfare outreach roof repairs books"
+).split()
+
+
+def _users(rng: random.Random, count: int):
+    for i in range(1, count + 1):
+        yield {
+            "id": i,
+            "email": f"user{i}@example.com",
+            "phone": f"024{i:07d}",
+            "full_name": f"User {i}",
+            "hashed_password": PASSWORD_HASH,
+            "is_active": rng.random() < 0.98,
+            "created_at": EPOCH + timedelta(seconds=rng.randrange(SPAN_SECONDS)),
+        }
+
+
+def _collections(rng: random.Random, count: int, users: int):
+    for i in range(1, count + 1):
+        created_at = EPOCH + timedelta(seconds=rng.randrange(SPAN_SECONDS))
+        yield {
+            "id": i,
+            "title": " ".join(rng.sample(TERMS, 3)).title(),
+            "description": " ".join(rng.choices(TERMS, k=10)),
+            "target_amount": Decimal(rng.randrange(500, 500_000)),
+            "current_amount": Decimal("0"),
+            "currency": "GHS",
+            "status": CollectionStatus.ACTIVE if rng.random() < 0.85 else CollectionStatus.EXPIRED,
+            "is_public": rng.random() < 0.8,
+            "end_date": created_at + timedelta(days=rng.randrange(7, 365)),
+            "created_by": rng.randint(1, users),
+            "created_at": created_at,
+        }
+
+
+def _payments(rng: random.Random, count: int, users: int, collections: int):
+    statuses, weights = zip(*STATUS_WEIGHTS)
+    cum_weights = [sum(weights[:i + 1]) for i in range(len(weights))]
+    providers = list(MobileMoneyProvider)
+    for i in range(1, count + 1):
+        # Evenly spread over the year, so created_at rises with id like production
+        created_at = EPOCH + timedelta(seconds=SPAN_SECONDS * i // count)
+        payment_status = rng.choices(statuses, cum_weights=cum_weights)[0]
+        mobile = rng.random() < 0.6
+        customer = rng.randint(1, users)
+        yield {
+            "id": i,
+            "reference": f"AGP_{i:012d}",
+            "user_id": customer,
+            "collection_id": rng.randint(1, collections) if collections and rng.random() < 0.8 else None,
+            "amount": Decimal(rng.randrange(100, 200_000)) / 100,
+            "currency": "GHS",
+            "payment_method": PaymentMethod.MOBILE_MONEY if mobile else PaymentMethod.CARD,
+            "status": payment_status,
+            "mobile_money_provider": rng.choice(providers) if mobile else None,
+            "mobile_money_number": f"024{customer:07d}" if mobile else None,
+            "customer_email": f"user{customer}@example.com",
+            "customer_name": f"User {customer}",
+            "created_at": created_at,
+            "processed_at": (
+                created_at + timedelta(seconds=rng.randrange(5, 600))
+                if payment_status in (PaymentStatus.SUCCESS, PaymentStatus.FAILED, PaymentStatus.CANCELLED)
+                else None
+            ),
+        }
+
+
+def _insert(engine: Engine, table, rows, batch: int) -> int:
+    written = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == batch:
+            with engine.begin() as conn:
+                conn.execute(insert(table), chunk)
+            written += len(chunk)
+            chunk = []
+    if chunk:
+        with engine.begin() as conn:
+            conn.execute(insert(table), chunk)
+        written += len(chunk)
+    return written
+
+
+def seed(
+    engine: Engine,
+    users: int,
+    collections: int,
+    payments: int,
+    seed: int = 42,
+    batch: int = 50_000
+) -> dict:
+    """Create the schema and write the dataset; returns its description"""
+    models.Base.metadata.create_all(bind=engine)
+    # One RNG per table, so resizing one table does not reshuffle the others
+    _insert(engine, User.__table__, _users(random.Random(seed), users), batch)
+    _insert(engine, Collection.__table__, _collections(random.Random(seed + 1), collections, users), batch)
+    _insert(engine, Payment.__table__, _payments(random.Random(seed + 2), payments, users, collections), batch)
+    return {"users": users, "collections": collections, "payments": payments, "seed": seed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", required=True, help="SQLite file to create")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--collections", type=int, default=10_000)
+    parser.add_argument("--payments", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    dataset = seed(create_engine(f"sqlite:///{args.db}"), args.users, args.collections, args.payments, args.seed)
+    print(f"Seeded {dataset} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
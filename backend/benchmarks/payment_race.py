@@ -0,0 +1,190 @@
+"""
+Race test for the payment state machine
+
+Seeds pending payments and fires contradictory settlement events at each
+one from many threads at once: duplicate charge.success webhooks, a verify
+that finds success, charge.failed and a stale-payment cancel. Each event
+runs the way the payments router does, in its own session: read the
+payment, services.payment_state.transition, and credit the ledger only if
+the move to SUCCESS applied. The script then checks that every payment was
+credited at most once, that the credit matches its final status, that no
+success was overwritten and that each version counts its applied moves. It
+exits non-zero on any violation and reports throughput and how many
+events were refused by the transition table or a concurrent move.
+
+    python -m benchmarks.payment_race --payments 2000 --events 6 --threads 32
+
+--naive runs the same events through the read-check-assign code this
+replaced, to show what the version guard prevents (the unique ledger
+payment_id turns its second credits into IntegrityErrors). --db points the run at
+another database (e.g. PostgreSQL) instead of a throwaway SQLite file.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+# (event, target status); the first is the webhook, sent more than once
+EVENTS = [
+    ("charge.success", "SUCCESS"),
+    ("charge.success", "SUCCESS"),
+    ("verify", "SUCCESS"),
+    ("charge.failed", "FAILED"),
+    ("cancel", "CANCELLED"),
+    ("processing", "PROCESSING"),
+]
+
+
+def seed(engine, payments: int) -> None:
+    from models import models
+
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO users (id, email, phone, full_name, hashed_password, is_active, status) "
+                "VALUES (1, 'race@agapay.com', '0240000000', 'Race', 'x', true, 'ACTIVE')"
+            )
+        )
+        # One collection per payment, so the balance check sees only this payment's credits
+        conn.execute(
+            text(
+                "INSERT INTO collections (id, title, current_amount, currency, status, is_public, created_by) "
+                "VALUES (:id, :title, 0, 'GHS', 'ACTIVE', true, 1)"
+            ),
+            [{"id": n, "title": f"Fund {n}"} for n in range(1, payments + 1)]
+        )
+        conn.execute(
+            text(
+                "INSERT INTO payments (id, reference, user_id, collection_id, amount, currency, payment_method, "
+                "status, version, customer_email, customer_name, created_at) "
+                "VALUES (:id, :reference, 1, :id, 10, 'GHS', 'CARD', 'PENDING', 1, 'race@agapay.com', 'Race', :now)"
+            ),
+            [{"id": n, "reference": f"AGA_RACE_{n}", "now": now} for n in range(1, payments + 1)]
+        )
+
+
+class Race:
+    def __init__(self, Session, naive: bool):
+        self.Session = Session
+        self.naive = naive
+        self.lock = threading.Lock()
+        self.applied = defaultdict(list)  # payment id -> statuses moved to
+        self.errors = Counter()
+
+    def settle(self, payment_id: int, target_name: str) -> None:
+        from models.models import Collection, Payment, PaymentStatus
+        from services.ledger import post_entry
+        from services.payment_state import can_transition, transition
+
+        target = PaymentStatus[target_name]
+        db = self.Session()
+        try:
+            payment = db.get(Payment, payment_id)
+            if self.naive:
+                previous_status = payment.status if can_transition(payment.status, target) else None
+                if previous_status is not None:
+                    payment.status = target
+                    payment.updated_at = datetime.utcnow()
+            else:
+                previous_status = transition(db, payment, target, processed_at=datetime.utcnow())
+            if previous_status is not None and target == PaymentStatus.SUCCESS:
+                post_entry(db, db.get(Collection, payment.collection_id), payment.amount, "payment", payment_id=payment.id)
+            db.commit()
+            if previous_status is not None:
+                with self.lock:
+                    self.applied[payment_id].append(target)
+        except Exception as e:
+            db.rollback()
+            with self.lock:
+                self.errors[type(e).__name__] += 1
+        finally:
+            db.close()
+
+
+def check(engine, race: Race, payments: int) -> int:
+    from models.models import PaymentStatus
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT p.id, p.status, p.version, COUNT(l.id) AS credits, c.current_amount "
+            "FROM payments p JOIN collections c ON c.id = p.collection_id "
+            "LEFT JOIN collection_ledger l ON l.payment_id = p.id "
+            "GROUP BY p.id, p.status, p.version, c.current_amount"
+        )).all()
+    violations = Counter()
+    for row in rows:
+        applied = race.applied[row.id]
+        if row.credits > 1:
+            violations["credited more than once"] += 1
+        if (row.credits == 1) != (row.status == PaymentStatus.SUCCESS.name):
+            violations["credit does not match status"] += 1
+        if PaymentStatus.SUCCESS in applied and row.status != PaymentStatus.SUCCESS.name:
+            violations["success overwritten"] += 1
+        if not race.naive and row.version != 1 + len(applied):
+            violations["version does not count moves"] += 1
+        if float(row.current_amount) != 10 * row.credits:
+            violations["balance drift"] += 1
+    statuses = Counter(row.status for row in rows)
+    print(f"final statuses: {dict(statuses)}")
+    for name, count in violations.items():
+        print(f"VIOLATION {name}: {count}/{payments} payments")
+    return sum(violations.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--payments", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=len(EVENTS), help="settlement events per payment")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--db", help="database URL; a throwaway SQLite file by default")
+    parser.add_argument("--naive", action="store_true", help="read-check-assign instead of the versioned update")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    url = args.db or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'race.db')}"
+    os.environ.setdefault("DATABASE_URL", url)
+    os.environ.setdefault("SLOW_QUERY_MS", "1e9")
+    os.environ.setdefault("TRACING_ENABLED", "false")
+    connect_args = {"timeout": 60, "check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args, pool_size=args.threads, max_overflow=0)
+    seed(engine, args.payments)
+
+    rng = random.Random(args.seed)
+    # Each payment's events are queued together so they run at the same time
+    events = []
+    for payment_id in range(1, args.payments + 1):
+        batch = [(payment_id, EVENTS[n % len(EVENTS)][1]) for n in range(args.events)]
+        rng.shuffle(batch)
+        events.extend(batch)
+
+    race = Race(sessionmaker(bind=engine, autoflush=False), args.naive)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda event: race.settle(*event), events))
+    elapsed = time.perf_counter() - started
+
+    moves = sum(len(applied) for applied in race.applied.values())
+    print(
+        f"{'naive' if args.naive else 'versioned'}: {len(events)} events on {args.payments} payments "
+        f"in {elapsed:.2f}s ({len(events) / elapsed:.0f} events/s), {moves} moves applied, "
+        f"{len(events) - moves - sum(race.errors.values())} refused, errors: {dict(race.errors)}"
+    )
+    if check(engine, race, args.payments):
+        sys.exit(1)
+    print("every payment credited at most once, in step with its status")
+
+
+if __name__ == "__main__":
+    main()
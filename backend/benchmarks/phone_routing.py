@@ -0,0 +1,140 @@
+"""
+Corpus check and microbenchmark for mobile money number routing
+
+Runs services.phone over a table of numbers as clients and gateways write
+them, covering every prefix, each accepted spelling and the malformed ones.
+It exits non-zero on any mismatch and then times normalization and network
+detection per call. The trie lookup is timed against a linear scan over the
+prefix table, which is what it replaced.
+
+    python -m benchmarks.phone_routing
+"""
+import argparse
+import random
+import sys
+import timeit
+
+from models.models import MobileMoneyProvider
+from services.phone import PREFIXES, detect_provider, normalize_phone, parse_phone, route_mobile_money
+
+MTN, TELECEL, AIRTELTIGO = MobileMoneyProvider.MTN, MobileMoneyProvider.VODAFONE, MobileMoneyProvider.AIRTELTIGO
+INVALID = "invalid"
+
+# (as written, E.164 or INVALID, detected network)
+CORPUS = [
+    ("0241234567", "+233241234567", MTN),
+    ("0251234567", "+233251234567", MTN),
+    ("0531234567", "+233531234567", MTN),
+    ("0541234567", "+233541234567", MTN),
+    ("0551234567", "+233551234567", MTN),
+    ("0591234567", "+233591234567", MTN),
+    ("0201234567", "+233201234567", TELECEL),
+    ("0501234567", "+233501234567", TELECEL),
+    ("0261234567", "+233261234567", AIRTELTIGO),
+    ("0271234567", "+233271234567", AIRTELTIGO),
+    ("0561234567", "+233561234567", AIRTELTIGO),
+    ("0571234567", "+233571234567", AIRTELTIGO),
+    # Glo and fixed lines are valid numbers without mobile money
+    ("0231234567", "+233231234567", None),
+    ("0302123456", "+233302123456", None),
+    # Spellings
+    ("+233241234567", "+233241234567", MTN),
+    ("00233241234567", "+233241234567", MTN),
+    ("+233 24 123 4567", "+233241234567", MTN),
+    ("024-123-4567", "+233241234567", MTN),
+    ("(024) 123 4567", "+233241234567", MTN),
+    ("024.123.4567", "+233241234567", MTN),
+    (" 0201234567 ", "+233201234567", TELECEL),
+    # Malformed
+    ("241234567", INVALID, None),
+    ("233241234567", INVALID, None),
+    ("+234241234567", INVALID, None),
+    ("024123456", INVALID, None),
+    ("02412345678", INVALID, None),
+    ("+2330241234567", INVALID, None),
+    ("00241234567", INVALID, None),
+    ("024123456a", INVALID, None),
+    ("+233", INVALID, None),
+    ("", INVALID, None),
+]
+
+# (as written, network asked for, accepted)
+ROUTES = [
+    ("0201234567", TELECEL, True),
+    ("0201234567", MTN, False),
+    ("0241234567", None, True),
+    ("0561234567", AIRTELTIGO, True),
+    ("0561234567", TELECEL, False),
+    ("0231234567", None, False),
+    ("0231234567", MTN, False),
+]
+
+
+def check() -> int:
+    failures = 0
+    for written, e164, network in CORPUS:
+        try:
+            got = parse_phone(written)
+        except ValueError:
+            got = (INVALID, None)
+        if tuple(got) != (e164, network):
+            failures += 1
+            print(f"FAIL {written!r}: got {tuple(got)}, expected {(e164, network)}")
+    for written, network, accepted in ROUTES:
+        try:
+            route_mobile_money(written, network)
+            ok = True
+        except ValueError:
+            ok = False
+        if ok != accepted:
+            failures += 1
+            print(f"FAIL route {written!r} as {network}: accepted={ok}, expected {accepted}")
+    print(f"{len(CORPUS) + len(ROUTES) - failures}/{len(CORPUS) + len(ROUTES)} cases pass")
+    return failures
+
+
+def linear_provider(e164: str):
+    """Longest matching prefix by scanning the whole table"""
+    national = e164[4:]
+    best = None
+    for prefix, provider in PREFIXES.items():
+        if national.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, provider)
+    return best and best[1]
+
+
+def bench(numbers, repeat: int) -> None:
+    e164s = [normalize_phone(n) for n in numbers]
+    assert [linear_provider(n) for n in e164s] == [detect_provider(n) for n in e164s]
+    cases = [
+        ("normalize_phone", lambda: [normalize_phone(n) for n in numbers]),
+        ("detect_provider (trie)", lambda: [detect_provider(n) for n in e164s]),
+        ("detect_provider (linear scan)", lambda: [linear_provider(n) for n in e164s]),
+        ("parse_phone", lambda: [parse_phone(n) for n in numbers]),
+    ]
+    for name, run in cases:
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+        print(f"{name:32s} {best / len(numbers) * 1e9:8.0f} ns/call")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--numbers", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if check():
+        sys.exit(1)
+    rng = random.Random(args.seed)
+    prefixes = list(PREFIXES) + ["23", "30"]
+    spellings = ["0{}{}", "+233{}{}", "+233 {} {}"]
+    numbers = [
+        rng.choice(spellings).format(rng.choice(prefixes), f"{rng.randrange(10 ** 7):07d}")
+        for _ in range(args.numbers)
+    ]
+    bench(numbers, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark for the recurring contributions scheduler
+
+Seeds a throwaway SQLite database with due recurring contributions and runs
+the scheduler against an in-process Paystack stub (ASGI, with a simulated
+latency and failure ratio), then checks that every schedule was charged
+exactly once, that payments and the ledger agree, and reports throughput.
+
+    python -m benchmarks.recurring_charges --schedules 50000 --concurrency 50
+
+--crash-after N abandons the first run N seconds in, with charges in flight
+and their results unrecorded, then lets the claims lapse and runs again, as
+a restarted worker would; the checks then show the second run resumed by
+reference without charging anyone twice.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+
+def seed(path: str, schedules: int, users: int, collections: int) -> None:
+    from models import models
+
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO users (id, email, phone, full_name, hashed_password, is_active, status) "
+                "VALUES (:id, :email, :phone, :name, 'x', 1, 'ACTIVE')"
+            ),
+            [{"id": n, "email": f"saver{n}@agapay.com", "phone": f"024{n:07d}", "name": f"Saver {n}"} for n in range(1, users + 1)]
+        )
+        conn.execute(
+            text(
+                "INSERT INTO collections (id, title, current_amount, currency, status, is_public, created_by) "
+                "VALUES (:id, :title, 0, 'GHS', 'ACTIVE', 1, 1)"
+            ),
+            [{"id": n, "title": f"Building Fund {n}"} for n in range(1, collections + 1)]
+        )
+        conn.execute(
+            text(
+                "INSERT INTO payment_authorizations (id, user_id, authorization_code, email, channel, is_active, created_at) "
+                "VALUES (:id, :id, :code, :email, 'card', 1, :now)"
+            ),
+            [{"id": n, "code": f"AUTH_{n}", "email": f"saver{n}@agapay.com", "now": now} for n in range(1, users + 1)]
+        )
+        conn.execute(
+            text(
+                "INSERT INTO recurring_contributions (user_id, collection_id, authorization_id, amount, interval, "
+                "day_of_month, status, next_charge_at, failure_count, created_at) "
+                "VALUES (:user, :collection, :user, :amount, 'MONTHLY', :day, 'ACTIVE', :due, 0, :now)"
+            ),
+            [
+                {
+                    "user": n % users + 1,
+                    "collection": n % collections + 1,
+                    "amount": 5 + n % 20,
+                    "day": (now - timedelta(minutes=n % 600)).day,
+                    "due": now - timedelta(minutes=n % 600),
+                    "now": now,
+                }
+                for n in range(schedules)
+            ]
+        )
+    engine.dispose()
+
+
+def paystack_stub(latency_ms: float, failure_ratio: float, seed_value: int):
+    """Just enough of Paystack: charge_authorization and verify, remembering every charge"""
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    rng = random.Random(seed_value)
+    charges = Counter()
+    results = {}
+
+    async def charge(request):
+        payload = await request.json()
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * latency_ms / 1000)
+        reference = payload["reference"]
+        charges[reference] += 1
+        status = "failed" if rng.random() < failure_ratio else "success"
+        results[reference] = status
+        return JSONResponse({
+            "status": True,
+            "message": "Charge attempted",
+            "data": {"id": len(results), "reference": reference, "status": status, "amount": payload["amount"]},
+        })
+
+    async def verify(request):
+        reference = request.path_params["reference"]
+        await asyncio.sleep(latency_ms / 1000)
+        if reference not in results:
+            return JSONResponse({"status": False, "message": "Transaction reference not found"}, status_code=400)
+        return JSONResponse({"status": True, "data": {"id": 0, "reference": reference, "status": results[reference]}})
+
+    app = Starlette(routes=[
+        Route("/transaction/charge_authorization", charge, methods=["POST"]),
+        Route("/transaction/verify/{reference}", verify),
+    ])
+    return app, charges
+
+
+async def run(args) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "recurring_bench.db")
+    started = time.perf_counter()
+    seed(path, args.schedules, args.users, args.collections)
+    print(f"seeded {args.schedules} due schedules in {time.perf_counter() - started:.1f}s")
+    # Must be set before database_simple is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("SLOW_QUERY_MS", "1e9")
+    os.environ.setdefault("TRACING_ENABLED", "false")
+
+    import httpx
+    from database_simple import engine
+    from services.ledger import verify
+    from database_simple import SessionLocal
+    from services.recurring import RecurringScheduler
+
+    stub, charges = paystack_stub(args.paystack_ms, args.failure_ratio, args.seed)
+    scheduler = RecurringScheduler(
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        rate_per_second=args.rate,
+        max_charges_per_run=args.schedules * 2,
+        lock_seconds=600,
+        retry_hours=24,
+        max_failures=3,
+        poll_seconds=60
+    )
+    scheduler.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub), timeout=30.0)
+
+    if args.crash_after:
+        run_task = asyncio.create_task(scheduler.run(force=True))
+        await asyncio.sleep(args.crash_after)
+        run_task.cancel()
+        try:
+            await run_task
+        except asyncio.CancelledError:
+            pass
+        print(f"abandoned the first run after {args.crash_after}s with {sum(charges.values())} charges made")
+        # The restarted worker waits out the claims; skip the wait
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE recurring_contributions SET locked_until = NULL"))
+
+    started = time.perf_counter()
+    result = await scheduler.run(force=True)
+    elapsed = time.perf_counter() - started
+    await scheduler.client.aclose()
+
+    print(f"run: {result}")
+    print(f"{result['schedules']} schedules in {elapsed:.2f}s ({result['schedules'] / elapsed:.0f}/s)")
+    print(f"scheduler: {scheduler.metrics}")
+
+    with engine.connect() as conn:
+        count = lambda sql: conn.execute(text(sql)).scalar()
+        duplicates = sum(1 for n in charges.values() if n > 1)
+        print(f"charges at Paystack: {sum(charges.values())}, references charged twice: {duplicates}")
+        print(f"payments: {dict(conn.execute(text('SELECT status, COUNT(*) FROM payments GROUP BY status')).all())}")
+        print(f"schedules still due: {count('SELECT COUNT(*) FROM recurring_contributions WHERE next_charge_at <= CURRENT_TIMESTAMP')}")
+        print(
+            "ledger entries:", count("SELECT COUNT(*) FROM collection_ledger WHERE payment_id IS NOT NULL"),
+            "successful payments:", count("SELECT COUNT(*) FROM payments WHERE status = 'SUCCESS'")
+        )
+    db = SessionLocal()
+    try:
+        print(f"ledger drift: {verify(db)}")
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--schedules", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--collections", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50, help="charges in flight at once")
+    parser.add_argument("--rate", type=float, default=0, help="charges per second, 0 for no limit")
+    parser.add_argument("--paystack-ms", type=float, default=20.0, help="simulated Paystack latency")
+    parser.add_argument("--failure-ratio", type=float, default=0.05)
+    parser.add_argument("--crash-after", type=float, default=0, help="abandon a first run after this many seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
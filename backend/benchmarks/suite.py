@@ -0,0 +1,311 @@
+"""
+Microbenchmark suite for backend hot paths
+
+Times auth tokens, Paystack webhook signature checks and parsing, payment
+serialization and the stats/list endpoints. Endpoints are called in-process
+through an ASGI client against a seeded SQLite dataset (benchmarks.dataset),
+which is generated on first use and reused afterwards. Results are written
+as JSON; pass --compare with an earlier file to see the change per case.
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --compare benchmarks/results/<earlier>.json --fail-on-regression
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CASES: List[Tuple[str, int, Callable[["Context"], Callable[[], Any]]]] = []
+
+
+def case(name: str, number: int = 1):
+    """Register a case factory; it returns the (sync or async) callable to time.
+
+    Each sample runs the callable ``number`` times, so sub-microsecond work is
+    not swamped by timer overhead; reported times are per call.
+    """
+    def register(factory):
+        CASES.append((name, number, factory))
+        return factory
+    return register
+
+
+class Context:
+    """What cases share: the app client, the Paystack secret and a sample of payments"""
+
+    def __init__(self, client, secret_key: str, payments: List[Any]):
+        self.client = client
+        self.secret_key = secret_key
+        self.payments = payments
+
+
+def _webhook_body(reference: str) -> bytes:
+    """A charge.success event shaped like Paystack's, about 1.5KB"""
+    return json.dumps({
+        "event": "charge.success",
+        "data": {
+            "id": 302961, "domain": "live", "status": "success", "reference": reference,
+            "amount": 10000, "message": None, "gateway_response": "Approved by Financial Institution",
+            "paid_at": "2024-06-01T12:00:00.000Z", "created_at": "2024-06-01T11:59:00.000Z",
+            "channel": "mobile_money", "currency": "GHS", "ip_address": "41.58.96.208",
+            "metadata": {"custom_fields": [{"display_name": "Collection", "variable_name": "collection", "value": "1"}]},
+            "log": {"time_spent": 16, "attempts": 1, "authentication": "pin", "errors": 0, "success": True,
+                    "mobile": True, "input": [], "channel": None,
+                    "history": [{"type": "input", "message": "Filled these fields: phone", "time": 15}]},
+            "fees": 150, "customer": {"id": 68324, "first_name": "Kwame", "last_name": "Mensah",
+                                      "email": "kwame@example.com", "customer_code": "CUS_qo38as2hpsgk2r0",
+                                      "phone": "0241234567", "metadata": None, "risk_action": "default"},
+            "authorization": {"authorization_code": "AUTH_f5rnfq9p", "bin": "024", "last4": "4567",
+                              "exp_month": "12", "exp_year": "9999", "channel": "mobile_money",
+                              "card_type": "", "bank": "MTN", "country_code": "GH", "brand": "mtn",
+                              "reusable": False, "signature": None},
+            "plan": {},
+        },
+    }).encode("utf-8")
+
+
+@case("auth.create_access_token", number=100)
+def _create_token(ctx: Context):
+    from routers.auth import create_access_token
+    return lambda: create_access_token({"sub": "user1@example.com"})
+
+
+@case("auth.verify_token", number=100)
+def _verify_token(ctx: Context):
+    from routers.auth import create_access_token, verify_token
+    token = create_access_token({"sub": "user1@example.com"})
+    return lambda: verify_token(token)
+
+
+@case("paystack.verify_webhook_signature", number=1000)
+def _verify_signature(ctx: Context):
+    from services.paystack import PaystackService
+    service = PaystackService()
+    body = _webhook_body("AGP_000000000001")
+    signature = hmac.new(ctx.secret_key.encode("utf-8"), body, hashlib.sha512).hexdigest()
+    return lambda: service.verify_webhook_signature(body, signature)
+
+
+@case("webhook.parse_json", number=1000)
+def _parse_webhook(ctx: Context):
+    body = _webhook_body("AGP_000000000001")
+    return lambda: json.loads(body)
+
+
+@case("webhook.post_unknown_reference")
+def _post_webhook(ctx: Context):
+    # Unknown reference: parsing, routing and the lookup, without mutating the dataset
+    body = _webhook_body("AGP_UNKNOWN")
+    headers = {"x-paystack-signature": "unused", "content-type": "application/json"}
+    return lambda: ctx.client.post("/api/payments/webhook", content=body, headers=headers)
+
+
+@case("schemas.PaymentResponse_x100")
+def _serialize_payments(ctx: Context):
+    from schemas.payment import PaymentResponse
+    payments = ctx.payments
+    return lambda: [PaymentResponse.model_validate(p).model_dump_json() for p in payments]
+
+
+@case("api.payment_stats")
+def _payment_stats(ctx: Context):
+    return lambda: ctx.client.get("/api/payments/stats")
+
+
+@case("api.list_payments")
+def _list_payments(ctx: Context):
+    return lambda: ctx.client.get("/api/payments/", params={"limit": 100})
+
+
+@case("api.list_payments_filtered")
+def _list_payments_filtered(ctx: Context):
+    return lambda: ctx.client.get(
+        "/api/payments/", params={"status": "success", "payment_method": "mobile_money", "limit": 100}
+    )
+
+
+@case("api.list_payments_deep_page")
+def _list_payments_deep(ctx: Context):
+    return lambda: ctx.client.get("/api/payments/", params={"skip": 50_000, "limit": 100})
+
+
+@case("api.list_collections")
+def _list_collections(ctx: Context):
+    # Mostly served by the collection cache after the first call
+    return lambda: ctx.client.get("/api/collections/", params={"limit": 100})
+
+
+@case("api.list_users")
+def _list_users(ctx: Context):
+    return lambda: ctx.client.get("/api/users/", params={"limit": 100})
+
+
+async def _time_case(
+    fn: Callable[[], Any],
+    number: int,
+    repeat: int,
+    warmup: int,
+    max_seconds: float
+) -> Dict[str, Any]:
+    async def call():
+        for _ in range(number):
+            result = fn()
+            if asyncio.iscoroutine(result):
+                result = await result
+        status_code = getattr(result, "status_code", 200)
+        if status_code >= 400:
+            raise RuntimeError(f"HTTP {status_code}: {result.text[:200]}")
+
+    for _ in range(warmup):
+        await call()
+
+    timings = []
+    budget_end = time.perf_counter() + max_seconds
+    while len(timings) < repeat:
+        started = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - started) * 1000 / number)
+        if time.perf_counter() > budget_end and len(timings) >= 5:
+            break
+
+    timings.sort()
+    mean = statistics.fmean(timings)
+    return {
+        "iterations": len(timings) * number,
+        "min_ms": round(timings[0], 6),
+        "median_ms": round(statistics.median(timings), 6),
+        "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 6),
+        "mean_ms": round(mean, 6),
+        "ops_per_sec": round(1000 / mean, 1) if mean else None,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=HERE, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the median change per case; the names of cases slower than ``threshold``"""
+    regressions = []
+    print(f"\n{'case':<36}{'before ms':>12}{'after ms':>12}{'change':>10}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<36}{'-':>12}{result['median_ms']:>12.3f}{'new':>10}")
+            continue
+        change = (result["median_ms"] - before["median_ms"]) / before["median_ms"] if before["median_ms"] else 0.0
+        flag = " !" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36}{before['median_ms']:>12.3f}{result['median_ms']:>12.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.dataset import seed
+
+    dataset = {"users": args.users, "collections": args.collections, "payments": args.payments, "seed": args.seed}
+    db_path = args.db or os.path.join(
+        HERE, ".data", f"bench-{args.users}-{args.collections}-{args.payments}-s{args.seed}.db"
+    )
+    if not os.path.exists(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        print(f"Seeding {db_path} ...")
+        started = time.perf_counter()
+        from sqlalchemy import create_engine
+        seed(create_engine(f"sqlite:///{db_path}"), args.users, args.collections, args.payments, args.seed)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    # Must be set before the app (and database_simple) is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    # Keep slow-query EXPLAIN logging out of the timings
+    os.environ.setdefault("SLOW_QUERY_MS", "1e9")
+
+    import httpx
+    from core.config import settings
+    from database_simple import SessionLocal
+    from main import app
+    from models.models import Payment
+
+    db = SessionLocal()
+    payments = db.query(Payment).order_by(Payment.id).limit(100).all()
+    db.expunge_all()
+    db.close()
+
+    results = {}
+    # No lifespan: the sweeper and notification dispatcher stay off during timing
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        ctx = Context(client, settings.PAYSTACK_SECRET_KEY, payments)
+        for name, number, factory in CASES:
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            results[name] = await _time_case(factory(ctx), number, args.repeat, args.warmup, args.max_seconds)
+            r = results[name]
+            print(f"{name:<36}{r['median_ms']:>10.3f} ms median {r['p95_ms']:>10.3f} ms p95 ({r['iterations']} runs)")
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "dataset": dataset,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--collections", type=int, default=10_000)
+    parser.add_argument("--payments", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=None, help="dataset file (default: cached under benchmarks/.data)")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=5.0, help="time budget per case")
+    parser.add_argument("--only", nargs="*", help="run cases whose name starts with one of these")
+    parser.add_argument("--output", default=None, help="results file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="median slowdown counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join(
+        HERE, "results", f"{report['commit'] or 'unknown'}-{report['timestamp'].replace(':', '')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("dataset") != report["dataset"]:
+            print(f"Warning: baseline dataset {baseline.get('dataset')} differs from {report['dataset']}")
+        regressions = compare(baseline, report, args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"\n{len(regressions)} regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
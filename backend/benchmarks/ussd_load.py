@@ -0,0 +1,141 @@
+"""
+Load test for the USSD callback
+
+Runs many concurrent USSD sessions through POST /api/ussd/callback in-process
+(ASGI client, throwaway SQLite database) from the first menu to a confirmed
+payment, and reports per-hop latency against USSD_HOP_BUDGET_MS. Paystack is
+replaced by a fixed delay, so the run also shows charges draining in the
+background while hops keep being answered.
+
+    python -m benchmarks.ussd_load --sessions 2000 --concurrency 200
+
+--think-ms 0 replaces subscribers with a closed loop hammering the endpoint,
+which measures saturation (queueing) rather than per-hop latency.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+
+def seed(path: str, collections: int) -> None:
+    from models import models
+
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, phone, full_name, hashed_password, is_active, status) "
+            "VALUES (1, 'bench@agapay.com', '0200000000', 'Bench', 'x', 1, 'ACTIVE')"
+        ))
+        conn.execute(
+            text(
+                "INSERT INTO collections (title, current_amount, currency, status, is_public, created_by) "
+                "VALUES (:title, 0, 'GHS', 'ACTIVE', 1, 1)"
+            ),
+            [{"title": f"Harvest Fund {number}"} for number in range(collections)]
+        )
+    engine.dispose()
+
+
+def percentile(values, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+async def run(args) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "ussd_bench.db")
+    seed(path, args.collections)
+    # Must be set before the app (and database_simple) is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("SLOW_QUERY_MS", "1e9")
+    os.environ.setdefault("TRACING_ENABLED", "false")
+    # The in-process client calls from 127.0.0.1; let it in as the gateway
+    os.environ.setdefault("USSD_GATEWAY_IPS", '["127.0.0.1"]')
+
+    import httpx
+    from core.config import settings
+    from main import app
+    from services.paystack import PaystackService
+    from services.ussd import ussd_charges, ussd_engine
+
+    async def paystack(self, **payload):
+        await asyncio.sleep(args.paystack_ms / 1000)
+        return {"status": True, "data": {"reference": payload["reference"]}}
+
+    PaystackService.submit_mobile_money = paystack
+    ussd_charges.start()
+
+    rng = random.Random(args.seed)
+    latencies = []
+    shed = []
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def session(client: httpx.AsyncClient, number: int) -> None:
+        # Half the sessions come with a network code; the rest call from numbers
+        # outside the known mobile money ranges, so they get the network menu
+        network = "62001" if number % 2 else None
+        inputs = [str(rng.randint(1, settings.USSD_MENU_PAGE_SIZE)), str(rng.randint(1, 4))]
+        if network is None:
+            inputs.append("1")
+        inputs.append("1")
+        form = {"sessionId": f"bench-{number}", "phoneNumber": f"+2332{4 if network else 3}{number:07d}", "serviceCode": "*384#"}
+        if network:
+            form["networkCode"] = network
+        async with slots:
+            for hop in range(len(inputs) + 1):
+                started = time.perf_counter()
+                response = await client.post("/api/ussd/callback", data={**form, "text": "*".join(inputs[:hop])})
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code == 503:
+                    # Admission control turned the hop away; the gateway would end the session
+                    shed.append(number)
+                    return
+                assert response.status_code == 200 and response.text.startswith(("CON", "END")), response.text
+                if args.think_ms:
+                    await asyncio.sleep(rng.uniform(0, args.think_ms) / 1000)
+
+    # No lifespan: only the charge workers run, so background loops stay out of the timings
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # One hop first, as a running server would have served long before the measured load
+        await client.post("/api/ussd/callback", data={"sessionId": "warmup", "phoneNumber": "+233240000000"})
+        started = time.perf_counter()
+        await asyncio.gather(*(session(client, number) for number in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+        drain_started = time.perf_counter()
+        metrics = ussd_charges.metrics
+        while metrics["submitted"] + metrics["failed"] < metrics["queued"]:
+            await asyncio.sleep(0.05)
+        drained = time.perf_counter() - drain_started
+        await ussd_charges.stop()
+
+    budget = settings.USSD_HOP_BUDGET_MS
+    over = sum(1 for latency in latencies if latency > budget)
+    print(f"{args.sessions} sessions, {len(latencies)} hops in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} hops/s)")
+    print(
+        f"hop latency: median {statistics.median(latencies):.2f} ms, p95 {percentile(latencies, 0.95):.2f} ms, "
+        f"p99 {percentile(latencies, 0.99):.2f} ms, max {max(latencies):.2f} ms"
+    )
+    print(f"over the {budget:.0f} ms budget: {over} ({over / len(latencies):.2%}), sessions shed with 503: {len(shed)}")
+    print(f"charges: {ussd_charges.metrics}, drained {drained:.2f}s after the last hop")
+    print(f"engine: {ussd_engine.metrics}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="sessions in flight at once")
+    parser.add_argument("--collections", type=int, default=100)
+    parser.add_argument("--paystack-ms", type=float, default=500.0, help="simulated Paystack charge latency")
+    parser.add_argument("--think-ms", type=float, default=1000.0, help="up to this much pause between a session's hops")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Microbenchmark for payment velocity checks
+
+Times VelocityLimiter.check per call with a mix of repeat and one-off
+emails, phone numbers and IPs, against the in-process counters and the
+shared counters on an in-memory backend (a Redis backend adds one round
+trip). It also times the per-request COUNT over payments that the counters
+replace. It reports how many keys the local counters hold once the key limit
+has forced evictions, and checks that the limits hold.
+
+    python -m benchmarks.velocity --checks 200000 --max-keys 50000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select
+
+LIMITS = {"email": {60: 5, 3600: 30}, "phone": {60: 5, 3600: 30}, "ip": {60: 30, 3600: 300}}
+
+
+def attempts(count: int, seed: int):
+    """(email, phone, ip); a fifth come from a small set of repeat customers"""
+    rng = random.Random(seed)
+    for n in range(count):
+        who = rng.randrange(500) if rng.random() < 0.2 else n
+        yield f"user{who}@example.com", f"+23324{who % 10 ** 7:07d}", f"10.{who % 256}.{who // 256 % 256}.{who % 7}"
+
+
+async def time_checks(limiter, count: int, seed: int) -> float:
+    started = time.perf_counter()
+    for email, phone, ip in attempts(count, seed):
+        await limiter.check(email, phone, ip)
+    return (time.perf_counter() - started) / count
+
+
+async def verify_limits(limiter_class) -> None:
+    limiter = limiter_class()
+    allowed = 0
+    for _ in range(20):
+        if await limiter.check("same@example.com", None, None) is None:
+            allowed += 1
+    violation = await limiter.check("same@example.com", None, None)
+    assert allowed == LIMITS["email"][60], allowed
+    assert violation is not None and violation.key == "email" and 1 <= violation.retry_after <= 60, violation
+
+
+def time_count_query(checks: int, payments: int) -> float:
+    """The per-request alternative: COUNT recent payments for the customer on an indexed column"""
+    from models import models
+    from models.models import Payment, PaymentMethod, PaymentStatus
+
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'velocity.db')}")
+    models.Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(models.Payment.__table__.insert(), [
+            {
+                "reference": f"AGA_{n}", "user_id": 1, "amount": 10, "currency": "GHS",
+                "payment_method": PaymentMethod.CARD, "status": PaymentStatus.SUCCESS,
+                "customer_email": f"user{n % 5000}@example.com", "customer_name": "x",
+                "created_at": now - timedelta(seconds=n % 86400),
+            }
+            for n in range(payments)
+        ])
+    query = select(func.count()).select_from(Payment).where(
+        Payment.customer_email == "user42@example.com", Payment.created_at >= now - timedelta(hours=1)
+    )
+    with engine.connect() as conn:
+        started = time.perf_counter()
+        for _ in range(checks):
+            conn.execute(query).scalar()
+        return (time.perf_counter() - started) / checks
+
+
+async def run(args) -> None:
+    from core.cache import MemoryBackend
+    from services.velocity import LocalCounters, SharedCounters, VelocityLimiter
+
+    def local():
+        return VelocityLimiter(LIMITS, buckets=args.buckets, max_keys=args.max_keys)
+
+    def shared():
+        limiter = VelocityLimiter(LIMITS, buckets=args.buckets, max_keys=args.max_keys)
+        limiter.counters = SharedCounters(LIMITS, MemoryBackend(), "bench")
+        return limiter
+
+    await verify_limits(local)
+    await verify_limits(shared)
+    print("limits hold for local and shared counters")
+
+    limiter = local()
+    per_check = await time_checks(limiter, args.checks, args.seed)
+    counters: LocalCounters = limiter.counters
+    # Memory in a second, traced pass; tracing would distort the timings
+    tracemalloc.start()
+    traced = local()
+    await time_checks(traced, args.checks, args.seed)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"local:  {per_check * 1e6:6.2f} us/check, {len(counters)} keys held, {counters.evictions} evicted, "
+        f"{memory / 2 ** 20:.1f} MiB, {limiter.metrics}"
+    )
+    limiter = shared()
+    per_check = await time_checks(limiter, args.checks, args.seed)
+    print(f"shared: {per_check * 1e6:6.2f} us/check (in-memory stand-in for Redis), {limiter.metrics}")
+    per_query = time_count_query(min(args.checks, 2000), args.payments)
+    print(f"COUNT over {args.payments} payments: {per_query * 1e6:6.2f} us/query (SQLite, one key only)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checks", type=int, default=200000)
+    parser.add_argument("--max-keys", type=int, default=50000)
+    parser.add_argument("--buckets", type=int, default=10)
+    parser.add_argument("--payments", type=int, default=200000, help="rows behind the COUNT comparison")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
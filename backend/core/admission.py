@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Pattern, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RouteClass:
+    """A group of routes sharing a concurrency limit and a wait queue.
+
+    Lower ``priority`` values are admitted first when a shared slot frees up.
+    Classes with ``sheddable`` set are refused straight away while the
+    database pool is exhausted, rather than queueing for a connection.
+    """
+
+    def __init__(self, name: str, priority: int, limit: int, queue_timeout: float, sheddable: bool = True):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.sheddable = sheddable
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0, "pool_saturated": 0}
+
+
+# First match wins: (class name or None to bypass admission, methods or None for all, path pattern)
+ROUTES: List[Tuple[Optional[str], Optional[Tuple[str, ...]], Pattern]] = [
+    # Health checks must answer under load; event streams would hold a slot for minutes
+    (None, None, re.compile(r"^/(health|docs|redoc|openapi\.json)")),
+    (None, ("GET",), re.compile(r"^/api/payments/[^/]+/events$")),
+    ("payments", ("POST",), re.compile(r"^/api/payments/(webhook|initialize|mobile-money)$")),
+    ("payments", ("GET",), re.compile(r"^/api/payments/verify/")),
+    # A gateway hop that misses its few-second window drops the caller's session
+    ("payments", ("POST",), re.compile(r"^/api/ussd/callback$")),
+    ("auth", None, re.compile(r"^/api/auth/")),
+    ("admin", ("GET",), re.compile(r"^/api/(users|payments)/?$")),
+    ("admin", ("GET",), re.compile(r"^/api/payments/stats$")),
+    ("admin", None, re.compile(r"^/api/(users/|analytics/|imports/|ussd/metrics|recurring/scheduler)")),
+]
+
+
+def _pool_saturated(engine) -> bool:
+    """Every connection the pool may open is checked out (QueuePool only)"""
+    pool = engine.pool
+    try:
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        return pool._max_overflow >= 0 and pool.checkedout() >= capacity
+    except AttributeError:
+        # SingletonThreadPool/NullPool and friends have no fixed capacity
+        return False
+
+
+class AdmissionController:
+    """Per-route-class concurrency limits with prioritised, deadline-bound queues.
+
+    A request runs when both its class and the process as a whole are under
+    their limits. Otherwise it waits in its class queue for at most the class
+    queue timeout; when the queue is full, the wait runs out or the DB pool is
+    exhausted it is refused with 503 and Retry-After, before any work is done.
+    """
+
+    def __init__(
+        self,
+        classes: List[RouteClass],
+        max_concurrency: int,
+        queue_size: int,
+        retry_after_seconds: int,
+        engine=None
+    ):
+        self.classes = {route_class.name: route_class for route_class in classes}
+        self._by_priority = sorted(classes, key=lambda route_class: route_class.priority)
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.retry_after_seconds = retry_after_seconds
+        self.engine = engine
+        self.in_flight = 0
+
+    def classify(self, method: str, path: str) -> Optional[RouteClass]:
+        for name, methods, pattern in ROUTES:
+            if (methods is None or method in methods) and pattern.match(path):
+                return self.classes[name] if name is not None else None
+        return self.classes["default"]
+
+    def _has_capacity(self, route_class: RouteClass) -> bool:
+        return route_class.in_flight < route_class.limit and self.in_flight < self.max_concurrency
+
+    def _start(self, route_class: RouteClass) -> None:
+        route_class.in_flight += 1
+        route_class.admitted += 1
+        self.in_flight += 1
+
+    def _reject(self, route_class: RouteClass, reason: str) -> str:
+        route_class.rejected[reason] += 1
+        return reason
+
+    async def acquire(self, route_class: RouteClass) -> Optional[str]:
+        """Wait for a slot; None once admitted, else the reason for refusing"""
+        if route_class.sheddable and self.engine is not None and _pool_saturated(self.engine):
+            return self._reject(route_class, "pool_saturated")
+        # Queued requests of the same class go first
+        if not route_class.waiters and self._has_capacity(route_class):
+            self._start(route_class)
+            return None
+        if len(route_class.waiters) >= self.queue_size:
+            return self._reject(route_class, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=route_class.queue_timeout)
+        except BaseException:
+            # Client went away while queued: give back a slot that was already handed over
+            if waiter.done():
+                self.release(route_class)
+            else:
+                route_class.waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        if waiter.done():
+            return None
+        route_class.waiters.remove(waiter)
+        waiter.cancel()
+        return self._reject(route_class, "timeout")
+
+    def release(self, route_class: RouteClass) -> None:
+        route_class.in_flight -= 1
+        self.in_flight -= 1
+        # Hand freed slots to waiters, most important class first
+        for candidate in self._by_priority:
+            while candidate.waiters and self._has_capacity(candidate):
+                waiter = candidate.waiters.popleft()
+                self._start(candidate)
+                waiter.set_result(None)
+            if self.in_flight >= self.max_concurrency:
+                break
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "pool_saturated": self.engine is not None and _pool_saturated(self.engine),
+            "classes": {
+                route_class.name: {
+                    "priority": route_class.priority,
+                    "limit": route_class.limit,
+                    "in_flight": route_class.in_flight,
+                    "queued": len(route_class.waiters),
+                    "admitted": route_class.admitted,
+                    "rejected": dict(route_class.rejected),
+                }
+                for route_class in self._by_priority
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to HTTP requests"""
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        refused = await self.controller.acquire(route_class)
+        if refused is not None:
+            logger.warning("Shed %s %s (%s: %s)", scope["method"], scope["path"], route_class.name, refused)
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(self.controller.retry_after_seconds)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
+
+
+def _build_controller() -> AdmissionController:
+    from database_simple import engine
+
+    limits = settings.ADMISSION_LIMITS
+    timeouts = settings.ADMISSION_QUEUE_TIMEOUTS
+    classes = [
+        # Paystack retries unacknowledged webhooks, but slow verification loses customers
+        RouteClass("payments", 0, limits["payments"], timeouts["payments"], sheddable=False),
+        RouteClass("auth", 1, limits["auth"], timeouts["auth"]),
+        RouteClass("default", 2, limits["default"], timeouts["default"]),
+        RouteClass("admin", 3, limits["admin"], timeouts["admin"]),
+    ]
+    return AdmissionController(
+        classes,
+        max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+        queue_size=settings.ADMISSION_QUEUE_SIZE,
+        retry_after_seconds=settings.ADMISSION_RETRY_AFTER_SECONDS,
+        engine=engine
+    )
+
+
+admission_controller = _build_controller()
@@ -0,0 +1,35 @@
+"""
+Two-tier cache shared by all workers
+
+An in-process LRU (L1) in front of a shared backend (L2: Redis, or an
+in-memory stand-in for a single worker and tests), with tag invalidation
+broadcast to every worker:
+
+    from core.cache import cache, cached
+
+    @cached("user:{user_id}", ttl=60, tags=["user:{user_id}"])
+    def load_user(user_id: int): ...
+
+    await cache.invalidate("user:42")
+"""
+from core.cache.backends import MemoryBackend, RedisBackend
+from core.cache.tiered import TieredCache, cached
+from core.config import settings
+
+
+def create_backend():
+    if settings.CACHE_BACKEND == "redis":
+        return RedisBackend(settings.REDIS_URL, f"{settings.CACHE_NAMESPACE}:invalidate")
+    return MemoryBackend()
+
+
+cache = TieredCache(
+    create_backend(),
+    namespace=settings.CACHE_NAMESPACE,
+    l1_max_entries=settings.CACHE_L1_MAX_ENTRIES,
+    l1_ttl=settings.CACHE_L1_TTL_SECONDS,
+    default_ttl=settings.CACHE_DEFAULT_TTL_SECONDS,
+    lock_seconds=settings.CACHE_LOCK_SECONDS
+)
+
+__all__ = ["cache", "cached", "create_backend", "MemoryBackend", "RedisBackend", "TieredCache"]
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Subscriber = Callable[[bytes], None]
+
+# MemoryBackend drops expired keys nobody reads again once per this many writes
+SWEEP_EVERY = 1000
+
+# Resubscribe delays after a pub/sub connection drops, doubling up to the maximum
+RECONNECT_BASE_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+
+class MemoryBackend:
+    """Shared-tier stand-in living in this process.
+
+    Behaves like RedisBackend (expiry, atomic counters, NX locks, pub/sub) so
+    a single worker, tests and benchmarks run without Redis. Several
+    TieredCache instances sharing one MemoryBackend behave like workers
+    sharing one Redis.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._subscribers: List[Subscriber] = []
+        self._writes = 0
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._values[key]
+            return None
+        return value
+
+    def _wrote(self, count: int = 1) -> None:
+        self._writes += count
+        if self._writes >= SWEEP_EVERY:
+            self._writes = 0
+            now = time.monotonic()
+            expired = [key for key, (_, expires_at) in self._values.items() if expires_at is not None and now >= expires_at]
+            for key in expired:
+                del self._values[key]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self._live(key) for key in keys]
+
+    async def set_many(self, items: Dict[str, bytes], ttl: float) -> None:
+        expires_at = time.monotonic() + ttl
+        for key, value in items.items():
+            self._values[key] = (value, expires_at)
+        self._wrote(len(items))
+
+    async def incr(self, keys: List[str], ttl: Optional[float] = None) -> List[int]:
+        """New values; ``ttl`` sets the expiry of keys this creates"""
+        counts = []
+        for key in keys:
+            value = self._live(key)
+            if value is not None:
+                expires_at = self._values[key][1]
+            else:
+                expires_at = time.monotonic() + ttl if ttl else None
+            count = int(value or 0) + 1
+            self._values[key] = (str(count).encode(), expires_at)
+            counts.append(count)
+        if ttl:
+            self._wrote(len(keys))
+        return counts
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Set only if absent; the building block for cross-worker locks"""
+        if self._live(key) is not None:
+            return False
+        self._values[key] = (value, time.monotonic() + ttl)
+        self._wrote()
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    async def subscribe(self, subscriber: Subscriber, on_reconnect: Optional[Callable[[], None]] = None) -> None:
+        # Never disconnects, so ``on_reconnect`` is never called
+        self._subscribers.append(subscriber)
+
+    async def publish(self, message: bytes) -> None:
+        for subscriber in tuple(self._subscribers):
+            subscriber(message)
+
+    async def close(self) -> None:
+        self._subscribers.clear()
+
+
+class ChannelListener:
+    """Passes a Redis pub/sub channel's messages to ``deliver`` until closed.
+
+    If the connection drops, the listener resubscribes with exponential
+    backoff instead of ending. Messages published while it was away are
+    lost, so ``on_reconnect`` runs after each resubscribe for the caller to
+    make up for them.
+    """
+
+    def __init__(
+        self,
+        client,
+        channel: str,
+        deliver: Callable[[bytes], None],
+        on_reconnect: Optional[Callable[[], None]] = None
+    ):
+        self._client = client
+        self._channel = channel
+        self._deliver = deliver
+        self._on_reconnect = on_reconnect
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+    async def _subscribe(self) -> None:
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self._channel)
+        except Exception:
+            await pubsub.close()
+            raise
+        self._pubsub = pubsub
+
+    async def start(self) -> None:
+        """Subscribe (raising if Redis cannot be reached), then listen in the background"""
+        await self._subscribe()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    self._deliver(message["data"])
+                error = "listener ended"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            delay = RECONNECT_BASE_SECONDS
+            while True:
+                logger.warning("Lost Redis channel %s (%s); resubscribing in %.1fs", self._channel, error, delay)
+                await asyncio.sleep(delay)
+                try:
+                    await self._pubsub.close()
+                except Exception:
+                    pass
+                try:
+                    await self._subscribe()
+                    break
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                    delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+            self.reconnects += 1
+            logger.info("Resubscribed to Redis channel %s", self._channel)
+            if self._on_reconnect is not None:
+                self._on_reconnect()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+
+
+class RedisBackend:
+    """Shared tier in Redis; invalidations fan out over a pub/sub channel"""
+
+    def __init__(self, url: str, channel: str):
+        # Imported lazily so redis stays optional for single-worker deployments
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._channel = channel
+        self._listener: Optional[ChannelListener] = None
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await self._client.mget(keys)
+
+    async def set_many(self, items: Dict[str, bytes], ttl: float) -> None:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, px=int(ttl * 1000))
+            await pipe.execute()
+
+    async def incr(self, keys: List[str], ttl: Optional[float] = None) -> List[int]:
+        """New values; ``ttl`` sets the expiry of keys this creates"""
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                if ttl:
+                    # Creates the key with its expiry only if absent; INCR keeps the expiry
+                    pipe.set(key, 0, nx=True, px=int(ttl * 1000))
+                pipe.incr(key)
+            results = await pipe.execute()
+        return results[1::2] if ttl else results
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(await self._client.set(key, value, nx=True, px=int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(key)
+
+    async def subscribe(self, subscriber: Subscriber, on_reconnect: Optional[Callable[[], None]] = None) -> None:
+        """Pass channel messages to ``subscriber``; ``on_reconnect`` runs after a dropped connection is restored"""
+        self._listener = ChannelListener(self._client, self._channel, subscriber, on_reconnect)
+        await self._listener.start()
+
+    async def publish(self, message: bytes) -> None:
+        await self._client.publish(self._channel, message)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        await self._client.close()
@@ -0,0 +1,404 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# How often a worker that lost the load lock checks whether the value has arrived
+LOCK_POLL_SECONDS = 0.05
+
+
+class _Entry:
+    __slots__ = ("value", "tags", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, tags: Tuple[str, ...], fresh_until: float, stale_until: float):
+        self.value = value
+        self.tags = tags
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+async def _call(loader: Callable, *args: Any) -> Any:
+    """Await async loaders; run sync ones (which usually touch the DB) in the threadpool"""
+    if inspect.iscoroutinefunction(loader):
+        return await loader(*args)
+    return await run_in_threadpool(loader, *args)
+
+
+class TieredCache:
+    """In-process LRU (L1) in front of a backend shared by all workers (L2).
+
+    Entries carry tags, and invalidating a tag drops every entry carrying it
+    in every worker. In L2 each tag has a version counter: entries are stored
+    with the versions they were loaded under and ignored once a tag moves
+    on, so a load that raced an invalidation can never be served. L1 entries
+    are dropped when the invalidation is broadcast, and live at most
+    ``l1_ttl`` in case a broadcast is missed.
+
+    Misses are loaded once: concurrent callers in a worker share one load,
+    and across workers a short lock in L2 lets one worker load while the
+    others wait for its result. Backend errors degrade to loading directly.
+    """
+
+    def __init__(
+        self,
+        backend,
+        namespace: str = "cache",
+        l1_max_entries: int = 4096,
+        l1_ttl: float = 5.0,
+        default_ttl: float = 60.0,
+        lock_seconds: float = 5.0
+    ):
+        self.backend = backend
+        self.namespace = namespace
+        self.l1_max_entries = l1_max_entries
+        self.l1_ttl = l1_ttl
+        self.default_ttl = default_ttl
+        self.lock_seconds = lock_seconds
+        self.origin = uuid.uuid4().hex
+        self.metrics = {"l1_hits": 0, "l2_hits": 0, "loads": 0, "lock_waits": 0, "invalidations": 0, "backend_errors": 0}
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tag_index: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: Set[asyncio.Task] = set()
+        # Bumped on every invalidation so in-flight loads started earlier are not kept in L1
+        self._generation = 0
+        self._subscribed = False
+
+    # Keys
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.namespace}:tag:{tag}"
+
+    # L1
+
+    def _store_local(self, key: str, value: Any, tags: Tuple[str, ...], ttl: float, stale_ttl: float) -> None:
+        now = time.monotonic()
+        fresh_until = now + min(ttl, self.l1_ttl)
+        self._drop_key(key)
+        self._entries[key] = _Entry(value, tags, fresh_until, fresh_until + stale_ttl)
+        for tag in tags:
+            self._tag_index.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.l1_max_entries:
+            self._drop_key(next(iter(self._entries)))
+
+    def _drop_key(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+    def _drop_tags(self, tags: Iterable[str]) -> None:
+        self._generation += 1
+        for tag in tags:
+            for key in tuple(self._tag_index.get(tag, ())):
+                self._drop_key(key)
+
+    # L2
+
+    async def _ensure_subscribed(self) -> None:
+        if not self._subscribed:
+            self._subscribed = True
+            try:
+                # Invalidations sent while the channel was down never arrive; start L1 afresh
+                await self.backend.subscribe(self._on_message, on_reconnect=self.clear_local)
+            except Exception as e:
+                self._subscribed = False
+                self._backend_error("subscribe", e)
+
+    def _on_message(self, message: bytes) -> None:
+        try:
+            data = json.loads(message)
+        except (ValueError, TypeError):
+            logger.warning("Dropping malformed cache invalidation: %r", message)
+            return
+        if data.get("origin") != self.origin:
+            self._drop_tags(data.get("tags", ()))
+
+    def _backend_error(self, operation: str, error: Exception) -> None:
+        self.metrics["backend_errors"] += 1
+        logger.warning("Cache backend %s failed: %s", operation, error)
+
+    async def _read(self, keys: List[str], tags_by_key: Dict[str, Tuple[str, ...]]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Valid L2 values for keys, and the current version of every tag involved"""
+        tags = sorted({tag for key in keys for tag in tags_by_key[key]})
+        try:
+            raw = await self.backend.get_many([self._key(key) for key in keys] + [self._tag_key(tag) for tag in tags])
+        except Exception as e:
+            self._backend_error("read", e)
+            return {}, {}
+        versions = {tag: int(value or 0) for tag, value in zip(tags, raw[len(keys):])}
+        found = {}
+        for key, value in zip(keys, raw[:len(keys)]):
+            if value is None:
+                continue
+            try:
+                stored, stored_versions = pickle.loads(value)
+            except Exception:
+                continue
+            if all(stored_versions.get(tag) == versions[tag] for tag in tags_by_key[key]):
+                found[key] = stored
+        return found, versions
+
+    async def _write(self, values: Dict[str, Any], tags_by_key: Dict[str, Tuple[str, ...]], versions: Dict[str, int], ttl: float) -> None:
+        items = {
+            self._key(key): pickle.dumps(
+                (value, {tag: versions.get(tag, 0) for tag in tags_by_key[key]}), pickle.HIGHEST_PROTOCOL
+            )
+            for key, value in values.items()
+        }
+        try:
+            await self.backend.set_many(items, ttl)
+        except Exception as e:
+            self._backend_error("write", e)
+
+    # Reads
+
+    async def get(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: Optional[float] = None,
+        tags: Sequence[str] = (),
+        stale_ttl: float = 0.0,
+        none_ttl: Optional[float] = None
+    ) -> Any:
+        """Cached value of ``key``, calling ``loader`` (sync or async) on a miss.
+
+        With ``stale_ttl``, an expired L1 entry is still served for that long
+        while one background load refreshes it. ``none_ttl`` is the TTL of a
+        None result (0: not cached), so a lookup of something about to be
+        created is not answered with a stale miss.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            now = time.monotonic()
+            if now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                self.metrics["l1_hits"] += 1
+                return entry.value
+            if now < entry.stale_until:
+                self.metrics["l1_hits"] += 1
+                if key not in self._inflight:
+                    task = asyncio.create_task(self._load(key, loader, ttl, tuple(tags), stale_ttl, none_ttl))
+                    self._refreshing.add(task)
+                    task.add_done_callback(self._refresh_done)
+                return entry.value
+        return await self._load(key, loader, ttl, tuple(tags), stale_ttl, none_ttl)
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._refreshing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background cache refresh failed: %s", task.exception())
+
+    async def _load(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: Optional[float],
+        tags: Tuple[str, ...],
+        stale_ttl: float,
+        none_ttl: Optional[float] = None
+    ) -> Any:
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._fetch(key, loader, ttl if ttl is not None else self.default_ttl, tags, stale_ttl, none_ttl)
+        except Exception as exc:
+            future.set_exception(exc)
+            # Waiters get the exception; mark it retrieved so the loop does not warn
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    async def _fetch(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: float,
+        tags: Tuple[str, ...],
+        stale_ttl: float,
+        none_ttl: Optional[float] = None
+    ) -> Any:
+        await self._ensure_subscribed()
+        generation = self._generation
+        tags_by_key = {key: tags}
+        found, versions = await self._read([key], tags_by_key)
+        if key in found:
+            self.metrics["l2_hits"] += 1
+            value = found[key]
+        else:
+            lock_key = self._key(f"lock:{key}")
+            try:
+                locked = await self.backend.add(lock_key, self.origin.encode(), self.lock_seconds)
+            except Exception as e:
+                self._backend_error("lock", e)
+                locked = None
+            if locked is False:
+                # Another worker is loading this key: wait for its result rather than repeat the work
+                self.metrics["lock_waits"] += 1
+                deadline = time.monotonic() + self.lock_seconds
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(LOCK_POLL_SECONDS)
+                    found, versions = await self._read([key], tags_by_key)
+                    if key in found:
+                        break
+            if key in found:
+                self.metrics["l2_hits"] += 1
+                value = found[key]
+            else:
+                self.metrics["loads"] += 1
+                try:
+                    value = await _call(loader)
+                    if value is None and none_ttl is not None:
+                        ttl = none_ttl
+                    if ttl > 0:
+                        await self._write({key: value}, tags_by_key, versions, ttl)
+                finally:
+                    if locked:
+                        try:
+                            await self.backend.delete(lock_key)
+                        except Exception as e:
+                            self._backend_error("unlock", e)
+        if generation == self._generation and ttl > 0:
+            self._store_local(key, value, tags, ttl, stale_ttl)
+        return value
+
+    async def get_many(
+        self,
+        keys: Sequence[str],
+        loader: Callable[[List[str]], Dict[str, Any]],
+        ttl: Optional[float] = None,
+        tags: Callable[[str], Sequence[str]] = lambda key: ()
+    ) -> Dict[str, Any]:
+        """Batched get: L1 hits are served, then L2 in one round trip, then one loader call for the rest.
+
+        ``loader`` receives the missing keys and returns a value for each;
+        ``tags`` gives the tags of a key.
+        """
+        ttl = ttl if ttl is not None else self.default_ttl
+        now = time.monotonic()
+        values: Dict[str, Any] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                values[key] = entry.value
+            else:
+                missing.append(key)
+        self.metrics["l1_hits"] += len(values)
+        if not missing:
+            return values
+
+        await self._ensure_subscribed()
+        generation = self._generation
+        tags_by_key = {key: tuple(tags(key)) for key in missing}
+        found, versions = await self._read(missing, tags_by_key)
+        self.metrics["l2_hits"] += len(found)
+        values.update(found)
+
+        to_load = [key for key in missing if key not in found]
+        if to_load:
+            self.metrics["loads"] += 1
+            loaded = await _call(loader, to_load)
+            loaded = {key: loaded.get(key) for key in to_load}
+            values.update(loaded)
+            await self._write(loaded, tags_by_key, versions, ttl)
+
+        if generation == self._generation:
+            for key in missing:
+                self._store_local(key, values[key], tags_by_key[key], ttl, 0.0)
+        return values
+
+    # Invalidation
+
+    async def invalidate(self, *tags: str) -> None:
+        """Drop every entry carrying any of ``tags``, in this and every other worker"""
+        if not tags:
+            return
+        self.metrics["invalidations"] += 1
+        self._drop_tags(tags)
+        await self._ensure_subscribed()
+        try:
+            await self.backend.incr([self._tag_key(tag) for tag in tags])
+            await self.backend.publish(json.dumps({"origin": self.origin, "tags": list(tags)}).encode())
+        except Exception as e:
+            self._backend_error("invalidate", e)
+
+    def clear_local(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self._tag_index.clear()
+
+    async def close(self) -> None:
+        for task in tuple(self._refreshing):
+            task.cancel()
+        if self._subscribed:
+            await self.backend.close()
+            self._subscribed = False
+
+
+def cached(
+    key: str,
+    ttl: Optional[float] = None,
+    tags: Sequence[str] = (),
+    stale_ttl: float = 0.0,
+    none_ttl: Optional[float] = None,
+    cache: Optional[TieredCache] = None
+):
+    """Cache a function's result under ``key``, formatted with its arguments.
+
+        @cached("user:{user_id}", ttl=60, tags=["user:{user_id}"])
+        def load_user(user_id: int): ...
+
+    The decorated function is always async; sync functions run in the
+    threadpool on a miss. Tags are formatted the same way as the key.
+    """
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            target = cache
+            if target is None:
+                from core.cache import cache as target
+            return await target.get(
+                key.format(**arguments),
+                functools.partial(func, *args, **kwargs),
+                ttl=ttl,
+                tags=[tag.format(**arguments) for tag in tags],
+                stale_ttl=stale_ttl,
+                none_ttl=none_ttl
+            )
+
+        wrapper.uncached = func
+        return wrapper
+    return decorate
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -7,6 +7,7 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    ADMIN_EMAILS: List[str] = ["admin@agapay.com"]  # users allowed on admin-only endpoints
 
     # Paystack settings
     PAYSTACK_SECRET_KEY: str = "sk_test_your-paystack-secret-key"
@@ -15,6 +16,161 @@ class Settings(BaseSettings):
     # Redis settings
     REDIS_URL: str = "redis://localhost:6379"
 
+    # Archival settings
+    ARCHIVE_DIR: str = "./archive"
+    ARCHIVE_AFTER_DAYS: int = 180
+    ARCHIVE_BATCH_SIZE: int = 500
+    # Failed and cancelled payments can still be reported paid, so they wait this long after their last change
+    ARCHIVE_SETTLEMENT_DAYS: int = 30
+
+    # Shared cache settings
+    CACHE_BACKEND: str = "memory"  # "memory" (single worker) or "redis"
+    CACHE_NAMESPACE: str = "agapay"
+    CACHE_DEFAULT_TTL_SECONDS: float = 60.0
+    CACHE_L1_TTL_SECONDS: float = 5.0  # bounds staleness if a worker misses an invalidation
+    CACHE_L1_MAX_ENTRIES: int = 4096
+    CACHE_LOCK_SECONDS: float = 5.0  # how long other workers wait on one worker's load
+
+    # Collection cache settings
+    COLLECTION_CACHE_TTL_SECONDS: float = 60.0
+    COLLECTION_CACHE_STALE_SECONDS: float = 60.0
+    PAYMENT_STATS_CACHE_TTL_SECONDS: float = 30.0
+
+    # Payment event stream settings
+    PAYMENT_EVENTS_BACKEND: str = "local"  # "local" or "redis"
+    PAYMENT_EVENTS_CHANNEL: str = "agapay:payment-events"
+    PAYMENT_EVENTS_KEEPALIVE_SECONDS: float = 15.0
+    PAYMENT_EVENTS_MAX_STREAM_SECONDS: float = 600.0
+
+    # Query settings
+    SLOW_QUERY_MS: float = 100.0
+
+    # Ledger settings
+    LEDGER_SNAPSHOT_EVERY: int = 100  # compact once a collection's tail reaches this many entries
+    LEDGER_COMPACT_ENABLED: bool = True
+    LEDGER_COMPACT_INTERVAL_SECONDS: float = 300.0
+
+    # Idempotency settings
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_LOCK_SECONDS: float = 30.0  # in-flight claims older than this are considered abandoned
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0  # how long a duplicate waits on another worker's request
+
+    # Expiry sweeper settings
+    SWEEPER_ENABLED: bool = True
+    SWEEPER_INTERVAL_SECONDS: float = 60.0
+    SWEEPER_BATCH_SIZE: int = 500
+    PAYMENT_PENDING_TIMEOUT_MINUTES: int = 60
+
+    # Merchant notification settings
+    NOTIFICATIONS_ENABLED: bool = True
+    NOTIFICATION_POLL_SECONDS: float = 5.0
+    NOTIFICATION_CLAIM_SIZE: int = 500  # outbox rows claimed per dispatcher pass
+    NOTIFICATION_BATCH_SIZE: int = 50  # events per callback request
+    NOTIFICATION_WORKERS: int = 20  # concurrent callback requests per process
+    NOTIFICATION_PER_DESTINATION: int = 2  # concurrent callback requests per merchant URL
+    NOTIFICATION_TIMEOUT_SECONDS: float = 10.0
+    NOTIFICATION_LOCK_SECONDS: float = 60.0  # claimed rows reappear after this if a worker dies
+    NOTIFICATION_MAX_ATTEMPTS: int = 10
+    NOTIFICATION_RETRY_BASE_SECONDS: float = 10.0
+    NOTIFICATION_RETRY_MAX_SECONDS: float = 3600.0
+    # Callback hosts exempt from the public-address check, e.g. ["localhost"] for notification_sink.py
+    NOTIFICATION_ALLOWED_HOSTS: List[str] = []
+
+    # Bulk import settings
+    IMPORT_CHUNK_SIZE: int = 1000
+    IMPORT_HASH_WORKERS: int = 0  # processes hashing passwords; 0 = one per CPU
+    IMPORT_MAX_ERRORS: int = 1000  # row errors listed in an import report
+
+    # Trending collections settings
+    TRENDING_ENABLED: bool = True
+    TRENDING_HALF_LIFE_HOURS: float = 24.0
+    TRENDING_TOP_K: int = 200
+    TRENDING_POLL_SECONDS: float = 5.0  # how often new payment credits are picked up
+    TRENDING_PERSIST_SECONDS: float = 300.0
+
+    # Admission control settings
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENCY: int = 64  # requests handled at once per process, across classes
+    ADMISSION_LIMITS: Dict[str, int] = {"payments": 32, "auth": 8, "default": 32, "admin": 4}
+    ADMISSION_QUEUE_TIMEOUTS: Dict[str, float] = {"payments": 10.0, "auth": 3.0, "default": 5.0, "admin": 2.0}
+    ADMISSION_QUEUE_SIZE: int = 100  # waiting requests per class before shedding
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+
+    # Tracing settings
+    TRACING_ENABLED: bool = True
+    TRACING_SAMPLE_RATE: float = 0.01  # share of fast, successful requests kept
+    TRACING_SLOW_MS: float = 500.0  # requests this slow are always kept
+    TRACING_MAX_SPANS: int = 512  # spans exported per trace
+    TRACING_EXPORT_FILE: str = "./traces.jsonl"
+    TRACING_OTLP_ENDPOINT: Optional[str] = None  # e.g. http://localhost:4318/v1/traces, instead of the file
+    TRACING_QUEUE_SIZE: int = 1000  # kept traces waiting for export
+    TRACING_EXPORT_INTERVAL_SECONDS: float = 5.0
+
+    # Profiler settings
+    PROFILER_ENABLED: bool = True
+    PROFILER_SLOW_MS: float = 1000.0  # requests running this long start being sampled
+    PROFILER_INTERVAL_MS: float = 5.0
+    PROFILER_BUFFER_SIZE: int = 50  # profiles kept per process
+    PROFILER_MAX_SAMPLES: int = 20000  # per profile
+
+    # USSD settings
+    USSD_ENABLED: bool = True
+    USSD_SESSION_TTL_SECONDS: float = 180.0  # gateways end idle sessions well before this
+    USSD_HOP_BUDGET_MS: float = 100.0  # hops slower than this are logged
+    USSD_MENU_COLLECTIONS: int = 20  # trending first, then the public listing
+    USSD_MENU_PAGE_SIZE: int = 5  # at most 7: 8, 9 and 0 are navigation
+    USSD_MENU_TTL_SECONDS: float = 30.0
+    USSD_PRESET_AMOUNTS: List[int] = [5, 10, 20, 50]
+    USSD_MIN_AMOUNT: float = 1.0
+    USSD_MAX_AMOUNT: float = 5000.0
+    USSD_CHARGE_WORKERS: int = 32  # concurrent Paystack charges per process
+    USSD_CHARGE_QUEUE_SIZE: int = 1000  # confirmed charges waiting; further confirms are turned away
+    # Only the gateway may call back: hops must carry the token (?token= on the callback URL) and come
+    # from an allowed address or CIDR, for whichever of the two is set. With neither set, hops are refused.
+    # Allowed addresses are not counted against the "ip" velocity limit, as they are the gateway's own.
+    USSD_GATEWAY_TOKEN: str = ""
+    USSD_GATEWAY_IPS: List[str] = []
+
+    # QR code settings
+    PAYMENT_LINK_BASE_URL: str = "http://localhost:3003/payment"  # QR codes encode <this>?collection=<id>
+    QR_CACHE_DIR: str = "./qr_cache"
+    QR_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # rendered files kept on disk, least recently used dropped first
+    QR_SIZES: List[int] = [128, 256, 512, 1024]  # pixel sizes offered, so the cache stays bounded
+    QR_DEFAULT_SIZE: int = 256
+    QR_PRERENDER_SIZES: List[int] = [256]  # rendered as PNG and SVG when a collection is created or updated
+    QR_RENDER_WORKERS: int = 0  # processes rendering QR codes; 0 = one per CPU
+    QR_MAX_AGE_SECONDS: int = 86400
+
+    # Recurring contribution settings
+    RECURRING_ENABLED: bool = True
+    RECURRING_POLL_SECONDS: float = 60.0
+    RECURRING_BATCH_SIZE: int = 500  # schedules claimed, charged and recorded together
+    RECURRING_CONCURRENCY: int = 20  # Paystack charges in flight at once
+    RECURRING_RATE_PER_SECOND: float = 50.0  # charges started per second
+    RECURRING_MAX_CHARGES_PER_RUN: int = 100000  # the rest wait for the next run
+    RECURRING_LOCK_SECONDS: float = 600.0  # claimed schedules reappear after this if a run dies
+    RECURRING_RETRY_HOURS: float = 24.0  # after a failed charge
+    RECURRING_MAX_FAILURES: int = 3  # consecutive failures before a schedule is paused
+
+    # Mobile money routing settings
+    # Reject a charge whose network disagrees with the number's prefix; turn
+    # off to trust the client's choice for numbers ported between networks
+    MOBILE_MONEY_ENFORCE_PREFIX: bool = True
+
+    # Velocity check settings (payment creation per email, phone and client IP)
+    VELOCITY_ENABLED: bool = True
+    # Attempts allowed per window, by key: {key: {window seconds: limit}}
+    VELOCITY_LIMITS: Dict[str, Dict[int, int]] = {
+        "email": {60: 5, 3600: 30},
+        "phone": {60: 5, 3600: 30},
+        "ip": {60: 30, 3600: 300},
+    }
+    VELOCITY_BUCKETS: int = 10  # sub-buckets per window; more is smoother and costs memory
+    VELOCITY_MAX_KEYS: int = 50000  # idle keys beyond this are evicted, least recently seen first
+    VELOCITY_SHARED: bool = False  # count in the cache backend (CACHE_BACKEND) so workers share limits
+    VELOCITY_TRUST_FORWARDED_FOR: bool = False  # take the client IP from X-Forwarded-For behind a proxy
+
     # Server settings
     HOST: str = "0.0.0.0"
     PORT: int = 8000
@@ -0,0 +1,87 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+from fastapi import Request, Response, status
+
+
+def _as_utc(value: Union[datetime, str, None]) -> Optional[datetime]:
+    """Normalise DB timestamps (naive on SQLite, aware on Postgres) to aware UTC"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha1(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+
+
+def resource_validators(kind: str, resource_id: Any, updated_at: Any, created_at: Any = None) -> Validators:
+    """Strong validator for a single row, keyed on its id and last change"""
+    modified = _as_utc(updated_at) or _as_utc(created_at)
+    stamp = modified.isoformat() if modified else ""
+    return Validators(f'"{_digest(kind, resource_id, stamp)}"', modified)
+
+
+def list_validators(kind: str, count: int, max_modified: Any, *params: Any) -> Validators:
+    """Weak validator for a listing, from count and max(updated_at) of the filtered set.
+
+    Any insert, update or delete changes one of the two, so the body only needs
+    to be rebuilt when the validator changes. ``params`` (skip, limit, filters)
+    keep different pages of the same listing apart.
+    """
+    modified = _as_utc(max_modified)
+    stamp = modified.isoformat() if modified else ""
+    return Validators(f'W/"{_digest(kind, count, stamp, *params)}"', modified)
+
+
+def _strip_weak(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(request: Request, validators: Validators) -> bool:
+    """Evaluate If-None-Match (weak comparison), falling back to If-Modified-Since"""
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        current = _strip_weak(validators.etag)
+        return any(_strip_weak(tag) == current for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and validators.last_modified is not None:
+        try:
+            since = _as_utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates only carry whole seconds
+        return validators.last_modified.replace(microsecond=0) <= since
+
+    return False
+
+
+def conditional_response(request: Request, response: Response, validators: Validators) -> Optional[Response]:
+    """Return a 304 to send instead of the body, or attach validators to ``response``"""
+
+    if is_not_modified(request, validators):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators.headers())
+    response.headers.update(validators.headers())
+    return None
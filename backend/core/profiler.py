@@ -0,0 +1,278 @@
+import asyncio
+import itertools
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+MAX_DEPTH = 128
+# Check for requests turning slow at this period while nothing is being sampled
+IDLE_POLL_SECONDS = 0.05
+
+Frame = Tuple[str, str, int]  # function, file, first line
+Stack = Tuple[Frame, ...]  # outermost call first
+
+SUSPENDED: Frame = ("(awaiting)", "", 0)
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+def _coroutine_frames(coro) -> List[Any]:
+    """Frames of a suspended coroutine chain, outermost first"""
+    frames = []
+    while coro is not None and len(frames) < MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+
+class ActiveRequest:
+    __slots__ = ("id", "method", "path", "task", "loop", "thread_id", "started", "reason", "samples", "last_sample")
+
+    def __init__(self, request_id: int, method: str, path: str, task: asyncio.Task, reason: Optional[str]):
+        self.id = request_id
+        self.method = method
+        self.path = path
+        self.task = task
+        self.loop = task.get_loop()
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.reason = reason  # why it is sampled; None until it is
+        self.samples: List[Tuple[Stack, float]] = []
+        self.last_sample = self.started
+
+
+class Profile:
+    """A finished request's stack samples, convertible to speedscope or collapsed stacks"""
+
+    def __init__(self, request: ActiveRequest, status_code: int, duration_ms: float, route: Optional[str]):
+        self.id = request.id
+        self.method = request.method
+        self.path = request.path
+        self.route = route
+        self.reason = request.reason
+        self.status_code = status_code
+        self.duration_ms = duration_ms
+        self.captured_at = datetime.utcnow()
+        self.samples = request.samples
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "reason": self.reason,
+            "status_code": self.status_code,
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": len(self.samples),
+            "captured_at": self.captured_at,
+        }
+
+    def speedscope(self) -> Dict[str, Any]:
+        """https://www.speedscope.app/file-format-schema.json, one sampled profile"""
+        frames: Dict[Frame, int] = {}
+        samples = []
+        for stack, _ in self.samples:
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+        weights = [round(weight, 3) for _, weight in self.samples]
+        name = f"{self.method} {self.route or self.path} ({self.duration_ms:.0f}ms)"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "agapay-profiler",
+            "shared": {"frames": [
+                {"name": function, "file": filename, "line": line} for function, filename, line in frames
+            ]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded stacks ("a;b;c <ms>"), for flamegraph.pl and similar tools"""
+        totals: Counter = Counter()
+        for stack, weight in self.samples:
+            totals[";".join(function for function, _, _ in stack)] += weight
+        return "".join(f"{stack} {max(1, round(weight))}\n" for stack, weight in totals.most_common())
+
+
+class RequestProfiler:
+    """Wall-clock stack sampler for individual requests.
+
+    Requests are sampled when asked for (an admin's ``X-Profile`` header, or a
+    path prefix switched on at runtime) or once they have run for ``slow_ms``.
+    A single background thread does the sampling: while the request's task is
+    running it records the event loop thread's stack, and while it is
+    suspended the chain of coroutines it is awaiting in. Until some request
+    qualifies, the per-request cost is registering it in a dict.
+    """
+
+    def __init__(self, slow_ms: float, interval_ms: float, buffer_size: int, max_samples: int):
+        self.enabled = True
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000
+        self.max_samples = max_samples
+        self.routes: Set[str] = set()  # path prefixes profiled from the start
+        self.profiles: Deque[Profile] = deque(maxlen=buffer_size)
+        self._active: Dict[int, ActiveRequest] = {}
+        self._ids = itertools.count(1)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def begin(self, method: str, path: str, requested: bool) -> Optional[ActiveRequest]:
+        if not self.enabled:
+            return None
+        reason = "requested" if requested else "route" if any(path.startswith(prefix) for prefix in self.routes) else None
+        request = ActiveRequest(next(self._ids), method, path, asyncio.current_task(), reason)
+        self._active[request.id] = request
+        return request
+
+    def end(self, request: ActiveRequest, status_code: int, route: Optional[str]) -> Optional[Profile]:
+        self._active.pop(request.id, None)
+        if request.reason is None:
+            return None
+        profile = Profile(request, status_code, (time.perf_counter() - request.started) * 1000, route)
+        self.profiles.append(profile)
+        if request.reason == "slow":
+            logger.info("Profiled slow request %s %s (%.0fms), profile %d", request.method, request.path, profile.duration_ms, profile.id)
+        return profile
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _stack(self, request: ActiveRequest, thread_frames: Dict[int, Any]) -> Stack:
+        coroutine_frames = _coroutine_frames(request.task.get_coro())
+        if asyncio.current_task(request.loop) is request.task and request.thread_id in thread_frames:
+            # Running: the thread's real stack, from the task's outermost coroutine down
+            frames = []
+            frame = thread_frames[request.thread_id]
+            while frame is not None and len(frames) < MAX_DEPTH:
+                frames.append(frame)
+                if coroutine_frames and frame is coroutine_frames[0]:
+                    break
+                frame = frame.f_back
+            return tuple(_frame_key(frame) for frame in reversed(frames))
+        return tuple(_frame_key(frame) for frame in coroutine_frames) + (SUSPENDED,)
+
+    def _sample(self) -> bool:
+        """Take one sample of every request that qualifies; whether any did"""
+        now = time.perf_counter()
+        due = []
+        for request in list(self._active.values()):
+            if request.reason is None and (now - request.started) * 1000 >= self.slow_ms:
+                request.reason = "slow"
+                request.last_sample = now
+            if request.reason is not None and len(request.samples) < self.max_samples:
+                due.append(request)
+        if not due:
+            return False
+        thread_frames = sys._current_frames()
+        for request in due:
+            try:
+                stack = self._stack(request, thread_frames)
+            except Exception:
+                # The task moved on mid-walk; skip this tick
+                continue
+            request.samples.append((stack, (now - request.last_sample) * 1000 or self.interval * 1000))
+            request.last_sample = now
+        return True
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            busy = bool(self.enabled and self._active) and self._sample()
+            self._stopping.wait(self.interval if busy else IDLE_POLL_SECONDS)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+
+def _is_admin_request(scope: Scope) -> bool:
+    from routers.auth import is_admin_email, verify_token
+
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return scheme.lower() == "bearer" and is_admin_email(verify_token(token))
+    return False
+
+
+class ProfilerMiddleware:
+    """ASGI middleware registering requests with a RequestProfiler.
+
+    ``X-Profile: 1`` from an admin profiles the whole request; its profile id
+    is returned in ``X-Profile-Id``.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        requested = any(name == PROFILE_HEADER and value == b"1" for name, value in scope["headers"])
+        request = self.profiler.begin(scope["method"], scope["path"], requested and _is_admin_request(scope))
+        if request is None:
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_with_profile_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if request.reason == "requested":
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(request.id).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            route = scope.get("route")
+            self.profiler.end(request, status_code, getattr(route, "path", None))
+
+
+request_profiler = RequestProfiler(
+    slow_ms=settings.PROFILER_SLOW_MS,
+    interval_ms=settings.PROFILER_INTERVAL_MS,
+    buffer_size=settings.PROFILER_BUFFER_SIZE,
+    max_samples=settings.PROFILER_MAX_SAMPLES
+)
+request_profiler.enabled = settings.PROFILER_ENABLED
@@ -0,0 +1,441 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+SERVICE_NAME = "agapay-api"
+MAX_STATEMENT_LENGTH = 2000
+
+
+class Span:
+    __slots__ = (
+        "trace", "span_id", "parent_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "events", "status", "status_message"
+    )
+
+    def __init__(self, trace: "Trace", name: str, kind: int, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.events: List[Dict[str, Any]] = []
+        self.status = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+        self.events.append({
+            "name": "exception",
+            "time_ns": time.time_ns(),
+            "attributes": {"exception.type": type(error).__name__, "exception.message": str(error)[:500]},
+        })
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans of one request, kept or dropped together once the request ends"""
+
+    __slots__ = ("trace_id", "spans", "dropped", "max_spans", "sampled", "has_error")
+
+    def __init__(self, trace_id: Optional[str], max_spans: int, sampled: bool = False):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.max_spans = max_spans
+        self.sampled = sampled
+        self.has_error = False
+
+    def start_span(self, name: str, kind: int, parent: Optional[Span], attributes: Dict[str, Any]) -> Span:
+        span = Span(self, name, kind, parent.span_id if parent else None, attributes)
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            # Still timed and parented, just not exported: a loop of queries must not blow up memory
+            self.dropped += 1
+        return span
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _start_child(name: str, kind: int, attributes: Dict[str, Any]) -> Optional[Span]:
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return parent.trace.start_span(name, kind, parent, attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time a block as a child of the current span; a no-op outside a traced request"""
+    child = _start_child(name, kind, attributes)
+    if child is None:
+        yield None
+        return
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_exception(e)
+        raise
+    finally:
+        child.end()
+        _current_span.reset(token)
+
+
+# SQL statements and commits
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    child = _start_child("db.query", KIND_CLIENT, {
+        "db.system": conn.dialect.name,
+        "db.operation": statement.lstrip().split(" ", 1)[0].upper(),
+        "db.statement": statement[:MAX_STATEMENT_LENGTH],
+    })
+    if child is not None:
+        child.name = f"db.{child.attributes['db.operation'].lower()}"
+        if executemany:
+            child.attributes["db.executemany"] = True
+        conn.info.setdefault("trace_spans", []).append(child)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        child = spans.pop()
+        if cursor is not None and cursor.rowcount is not None and cursor.rowcount >= 0:
+            child.attributes["db.rowcount"] = cursor.rowcount
+        child.end()
+
+
+def _handle_error(exception_context):
+    spans = exception_context.connection.info.get("trace_spans") if exception_context.connection else None
+    if spans:
+        child = spans.pop()
+        child.record_exception(exception_context.original_exception)
+        child.end()
+
+
+def _before_commit(session):
+    child = _start_child("db.commit", KIND_INTERNAL, {})
+    if child is not None:
+        # The flush's INSERT/UPDATEs nest under the commit
+        session.info["trace_commit"] = (child, _current_span.set(child))
+
+
+def _end_commit(session, error: Optional[str] = None):
+    pending = session.info.pop("trace_commit", None)
+    if pending is None:
+        return
+    child, token = pending
+    if error:
+        child.status = STATUS_ERROR
+        child.status_message = error
+    child.end()
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Ended from a different context than it started in
+        pass
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record a span per SQL statement and per session commit in traced requests"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    event.listen(Session, "before_commit", _before_commit)
+    event.listen(Session, "after_commit", _end_commit)
+    event.listen(Session, "after_soft_rollback", lambda session, previous: _end_commit(session, "rolled back"))
+
+
+# Outbound HTTP
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """httpx transport recording a client span per outbound request"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with span(
+            f"HTTP {request.method}",
+            KIND_CLIENT,
+            **{"http.method": request.method, "server.address": request.url.host, "url.path": request.url.path}
+        ) as child:
+            response = await self._transport.handle_async_request(request)
+            if child is not None:
+                child.set_attribute("http.status_code", response.status_code)
+                if response.status_code >= 500:
+                    child.status = STATUS_ERROR
+            return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# Export
+
+def _attributes(values: Dict[str, Any]) -> List[Dict[str, Any]]:
+    result = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": str(value)}
+        result.append({"key": key, "value": encoded})
+    return result
+
+
+def _otlp_span(item: Span) -> Dict[str, Any]:
+    encoded = {
+        "traceId": item.trace.trace_id,
+        "spanId": item.span_id,
+        "name": item.name,
+        "kind": item.kind,
+        "startTimeUnixNano": str(item.start_ns),
+        "endTimeUnixNano": str(item.end_ns or item.start_ns),
+        "attributes": _attributes(item.attributes),
+        "status": {"code": item.status, "message": item.status_message} if item.status == STATUS_ERROR else {"code": item.status},
+    }
+    if item.parent_id:
+        encoded["parentSpanId"] = item.parent_id
+    if item.events:
+        encoded["events"] = [
+            {"name": e["name"], "timeUnixNano": str(e["time_ns"]), "attributes": _attributes(e["attributes"])}
+            for e in item.events
+        ]
+    return encoded
+
+
+def otlp_payload(traces: List[Trace]) -> Dict[str, Any]:
+    """An OTLP/JSON ExportTraceServiceRequest for the given traces"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+            "scopeSpans": [{
+                "scope": {"name": "agapay.tracing"},
+                "spans": [_otlp_span(item) for trace in traces for item in trace.spans],
+            }],
+        }]
+    }
+
+
+class SpanExporter:
+    """Buffers kept traces and ships them in batches as OTLP/JSON.
+
+    Batches go to an OTLP/HTTP collector when ``endpoint`` is set, otherwise
+    they are appended to ``path``, one export request per line. When the
+    buffer is full new traces are dropped (and counted) rather than blocking
+    requests.
+    """
+
+    def __init__(self, path: str, endpoint: Optional[str], queue_size: int, interval_seconds: float):
+        self.path = path
+        self.endpoint = endpoint
+        self.interval_seconds = interval_seconds
+        self._queue: Deque[Trace] = deque()
+        self.queue_size = queue_size
+        self.metrics = {"exported_traces": 0, "dropped_traces": 0, "export_errors": 0}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, trace: Trace) -> None:
+        if len(self._queue) >= self.queue_size:
+            self.metrics["dropped_traces"] += 1
+            return
+        self._queue.append(trace)
+
+    def _write(self, line: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    async def flush(self) -> None:
+        while self._queue:
+            traces = [self._queue.popleft() for _ in range(min(len(self._queue), 100))]
+            payload = otlp_payload(traces)
+            try:
+                if self.endpoint:
+                    response = await self._client.post(self.endpoint, json=payload)
+                    response.raise_for_status()
+                else:
+                    await run_in_threadpool(self._write, json.dumps(payload, separators=(",", ":")))
+                self.metrics["exported_traces"] += len(traces)
+            except (httpx.HTTPError, OSError) as e:
+                self.metrics["export_errors"] += 1
+                logger.warning("Trace export of %d traces failed: %s", len(traces), e)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            if self.endpoint:
+                self._client = httpx.AsyncClient(timeout=10.0)
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+span_exporter = SpanExporter(
+    path=settings.TRACING_EXPORT_FILE,
+    endpoint=settings.TRACING_OTLP_ENDPOINT,
+    queue_size=settings.TRACING_QUEUE_SIZE,
+    interval_seconds=settings.TRACING_EXPORT_INTERVAL_SECONDS
+)
+
+
+# Requests
+
+def _parse_traceparent(value: str):
+    """W3C traceparent: version-traceid-parentid-flags; None if malformed"""
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per HTTP request.
+
+    Sampling is decided when the request ends (tail-based): errored requests
+    and those slower than ``slow_ms`` are always kept, as are requests whose
+    caller sent a sampled ``traceparent``; the rest are kept at
+    ``sample_rate``. The trace id is returned in ``X-Trace-Id``.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        exporter: SpanExporter,
+        sample_rate: float,
+        slow_ms: float,
+        max_spans: int
+    ):
+        self.app = app
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_spans = max_spans
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent_id = None
+        trace = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parsed = _parse_traceparent(value.decode("latin-1"))
+                if parsed:
+                    trace_id, parent_id, sampled = parsed
+                    trace = Trace(trace_id, self.max_spans, sampled)
+                break
+        if trace is None:
+            trace = Trace(None, self.max_spans)
+
+        root = trace.start_span(f"{scope['method']} {scope['path']}", KIND_SERVER, None, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        root.parent_id = parent_id
+        token = _current_span.set(root)
+        status_code = 500
+
+        async def send_with_trace_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", trace.trace_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            root.record_exception(e)
+            raise
+        finally:
+            root.end()
+            _current_span.reset(token)
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                root.name = f"{scope['method']} {route.path}"
+                root.set_attribute("http.route", route.path)
+            root.set_attribute("http.status_code", status_code)
+            if status_code >= 500:
+                root.status = STATUS_ERROR
+            if trace.dropped:
+                root.set_attribute("trace.dropped_spans", trace.dropped)
+            self._finish(trace, root)
+
+    def _finish(self, trace: Trace, root: Span) -> None:
+        keep = (
+            root.status == STATUS_ERROR
+            or any(item.status == STATUS_ERROR for item in trace.spans)
+            or root.duration_ms >= self.slow_ms
+            or trace.sampled
+            or random.random() < self.sample_rate
+        )
+        if keep:
+            self.exporter.submit(trace)
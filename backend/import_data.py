@@ -0,0 +1,59 @@
+"""
+Bulk import of users and collections for AgaPay
+
+Streams a CSV (header row) or JSONL file in chunks, validating each row with
+the same rules as the API.
+
+    python import_data.py users members.csv
+    python import_data.py collections funds.jsonl --owner-email admin@agapay.com
+
+User rows need email, phone, full_name and password. Collection rows take the
+CollectionCreate fields plus owner_email, unless --owner-email is given.
+"""
+import argparse
+import json
+from database_simple import SessionLocal, engine
+from models import models
+from models.models import User
+from services.bulk_import import bulk_importer, detect_format
+from services.search import ensure_search_index
+
+
+def import_data(kind, path, fmt=None, owner_email=None):
+    models.Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+    db = SessionLocal()
+    try:
+        fmt = fmt or detect_format(path)
+        with open(path, "rb") as stream:
+            if kind == "users":
+                report = bulk_importer.import_users(db, stream, fmt)
+            else:
+                owner_id = None
+                if owner_email:
+                    owner = db.query(User).filter(User.email == owner_email).first()
+                    if not owner:
+                        print(f"Owner {owner_email} does not exist")
+                        return
+                    owner_id = owner.id
+                report = bulk_importer.import_collections(db, stream, fmt, owner_id)
+
+        for error in report.pop("errors"):
+            print(f"Line {error['line']}: {error['error']}")
+        print(json.dumps(report, indent=2))
+    except Exception as e:
+        print(f"Error importing {kind}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+        bulk_importer.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import users or collections")
+    parser.add_argument("kind", choices=["users", "collections"])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--owner-email", default=None, help="owner of every imported collection")
+    args = parser.parse_args()
+    import_data(args.kind, args.path, args.format, args.owner_email)
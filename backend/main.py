@@ -7,15 +7,62 @@ from contextlib import asynccontextmanager
 
 from database_simple import get_db, engine
 from models import models
-from routers import auth, payments, users, collections, test_payments, simple_test
+from routers import auth, payments, users, collections, test_payments, simple_test, analytics, notifications, imports, profiler, ussd, recurring
 from core.config import settings
+from core.admission import AdmissionMiddleware, admission_controller
+from core.tracing import TracingMiddleware, instrument_engine, span_exporter
+from core.profiler import ProfilerMiddleware, request_profiler
+from core.cache import cache
+from services.payment_events import payment_events
+from services.search import ensure_search_index
+from services.sweeper import expiry_sweeper
+from services.ledger import ledger_compactor
+from services.notifications import notification_dispatcher
+from services.bulk_import import bulk_importer
+from services.qr import qr_cache
+from services.trending import trending_ranker
+from services.ussd import get_collection_menu, ussd_charges, ussd_engine
+from services.recurring import recurring_scheduler
+from services.velocity import velocity_limiter
 
 
 # Create database tables
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     models.Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+    if settings.SWEEPER_ENABLED:
+        expiry_sweeper.start()
+    if settings.LEDGER_COMPACT_ENABLED:
+        ledger_compactor.start()
+    if settings.NOTIFICATIONS_ENABLED:
+        await notification_dispatcher.start()
+    if settings.TRENDING_ENABLED:
+        trending_ranker.start()
+    if settings.TRACING_ENABLED:
+        span_exporter.start()
+    if settings.USSD_ENABLED:
+        ussd_charges.start()
+        # Build the first menu now rather than in the first caller's hop
+        await get_collection_menu()
+    if settings.RECURRING_ENABLED:
+        recurring_scheduler.start()
+    request_profiler.start()
     yield
+    request_profiler.stop()
+    await recurring_scheduler.stop()
+    await ussd_charges.stop()
+    await ussd_engine.sessions.close()
+    await span_exporter.stop()
+    await trending_ranker.stop()
+    await notification_dispatcher.stop()
+    await ledger_compactor.stop()
+    await expiry_sweeper.stop()
+    bulk_importer.shutdown()
+    qr_cache.shutdown()
+    await velocity_limiter.close()
+    await payment_events.close()
+    await cache.close()
 
 
 app = FastAPI(
@@ -25,6 +72,24 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Innermost, so profiles start and end as close to the handler as possible
+app.add_middleware(ProfilerMiddleware, profiler=request_profiler)
+
+# Tracing sits inside admission control, so shed requests are not traced
+if settings.TRACING_ENABLED:
+    instrument_engine(engine)
+    app.add_middleware(
+        TracingMiddleware,
+        exporter=span_exporter,
+        sample_rate=settings.TRACING_SAMPLE_RATE,
+        slow_ms=settings.TRACING_SLOW_MS,
+        max_spans=settings.TRACING_MAX_SPANS
+    )
+
+# Admission control, registered before CORS so CORS headers still wrap its 503s
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -41,6 +106,12 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(payments.router, prefix="/api/payments", tags=["Payments"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
+app.include_router(notifications.router, prefix="/api/notifications", tags=["Notifications"])
+app.include_router(imports.router, prefix="/api/imports", tags=["Imports"])
+app.include_router(profiler.router, prefix="/api/admin/profiler", tags=["Admin"])
+app.include_router(ussd.router, prefix="/api/ussd", tags=["USSD"])
+app.include_router(recurring.router, prefix="/api/recurring", tags=["Recurring"])
 
 # Debug: Try to include collections router
 try:
@@ -69,6 +140,18 @@ async def health_check():
     return {"status": "healthy", "service": "AgaPay API"}
 
 
+@app.get("/health/load")
+async def load_metrics():
+    """Admission control queue depths and rejection counts"""
+    return admission_controller.metrics()
+
+
+@app.get("/health/sweeper")
+async def sweeper_metrics():
+    """Expiry sweeper counters for this worker and its last run"""
+    return {"metrics": expiry_sweeper.metrics, "last_run": expiry_sweeper.last_run}
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Float, Text, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -21,6 +21,23 @@ class PaymentStatus(str, enum.Enum):
     CANCELLED = "cancelled"
 
 
+class OutboxStatus(str, enum.Enum):
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+
+
+class RecurringInterval(str, enum.Enum):
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+
+class RecurringStatus(str, enum.Enum):
+    ACTIVE = "active"
+    PAUSED = "paused"  # by the owner, or after too many failed charges
+    CANCELLED = "cancelled"
+
+
 class CollectionStatus(str, enum.Enum):
     ACTIVE = "active"
     INACTIVE = "inactive"
@@ -84,6 +101,20 @@ class Collection(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Composite (filter, created_at) indexes back the admin filter API in
+        # services.payment_query: equality on the leading column, then a
+        # created_at range and ORDER BY created_at served from the same index
+        Index("ix_payments_created_at", "created_at", "id"),
+        Index("ix_payments_status_created_at", "status", "created_at"),
+        Index("ix_payments_collection_created_at", "collection_id", "created_at"),
+        Index("ix_payments_user_created_at", "user_id", "created_at"),
+        Index("ix_payments_customer_email_created_at", "customer_email", "created_at"),
+        Index("ix_payments_method_provider_created_at", "payment_method", "mobile_money_provider", "created_at"),
+        Index("ix_payments_amount", "amount"),
+        # Archived ids must never be handed out again, so SQLite needs AUTOINCREMENT
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     reference = Column(String, unique=True, index=True, nullable=False)
@@ -93,6 +124,8 @@ class Payment(Base):
     currency = Column(String, default="GHS")
     payment_method = Column(Enum(PaymentMethod), nullable=False)
     status = Column(Enum(PaymentStatus), default=PaymentStatus.PENDING)
+    # Bumped on every status change; services.payment_state moves status only from the version it read
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     description = Column(Text)
 
     # Payment method specific fields
@@ -128,4 +161,181 @@ class PaymentLog(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
-    payment = relationship("Payment")
\ No newline at end of file
+    payment = relationship("Payment")
+
+
+class ArchivedPayment(Base):
+    """Lookup index for payments moved to cold storage by services.archive"""
+    __tablename__ = "archived_payments"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # original payments.id
+    reference = Column(String, unique=True, index=True, nullable=False)
+    partition = Column(String, nullable=False)  # YYYY-MM of created_at
+    segment = Column(String, nullable=False)  # file name inside the partition
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class PaymentRollup(Base):
+    """Pre-aggregated payment outcomes per time bucket, maintained by services.analytics"""
+    __tablename__ = "payment_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "granularity", "bucket_start", "collection_id", "payment_method", "mobile_money_provider",
+            name="uq_payment_rollups_bucket"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String, nullable=False)  # hour, day
+    bucket_start = Column(DateTime, nullable=False)  # UTC
+    # 0 / "" instead of NULL so the unique constraint can drive upserts
+    collection_id = Column(Integer, nullable=False, default=0)
+    payment_method = Column(String, nullable=False)
+    mobile_money_provider = Column(String, nullable=False, default="")
+    success_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    cancelled_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+
+
+class LedgerEntry(Base):
+    """Append-only credits (+) and debits (-) to a collection's balance, see services.ledger"""
+    __tablename__ = "collection_ledger"
+    __table_args__ = (
+        Index("ix_collection_ledger_collection_id_id", "collection_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # No FK: the ledger outlives deleted collections for audit
+    collection_id = Column(Integer, nullable=False)
+    amount = Column(Numeric(12, 2), nullable=False)
+    source = Column(String, nullable=False)  # payment, manual, owner_update, opening_balance
+    # Unique so a payment can only ever be credited once. No FK: the entry
+    # stays when the payment is archived (its id is kept in archived_payments)
+    payment_id = Column(Integer, unique=True, nullable=True)
+    note = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class BalanceSnapshot(Base):
+    """Compacted collection balance covering every ledger entry up to last_entry_id"""
+    __tablename__ = "collection_balance_snapshots"
+    __table_args__ = (
+        Index("ix_collection_balance_snapshots_collection_entry", "collection_id", "last_entry_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    collection_id = Column(Integer, nullable=False)
+    balance = Column(Numeric(14, 2), nullable=False)
+    last_entry_id = Column(Integer, nullable=False)
+    as_of = Column(DateTime(timezone=True), nullable=False)  # created_at of last_entry_id
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class IdempotencyRecord(Base):
+    """Stored responses for Idempotency-Key replays, see services.idempotency"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)  # "<endpoint>:<client key>"
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)  # NULL while the first request is in flight
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class JobLease(Base):
+    """Time-limited lease so only one worker runs a scheduled job at a time, see services.leases"""
+    __tablename__ = "job_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class NotificationEndpoint(Base):
+    """Merchant callback URL for events on the collections a user owns"""
+    __tablename__ = "notification_endpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
+    url = Column(String, nullable=False)
+    secret = Column(String, nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class NotificationOutbox(Base):
+    """Merchant events written in the same transaction as the change they describe"""
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index("ix_notification_outbox_due", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    endpoint_id = Column(Integer, ForeignKey("notification_endpoints.id"), nullable=False)
+    event_type = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    delivered_at = Column(DateTime, nullable=True)
+
+
+class CollectionTrending(Base):
+    """Last persisted trending ranking, see services.trending"""
+    __tablename__ = "collection_trending"
+
+    collection_id = Column(Integer, primary_key=True)
+    rank = Column(Integer, nullable=False, index=True)
+    score = Column(Float, nullable=False)  # decayed to computed_at
+    computed_at = Column(DateTime, nullable=False)
+
+
+class PaymentAuthorization(Base):
+    """Reusable Paystack authorization captured from a successful charge, see services.recurring"""
+    __tablename__ = "payment_authorizations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    authorization_code = Column(String, unique=True, nullable=False)
+    # Paystack only honours an authorization together with the email it was issued to
+    email = Column(String, nullable=False)
+    channel = Column(String, nullable=True)  # card, mobile_money, ...
+    card_type = Column(String, nullable=True)
+    last4 = Column(String, nullable=True)
+    exp_month = Column(String, nullable=True)
+    exp_year = Column(String, nullable=True)
+    bank = Column(String, nullable=True)
+    is_active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+class RecurringContribution(Base):
+    """Scheduled auto-debit of a stored authorization into a collection"""
+    __tablename__ = "recurring_contributions"
+    __table_args__ = (
+        # The scheduler's due scan: equality on status, then a next_charge_at range in order
+        Index("ix_recurring_contributions_due", "status", "next_charge_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    collection_id = Column(Integer, ForeignKey("collections.id"), nullable=False)
+    authorization_id = Column(Integer, ForeignKey("payment_authorizations.id"), nullable=False)
+    amount = Column(Numeric(10, 2), nullable=False)
+    interval = Column(Enum(RecurringInterval), nullable=False)
+    day_of_month = Column(Integer, nullable=True)  # monthly schedules keep to this day, clamped to short months
+    status = Column(Enum(RecurringStatus), default=RecurringStatus.ACTIVE, nullable=False)
+    next_charge_at = Column(DateTime, nullable=False)
+    failure_count = Column(Integer, default=0, nullable=False)  # consecutive failed attempts
+    locked_until = Column(DateTime, nullable=True)  # claimed by a scheduler run until then
+    last_payment_id = Column(Integer, nullable=True)  # no FK, so the payment can be archived
+    last_charged_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=True)
+
+    authorization = relationship("PaymentAuthorization")
@@ -0,0 +1,68 @@
+"""
+Local HTTP sink for AgaPay merchant notifications
+
+Receives callbacks, checks their signature and prints each event. Point a
+notification endpoint at it to try the dispatcher end to end:
+
+    NOTIFICATION_ALLOWED_HOSTS='["localhost"]'  # in the API's environment
+    python notification_sink.py --secret whsec_... --port 9000
+    PUT /api/notifications/endpoint {"url": "http://localhost:9000/hooks"}
+
+--fail-rate makes a share of requests return 500 to exercise retries.
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from services.notifications import SIGNATURE_HEADER, verify_signature
+
+
+def make_handler(secret, fail_rate, delay):
+    class SinkHandler(BaseHTTPRequestHandler):
+        received = 0
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if delay:
+                time.sleep(delay)
+
+            if secret and not verify_signature(secret, self.headers.get(SIGNATURE_HEADER, ""), body):
+                print("Rejected request with an invalid signature")
+                self.send_response(401)
+                self.end_headers()
+                return
+            if random.random() < fail_rate:
+                print("Simulating a failure")
+                self.send_response(500)
+                self.end_headers()
+                return
+
+            events = json.loads(body)["events"]
+            SinkHandler.received += len(events)
+            for event in events:
+                print(f"{event['id']} {event['type']}: {json.dumps(event['data'])}")
+            print(f"-- batch of {len(events)} ({SinkHandler.received} received)")
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return SinkHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receive and verify AgaPay notification callbacks")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--secret", default=None, help="endpoint secret; omit to skip signature checks")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.secret, args.fail_rate, args.delay))
+    print(f"Listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
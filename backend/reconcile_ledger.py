@@ -0,0 +1,42 @@
+"""
+Collection ledger maintenance for AgaPay
+
+Verifies every collection's current_amount against its append-only ledger in
+one grouped pass, optionally repairing drift, and compacts long ledger tails
+into balance snapshots. Run periodically (e.g. nightly from cron).
+"""
+import argparse
+from database_simple import SessionLocal, engine
+from models import models
+from services.ledger import verify, compact
+
+
+def reconcile_ledger(repair=False, compact_tails=True, min_tail=None):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        mismatches = verify(db, repair=repair)
+        for mismatch in mismatches:
+            label = "unledgered" if mismatch["unledgered"] else "drift"
+            print(
+                f"Collection {mismatch['collection_id']} ({label}): "
+                f"current_amount={mismatch['current_amount']} ledger={mismatch['ledger_balance']}"
+            )
+        print(f"{len(mismatches)} mismatched collections" + (" repaired" if repair and mismatches else ""))
+
+        if compact_tails:
+            print(f"Wrote {compact(db, min_tail)} balance snapshots")
+    except Exception as e:
+        print(f"Error reconciling ledger: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify and compact the collection ledger")
+    parser.add_argument("--repair", action="store_true", help="reset drifted balances to the ledger")
+    parser.add_argument("--no-compact", action="store_true", help="skip writing balance snapshots")
+    parser.add_argument("--min-tail", type=int, default=None)
+    args = parser.parse_args()
+    reconcile_ledger(args.repair, not args.no_compact, args.min_tail)
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from typing import Optional, Literal
+from datetime import datetime
+
+from database_simple import get_db
+from models.models import PaymentMethod, MobileMoneyProvider
+from schemas.analytics import TimeseriesResponse
+from services.analytics import timeseries
+
+router = APIRouter()
+
+# Keeps a single request to a bounded number of rollup rows per dimension
+MAX_BUCKETS = 5000
+BUCKET_SECONDS = {"hour": 3600, "day": 86400}
+
+
+@router.get("/timeseries", response_model=TimeseriesResponse)
+async def get_timeseries(
+    start: datetime,
+    end: datetime,
+    granularity: Literal["hour", "day"] = "day",
+    collection_id: Optional[int] = None,
+    payment_method: Optional[PaymentMethod] = None,
+    mobile_money_provider: Optional[MobileMoneyProvider] = None,
+    group_by: Optional[Literal["collection", "payment_method", "mobile_money_provider"]] = None,
+    db: Session = Depends(get_db)
+):
+    """Revenue and success rate per hour or day, served from precomputed rollups"""
+
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end must be after start"
+        )
+    if (end - start).total_seconds() / BUCKET_SECONDS[granularity] > MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too large for {granularity} granularity (max {MAX_BUCKETS} buckets)"
+        )
+
+    points = timeseries(
+        db,
+        start,
+        end,
+        granularity=granularity,
+        collection_id=collection_id,
+        payment_method=payment_method.value if payment_method else None,
+        mobile_money_provider=mobile_money_provider.value if mobile_money_provider else None,
+        group_by=group_by
+    )
+    return {
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "group_by": group_by,
+        "points": points
+    }
@@ -9,10 +9,12 @@ from passlib.context import CryptContext
 from database_simple import get_db
 from models.models import User
 from schemas.user import UserCreate, UserResponse, UserLogin, Token
+from core.cache import cache
 from core.config import settings
 
 router = APIRouter()
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
@@ -75,6 +77,31 @@ def get_current_user(
     return user
 
 
+def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+) -> Optional[User]:
+    """Current user if a valid token was sent, otherwise None, for public endpoints with extras for owners"""
+    email = verify_token(credentials.credentials) if credentials else None
+    if email is None:
+        return None
+    return db.query(User).filter(User.email == email).first()
+
+
+def is_admin_email(email: Optional[str]) -> bool:
+    return email is not None and email.lower() in {admin.lower() for admin in settings.ADMIN_EMAILS}
+
+
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """Current user, if they are listed in ADMIN_EMAILS"""
+    if not is_admin_email(current_user.email):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
+
 @router.post("/register", response_model=UserResponse)
 async def register(
     user_data: UserCreate,
@@ -107,6 +134,7 @@ async def register(
     db.add(user)
     db.commit()
     db.refresh(user)
+    await cache.invalidate(f"user:{user.id}")
 
     return user
 
@@ -1,15 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 from database_simple import get_db
-from models.models import Collection, User
-from schemas.collection import CollectionCreate, CollectionUpdate, CollectionResponse
-from routers.auth import get_current_user
+from models.models import Collection, CollectionStatus, User
+from schemas.collection import CollectionCreate, CollectionUpdate, CollectionResponse, CollectionSummary, TrendingCollection
+from routers.auth import get_current_user, get_optional_user
+from services.search import search_collections
+from services.ledger import post_entry, set_balance, balance
+from core.config import settings
+from core.etag import resource_validators, list_validators, conditional_response, is_not_modified, Validators
+from services.collection_cache import (
+    get_public_collections, get_cached_collection, get_cached_collections, get_collection_summaries,
+    invalidate_collection
+)
+from services.trending import trending_ranker
+from services.qr import FORMATS, payment_link, qr_cache
 
 router = APIRouter(tags=["collections"])
 
+MAX_SUMMARY_IDS = 100
+MAX_RECENT_CONTRIBUTIONS = 50
+MAX_TRENDING = 50
+
 
 @router.get("/test")
 async def test_endpoint():
@@ -19,18 +34,76 @@ async def test_endpoint():
 
 @router.get("/", response_model=List[CollectionResponse])
 async def get_collections(
+    request: Request,
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = 100
 ):
     """Get all public collections"""
-    collections = db.query(Collection).filter(
-        Collection.is_public == True,
-        Collection.status == "active"
-    ).offset(skip).limit(limit).all()
+    collections = await get_public_collections(skip, limit)
+
+    # Validated against the cached page itself, so a 304 costs no DB round-trip
+    validators = list_validators(
+        "collections",
+        len(collections),
+        max((c["updated_at"] or c["created_at"] for c in collections), default=None),
+        skip, limit, *(c["id"] for c in collections)
+    )
+    not_modified = conditional_response(request, response, validators)
+    if not_modified:
+        return not_modified
     return collections
 
 
+@router.get("/search", response_model=List[CollectionResponse])
+async def search_public_collections(
+    q: str = Query(..., min_length=1, max_length=200),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Search public collections by title and description (ranked, prefix matching)"""
+    return search_collections(db, q, skip=skip, limit=limit)
+
+
+def _summary_visible(summary: Optional[dict], user: Optional[User]) -> bool:
+    """Summaries name contributors, so private collections are shown only to their owner"""
+    return bool(summary) and (summary["is_public"] or (user is not None and summary["created_by"] == user.id))
+
+
+@router.get("/summaries", response_model=List[CollectionSummary])
+async def get_collection_summaries_batch(
+    ids: List[int] = Query(..., max_length=MAX_SUMMARY_IDS),
+    recent: int = Query(5, ge=0, le=MAX_RECENT_CONTRIBUTIONS),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """Contribution summaries for several collections (?ids=1&ids=2), in the order asked; unknown and private ids are skipped"""
+    summaries = await get_collection_summaries(ids, recent)
+    return [
+        summaries[collection_id] for collection_id in dict.fromkeys(ids)
+        if _summary_visible(summaries.get(collection_id), current_user)
+    ]
+
+
+@router.get("/trending", response_model=List[TrendingCollection])
+async def get_trending_collections(limit: int = Query(10, ge=1, le=MAX_TRENDING)):
+    """Public active collections with the most recent contribution activity, hottest first"""
+    trending = []
+    offset = 0
+    # The ranking can include private or closed collections; read on until limit are found
+    while len(trending) < limit:
+        ranked = trending_ranker.top(offset + limit)[offset:]
+        if not ranked:
+            break
+        details = await get_cached_collections([collection_id for collection_id, _ in ranked])
+        for collection_id, score in ranked:
+            collection = details.get(collection_id)
+            if collection and collection["is_public"] and collection["status"] == CollectionStatus.ACTIVE:
+                trending.append({**collection, "trending_score": score})
+        offset += len(ranked)
+    return trending[:limit]
+
+
 @router.get("/my-collections", response_model=List[CollectionResponse])
 async def get_my_collections(
     skip: int = 0,
@@ -45,18 +118,72 @@ async def get_my_collections(
     return collections
 
 
+@router.get("/{collection_id}/summary", response_model=CollectionSummary)
+async def get_collection_summary(
+    collection_id: int,
+    recent: int = Query(5, ge=0, le=MAX_RECENT_CONTRIBUTIONS),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """Contributor count, total, average and latest successful contributions"""
+    summary = (await get_collection_summaries([collection_id], recent)).get(collection_id)
+    if not _summary_visible(summary, current_user):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Collection not found"
+        )
+    return summary
+
+
+@router.get("/{collection_id}/qr")
+async def get_collection_qr(
+    collection_id: int,
+    request: Request,
+    format: Literal["png", "svg"] = Query("png"),
+    size: int = Query(settings.QR_DEFAULT_SIZE)
+):
+    """QR code for the collection's payment link, as PNG or SVG"""
+    if size not in settings.QR_SIZES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"size must be one of {', '.join(map(str, settings.QR_SIZES))}"
+        )
+    if not await get_cached_collection(collection_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Collection not found"
+        )
+
+    name, path = await qr_cache.get(payment_link(collection_id), format, size)
+    # The file name is a hash of what it depicts, so it is a strong validator as it stands
+    headers = {
+        "ETag": f'"{name.split(".")[0][:32]}"',
+        "Cache-Control": f"public, max-age={settings.QR_MAX_AGE_SECONDS}"
+    }
+    if is_not_modified(request, Validators(headers["ETag"], None)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type=FORMATS[format], headers=headers)
+
+
 @router.get("/{collection_id}", response_model=CollectionResponse)
 async def get_collection(
     collection_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response
 ):
     """Get a specific collection by ID"""
-    collection = db.query(Collection).filter(Collection.id == collection_id).first()
+    collection = await get_cached_collection(collection_id)
     if not collection:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Collection not found"
         )
+
+    validators = resource_validators(
+        "collection", collection_id, collection["updated_at"], collection["created_at"]
+    )
+    not_modified = conditional_response(request, response, validators)
+    if not_modified:
+        return not_modified
     return collection
 
 
@@ -76,6 +203,8 @@ async def create_collection(
     db.add(db_collection)
     db.commit()
     db.refresh(db_collection)
+    await invalidate_collection(db_collection.id)
+    qr_cache.prerender(payment_link(db_collection.id))
     return db_collection
 
 
@@ -101,14 +230,20 @@ async def update_collection(
             detail="Not authorized to update this collection"
         )
 
-    # Update fields
+    # Update fields; balance overwrites go through the ledger as adjustments
     update_data = collection_update.dict(exclude_unset=True)
+    new_balance = update_data.pop("current_amount", None)
     for field, value in update_data.items():
         setattr(collection, field, value)
+    if new_balance is not None:
+        set_balance(db, collection, new_balance, "owner_update")
 
     collection.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(collection)
+    await invalidate_collection(collection_id)
+    # A no-op unless the payment link changed or its renders were evicted
+    qr_cache.prerender(payment_link(collection_id))
     return collection
 
 
@@ -135,9 +270,31 @@ async def delete_collection(
 
     db.delete(collection)
     db.commit()
+    await invalidate_collection(collection_id)
     return {"message": "Collection deleted successfully"}
 
 
+@router.get("/{collection_id}/balance")
+async def get_collection_balance(
+    collection_id: int,
+    at: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Get a collection's ledger balance, now or at a point in time"""
+    exists = db.query(Collection.id).filter(Collection.id == collection_id).first()
+    if not exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Collection not found"
+        )
+
+    return {
+        "collection_id": collection_id,
+        "balance": float(balance(db, collection_id, at=at)),
+        "at": at
+    }
+
+
 @router.post("/{collection_id}/amount")
 async def update_collection_amount(
     collection_id: int,
@@ -158,10 +315,10 @@ async def update_collection_amount(
             detail="Amount is required"
         )
 
-    collection.current_amount += amount_data["amount"]
-    collection.updated_at = datetime.utcnow()
+    post_entry(db, collection, amount_data["amount"], "manual", note=amount_data.get("note"))
     db.commit()
     db.refresh(collection)
+    await invalidate_collection(collection_id)
 
     return {
         "message": "Collection amount updated successfully",
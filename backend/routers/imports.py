@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Literal
+
+from database_simple import get_db
+from models.models import User
+from core.cache import cache
+from routers.auth import get_current_admin
+from services.bulk_import import bulk_importer, detect_format
+from services.collection_cache import invalidate_collection
+
+router = APIRouter()
+
+INVALIDATE_BATCH = 1000  # user tags per invalidation broadcast
+
+
+def _format(file: UploadFile, fmt: Optional[str]) -> str:
+    if not file.filename and fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot tell the file format; pass format=csv or format=jsonl"
+        )
+    return fmt or detect_format(file.filename)
+
+
+@router.post("/users", response_model=dict)
+async def import_users(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "jsonl"]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """Create users from a CSV/JSONL file with email, phone, full_name and password columns (admin only)"""
+    # Hashing and inserts block, so keep them off the event loop
+    created_ids: List[int] = []
+    report = await run_in_threadpool(
+        bulk_importer.import_users, db, file.file, _format(file, format), None, created_ids
+    )
+    for start in range(0, len(created_ids), INVALIDATE_BATCH):
+        await cache.invalidate(*(f"user:{user_id}" for user_id in created_ids[start:start + INVALIDATE_BATCH]))
+    return report
+
+
+@router.post("/collections", response_model=dict)
+async def import_collections(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "jsonl"]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """Create collections owned by the current admin from a CSV/JSONL file"""
+    report = await run_in_threadpool(
+        bulk_importer.import_collections, db, file.file, _format(file, format), current_user.id
+    )
+    if report["created"]:
+        await invalidate_collection()
+    return report
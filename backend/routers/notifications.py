@@ -0,0 +1,133 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from database_simple import get_db
+from models.models import User, NotificationEndpoint, NotificationOutbox
+from routers.auth import get_current_user
+from schemas.notification import (
+    NotificationEndpointUpdate, NotificationEndpointResponse, NotificationDeliveryList
+)
+from services.notifications import check_callback_url, enqueue_event, generate_secret, notification_dispatcher
+
+router = APIRouter()
+
+
+def _get_endpoint(db: Session, user: User) -> NotificationEndpoint:
+    endpoint = db.query(NotificationEndpoint).filter(NotificationEndpoint.user_id == user.id).first()
+    if not endpoint:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No notification endpoint configured"
+        )
+    return endpoint
+
+
+@router.get("/endpoint", response_model=NotificationEndpointResponse)
+async def get_notification_endpoint(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the callback URL for the current user's collections"""
+    endpoint = _get_endpoint(db, current_user)
+    return NotificationEndpointResponse(
+        url=endpoint.url,
+        is_active=endpoint.is_active,
+        created_at=endpoint.created_at,
+        updated_at=endpoint.updated_at
+    )
+
+
+@router.put("/endpoint", response_model=NotificationEndpointResponse)
+async def set_notification_endpoint(
+    endpoint_data: NotificationEndpointUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create or update the callback URL; the signing secret is shown once"""
+    try:
+        await check_callback_url(endpoint_data.url)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+    endpoint = db.query(NotificationEndpoint).filter(NotificationEndpoint.user_id == current_user.id).first()
+    new_secret = None
+    if endpoint is None:
+        new_secret = generate_secret()
+        endpoint = NotificationEndpoint(user_id=current_user.id, secret=new_secret)
+        db.add(endpoint)
+    elif endpoint_data.rotate_secret:
+        new_secret = generate_secret()
+        endpoint.secret = new_secret
+
+    endpoint.url = endpoint_data.url
+    endpoint.is_active = endpoint_data.is_active
+    db.commit()
+    db.refresh(endpoint)
+
+    return NotificationEndpointResponse(
+        url=endpoint.url,
+        is_active=endpoint.is_active,
+        created_at=endpoint.created_at,
+        updated_at=endpoint.updated_at,
+        secret=new_secret
+    )
+
+
+@router.delete("/endpoint")
+async def delete_notification_endpoint(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Stop sending callbacks; queued events are dropped as failed"""
+    endpoint = _get_endpoint(db, current_user)
+    endpoint.is_active = False
+    db.commit()
+    return {"message": "Notification endpoint disabled"}
+
+
+@router.post("/endpoint/test")
+async def send_test_notification(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Queue a ping event to check the endpoint and its signature handling"""
+    _get_endpoint(db, current_user)
+    row = enqueue_event(db, current_user.id, "ping", {"message": "AgaPay notification test"})
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Notification endpoint is disabled"
+        )
+    db.commit()
+    notification_dispatcher.wake()
+    return {"message": "Test notification queued", "id": row.id}
+
+
+@router.get("/deliveries", response_model=NotificationDeliveryList)
+async def get_notification_deliveries(
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Most recent events queued for the current user's endpoint"""
+    endpoint = _get_endpoint(db, current_user)
+    rows = db.query(NotificationOutbox).filter(
+        NotificationOutbox.endpoint_id == endpoint.id
+    ).order_by(NotificationOutbox.id.desc()).limit(min(limit, 200)).all()
+    return {
+        "deliveries": [
+            {
+                "id": row.id,
+                "event_type": row.event_type,
+                "status": row.status.value,
+                "attempts": row.attempts,
+                "next_attempt_at": row.next_attempt_at,
+                "last_error": row.last_error,
+                "created_at": row.created_at,
+                "delivered_at": row.delivered_at,
+            }
+            for row in rows
+        ]
+    }
@@ -1,31 +1,91 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, WebSocket, Query, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import uuid
 import secrets
 import httpx
+import json
+import asyncio
 from datetime import datetime
 
-from database_simple import get_db
+from database_simple import get_db, SessionLocal
 from models.models import Payment, User, Collection, PaymentStatus, PaymentMethod, MobileMoneyProvider
 from schemas.payment import (
     PaymentCreate, PaymentResponse, PaymentInitialize,
     MobileMoneyPayment, PaymentVerification, PaystackWebhook,
-    PaymentStats
+    PaymentStats, PaymentFilter
 )
 from services.paystack import PaystackService
+from services.archive import find_archived_payment
+from services.collection_cache import invalidate_collection
+from services.payment_events import payment_events, FINAL_STATUSES
+from services.payment_query import PaymentQuery
+from services.analytics import record_transition
+from services.ledger import post_entry
+from services.idempotency import CommittedError, idempotency_store
+from services.notifications import enqueue_payment_succeeded, notification_dispatcher
+from services.trending import trending_ranker
+from services.recurring import save_authorization
+from services.phone import local_number
+from services.velocity import velocity_limiter
+from services.payment_state import transition
+from core.cache import cached
 from core.config import settings
+from core.etag import resource_validators, list_validators, conditional_response
 
 router = APIRouter()
 
 
+def _outcome_unknown(reference: str) -> CommittedError:
+    """The payment row exists but Paystack's answer was lost; a retry must not charge again"""
+    return CommittedError(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail={
+            "message": "Payment provider did not answer; verify the payment by reference",
+            "reference": reference,
+            "status": "pending",
+        }
+    )
+
+
+async def _idempotent_attempt(
+    request: Request,
+    db: Session,
+    endpoint: str,
+    idempotency_key: Optional[str],
+    payment_data,
+    handler
+):
+    """Make a payment attempt, counted against the velocity limits.
+
+    With an Idempotency-Key the count runs just before the key is claimed, so
+    replays of a stored or in-flight key are answered without counting and a
+    refused attempt writes nothing.
+    """
+    count = lambda: velocity_limiter.enforce(request, email=payment_data.email, phone=payment_data.phone)
+    if idempotency_key:
+        return await idempotency_store.run(db, endpoint, idempotency_key, payment_data, handler, before_claim=count)
+    await count()
+    return await handler()
+
+
 @router.post("/initialize", response_model=dict)
 async def initialize_payment(
     payment_data: PaymentInitialize,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
     """Initialize a payment transaction"""
 
+    return await _idempotent_attempt(
+        request, db, "payments.initialize", idempotency_key, payment_data,
+        lambda: _initialize_payment(payment_data, db)
+    )
+
+
+async def _initialize_payment(payment_data: PaymentInitialize, db: Session):
     # Generate unique reference
     reference = f"AGA_{secrets.token_hex(8).upper()}"
 
@@ -37,6 +97,8 @@ async def initialize_payment(
         amount=payment_data.amount,
         currency="GHS",
         payment_method=payment_data.payment_method,
+        mobile_money_provider=payment_data.provider,
+        mobile_money_number=payment_data.phone,
         customer_email=payment_data.email,
         customer_name="Customer",  # TODO: Get from user
         status=PaymentStatus.PENDING
@@ -49,25 +111,29 @@ async def initialize_payment(
     # Initialize with Paystack
     paystack_service = PaystackService()
 
-    if payment_data.payment_method == PaymentMethod.MOBILE_MONEY:
-        # Handle mobile money payment
-        paystack_response = await paystack_service.initialize_mobile_money(
-            amount=int(payment_data.amount * 100),  # Convert to pesewas
-            email=payment_data.email,
-            phone="+233200000000",  # TODO: Get from request
-            provider="mtn"  # TODO: Get from request
-        )
-    else:
-        # Handle card payment
-        paystack_response = await paystack_service.initialize_transaction(
-            amount=int(payment_data.amount * 100),
-            email=payment_data.email,
-            reference=reference,
-            callback_url=payment_data.callback_url or "http://localhost:3003/payment/callback"
-        )
-
+    try:
+        if payment_data.payment_method == PaymentMethod.MOBILE_MONEY:
+            # Handle mobile money payment
+            paystack_response = await paystack_service.initialize_mobile_money(
+                amount=int(payment_data.amount * 100),  # Convert to pesewas
+                email=payment_data.email,
+                phone=local_number(payment_data.phone),
+                provider=payment_data.provider.value
+            )
+        else:
+            # Handle card payment
+            paystack_response = await paystack_service.initialize_transaction(
+                amount=int(payment_data.amount * 100),
+                email=payment_data.email,
+                reference=reference,
+                callback_url=payment_data.callback_url or "http://localhost:3003/payment/callback"
+            )
+    except (httpx.HTTPError, ValueError) as e:
+        raise _outcome_unknown(reference) from e
+
+    # From here on the payment exists, so errors are stored against the Idempotency-Key
     if not paystack_response.get("status"):
-        raise HTTPException(
+        raise CommittedError(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Failed to initialize payment"
         )
@@ -86,10 +152,19 @@ async def initialize_payment(
 @router.post("/mobile-money", response_model=dict)
 async def process_mobile_money_payment(
     payment_data: MobileMoneyPayment,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
     """Process mobile money payment for Ghana"""
 
+    return await _idempotent_attempt(
+        request, db, "payments.mobile_money", idempotency_key, payment_data,
+        lambda: _process_mobile_money_payment(payment_data, db)
+    )
+
+
+async def _process_mobile_money_payment(payment_data: MobileMoneyPayment, db: Session):
     # Generate unique reference
     reference = f"AGA_MOBILE_{secrets.token_hex(8).upper()}"
 
@@ -113,18 +188,26 @@ async def process_mobile_money_payment(
 
     # Process with Paystack
     paystack_service = PaystackService()
-    paystack_response = await paystack_service.submit_mobile_money(
-        amount=int(payment_data.amount * 100),
-        email=payment_data.email,
-        phone=payment_data.phone,
-        provider=payment_data.provider.value,
-        reference=reference
-    )
+    try:
+        paystack_response = await paystack_service.submit_mobile_money(
+            amount=int(payment_data.amount * 100),
+            email=payment_data.email,
+            phone=local_number(payment_data.phone),
+            provider=payment_data.provider.value,
+            reference=reference
+        )
+    except (httpx.HTTPError, ValueError) as e:
+        # The prompt may have been sent; the webhook or a verify settles the payment
+        raise _outcome_unknown(reference) from e
 
     if not paystack_response.get("status"):
-        payment.status = PaymentStatus.FAILED
-        db.commit()
-        raise HTTPException(
+        # Unless a webhook has already settled it
+        moved = transition(db, payment, PaymentStatus.FAILED)
+        if moved is not None:
+            record_transition(db, payment, moved.status, moved.processed_at)
+            db.commit()
+            await payment_events.publish(reference, payment.status.value)
+        raise CommittedError(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Failed to process mobile money payment"
         )
@@ -148,30 +231,63 @@ async def verify_payment(
 
     payment = db.query(Payment).filter(Payment.reference == reference).first()
     if not payment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Payment not found"
-        )
+        # Only successful payments, or failed and cancelled ones past ARCHIVE_SETTLEMENT_DAYS,
+        # are archived, so there is nothing left to ask Paystack
+        archived = find_archived_payment(db, reference=reference)
+        if not archived:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payment not found"
+            )
+        return {
+            "status": "success",
+            "data": {
+                "reference": archived["reference"],
+                "amount": float(archived["amount"]),
+                "currency": archived["currency"],
+                "status": archived["status"],
+                "payment_method": archived["payment_method"],
+                "created_at": archived["created_at"],
+                "processed_at": archived["processed_at"]
+            }
+        }
 
     # Verify with Paystack
     paystack_service = PaystackService()
     verification_result = await paystack_service.verify_transaction(reference)
 
+    moved = None
     if verification_result.get("status"):
         payment_data = verification_result["data"]
-        payment.status = PaymentStatus.SUCCESS if payment_data["status"] == "success" else PaymentStatus.FAILED
-        payment.paystack_transaction_id = str(payment_data["id"])
-        payment.processed_at = datetime.utcnow()
+        outcome = PaymentStatus.SUCCESS if payment_data["status"] == "success" else PaymentStatus.FAILED
+        # None when the payment is already settled, or a racing webhook settled it first
+        moved = transition(
+            db, payment, outcome,
+            paystack_transaction_id=str(payment_data["id"]),
+            processed_at=datetime.utcnow()
+        )
+
+    if moved is not None:
+        record_transition(db, payment, moved.status, moved.processed_at)
 
-        # Update collection amount if payment is successful and linked to a collection
-        if payment.status == PaymentStatus.SUCCESS and payment.collection_id:
+        # Only the request that moved the payment to SUCCESS credits the collection
+        credited = payment.status == PaymentStatus.SUCCESS and payment.collection_id
+        if credited:
             collection = db.query(Collection).filter(Collection.id == payment.collection_id).first()
             if collection:
-                collection.current_amount += payment.amount
-                collection.updated_at = datetime.utcnow()
+                post_entry(db, collection, payment.amount, "payment", payment_id=payment.id)
+                enqueue_payment_succeeded(db, payment, collection)
 
         db.commit()
 
+        if credited:
+            await invalidate_collection(payment.collection_id)
+            notification_dispatcher.wake()
+            trending_ranker.wake()
+        await payment_events.publish(
+            payment.reference, payment.status.value, processed_at=payment.processed_at
+        )
+
     return {
         "status": "success",
         "data": {
@@ -231,38 +347,160 @@ async def paystack_webhook(
         payment = db.query(Payment).filter(Payment.reference == reference).first()
 
         if payment:
-            payment.status = PaymentStatus.SUCCESS
-            payment.paystack_transaction_id = str(data.get("id"))
-            payment.processed_at = datetime.utcnow()
-
-            # Update collection amount if payment is successful and linked to a collection
-            if payment.collection_id:
+            moved = transition(
+                db, payment, PaymentStatus.SUCCESS,
+                paystack_transaction_id=str(data.get("id")),
+                processed_at=datetime.utcnow()
+            )
+            if moved is not None:
+                record_transition(db, payment, moved.status, moved.processed_at)
+
+            # Only the request that moved the payment to SUCCESS credits the
+            # collection; a redelivery or a racing verify finds it settled
+            credited = moved is not None and payment.collection_id
+            if credited:
                 collection = db.query(Collection).filter(Collection.id == payment.collection_id).first()
                 if collection:
-                    collection.current_amount += payment.amount
-                    collection.updated_at = datetime.utcnow()
+                    post_entry(db, collection, payment.amount, "payment", payment_id=payment.id)
+                    enqueue_payment_succeeded(db, payment, collection)
+
+            # Reusable cards and wallets can back recurring contributions
+            if data.get("authorization"):
+                email = (data.get("customer") or {}).get("email") or payment.customer_email
+                save_authorization(db, payment.user_id, email, data["authorization"])
 
             db.commit()
 
+            if credited:
+                await invalidate_collection(payment.collection_id)
+                notification_dispatcher.wake()
+                trending_ranker.wake()
+            await payment_events.publish(
+                reference, payment.status.value, processed_at=payment.processed_at
+            )
+
     elif event == "charge.failed":
         # Update payment status
         reference = data.get("reference")
         payment = db.query(Payment).filter(Payment.reference == reference).first()
 
         if payment:
-            payment.status = PaymentStatus.FAILED
-            payment.processed_at = datetime.utcnow()
-            db.commit()
+            # A late charge.failed never overrides a success
+            moved = transition(db, payment, PaymentStatus.FAILED, processed_at=datetime.utcnow())
+            if moved is not None:
+                record_transition(db, payment, moved.status, moved.processed_at)
+                db.commit()
+                await payment_events.publish(
+                    reference, payment.status.value, processed_at=payment.processed_at
+                )
 
     return {"status": "success"}
 
 
-@router.get("/stats", response_model=PaymentStats)
-async def get_payment_stats(
+def _current_status_event(db: Session, reference: str):
+    """Current status of a payment as a stream event, None if it does not exist"""
+
+    row = db.query(Payment.status, Payment.processed_at).filter(Payment.reference == reference).first()
+    if row:
+        return {
+            "reference": reference,
+            "status": row.status.value,
+            "processed_at": row.processed_at.isoformat() if row.processed_at else None
+        }
+
+    archived = find_archived_payment(db, reference=reference)
+    if archived:
+        return {"reference": reference, "status": archived["status"], "processed_at": archived["processed_at"]}
+    return None
+
+
+async def _status_stream(subscription, initial: dict):
+    """Yield the initial status, then each change until final; None means keepalive.
+
+    Failed and cancelled payments are still watched until the stream's time
+    limit, since a late success can follow.
+    """
+
+    try:
+        yield initial
+        if initial["status"] in FINAL_STATUSES:
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.PAYMENT_EVENTS_MAX_STREAM_SECONDS
+        while loop.time() < deadline:
+            event = await subscription.next(timeout=settings.PAYMENT_EVENTS_KEEPALIVE_SECONDS)
+            yield event
+            if event and event["status"] in FINAL_STATUSES:
+                return
+    finally:
+        payment_events.unsubscribe(subscription)
+
+
+async def _open_status_stream(db: Session, reference: str):
+    # Subscribe before reading the current status so no change can slip in between
+    subscription = await payment_events.subscribe(reference)
+    initial = _current_status_event(db, reference)
+    # Don't pin a pooled connection for the lifetime of the stream
+    db.close()
+    if initial is None:
+        payment_events.unsubscribe(subscription)
+        return None
+    return _status_stream(subscription, initial)
+
+
+@router.get("/{reference}/events")
+async def stream_payment_events(
+    reference: str,
     db: Session = Depends(get_db)
 ):
-    """Get payment statistics"""
+    """Stream payment status changes as Server-Sent Events"""
 
+    events = await _open_status_stream(db, reference)
+    if events is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Payment not found"
+        )
+
+    async def sse():
+        yield "retry: 3000\n\n"
+        async for event in events:
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/{reference}/ws")
+async def payment_events_socket(
+    websocket: WebSocket,
+    reference: str,
+    db: Session = Depends(get_db)
+):
+    """Push payment status changes over a WebSocket"""
+
+    events = await _open_status_stream(db, reference)
+    if events is None:
+        await websocket.close(code=4404)
+        return
+
+    await websocket.accept()
+    try:
+        async for event in events:
+            await websocket.send_json(event or {"type": "keepalive"})
+        await websocket.close()
+    finally:
+        await events.aclose()
+
+
+def _compute_payment_stats(db: Session) -> PaymentStats:
     total_payments = db.query(Payment).count()
     successful_payments = db.query(Payment).filter(Payment.status == PaymentStatus.SUCCESS).count()
     failed_payments = db.query(Payment).filter(Payment.status == PaymentStatus.FAILED).count()
@@ -283,26 +521,67 @@ async def get_payment_stats(
     )
 
 
+# TTL only: invalidating on every payment would make the cache useless under load
+@cached("payments:stats", ttl=settings.PAYMENT_STATS_CACHE_TTL_SECONDS)
+def _payment_stats() -> PaymentStats:
+    db = SessionLocal()
+    try:
+        return _compute_payment_stats(db)
+    finally:
+        db.close()
+
+
+@router.get("/stats", response_model=PaymentStats)
+async def get_payment_stats():
+    """Get payment statistics (cached for PAYMENT_STATS_CACHE_TTL_SECONDS)"""
+    return await _payment_stats()
+
+
 @router.get("/", response_model=List[PaymentResponse])
 async def get_payments(
-    skip: int = 0,
-    limit: int = 100,
+    request: Request,
+    response: Response,
+    filters: PaymentFilter = Depends(),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db)
 ):
-    """Get all payments"""
+    """Get payments, filtered and sorted server-side"""
 
-    payments = db.query(Payment).offset(skip).limit(limit).all()
-    return payments
+    payment_query = PaymentQuery(db, filters)
+    total, last_modified = payment_query.summary()
+    validators = list_validators(
+        "payments", total, last_modified, skip, limit,
+        *sorted(filters.model_dump(exclude_none=True).items())
+    )
+    not_modified = conditional_response(request, response, validators)
+    if not_modified:
+        return not_modified
+
+    response.headers["X-Total-Count"] = str(total)
+    return payment_query.page(skip, limit)
 
 
 @router.get("/{payment_id}", response_model=PaymentResponse)
 async def get_payment(
     payment_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """Get a specific payment"""
 
+    # Check validators against the timestamps alone before loading the full row
+    timestamps = db.query(Payment.updated_at, Payment.created_at).filter(Payment.id == payment_id).first()
+    if timestamps:
+        validators = resource_validators("payment", payment_id, *timestamps)
+        not_modified = conditional_response(request, response, validators)
+        if not_modified:
+            return not_modified
+
     payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    if not payment:
+        payment = find_archived_payment(db, payment_id=payment_id)
     if not payment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -0,0 +1,67 @@
+import json
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+
+from models.models import User
+from routers.auth import get_current_admin
+from schemas.profiler import ProfilerUpdate, ProfilerStatus
+from core.profiler import request_profiler
+
+router = APIRouter()
+
+
+def _status() -> dict:
+    return {
+        "enabled": request_profiler.enabled,
+        "slow_ms": request_profiler.slow_ms,
+        "interval_ms": request_profiler.interval * 1000,
+        "routes": sorted(request_profiler.routes),
+        "active_requests": len(request_profiler._active),
+        # Newest first
+        "profiles": [profile.summary() for profile in reversed(request_profiler.profiles)],
+    }
+
+
+@router.get("/", response_model=ProfilerStatus)
+async def get_profiler(current_user: User = Depends(get_current_admin)):
+    """Profiler settings for this worker and the profiles it holds"""
+    return _status()
+
+
+@router.put("/", response_model=ProfilerStatus)
+async def update_profiler(update: ProfilerUpdate, current_user: User = Depends(get_current_admin)):
+    """Change the profiler at runtime; applies to this worker process only"""
+    if update.enabled is not None:
+        request_profiler.enabled = update.enabled
+    if update.slow_ms is not None:
+        request_profiler.slow_ms = update.slow_ms
+    if update.routes is not None:
+        request_profiler.routes = set(update.routes)
+    return _status()
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+    profile_id: int,
+    format: Literal["speedscope", "collapsed"] = Query("speedscope"),
+    current_user: User = Depends(get_current_admin)
+):
+    """A profile as speedscope JSON (open at https://www.speedscope.app) or collapsed stacks for flamegraph.pl"""
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found; only the most recent profiles on this worker are kept"
+        )
+    if format == "collapsed":
+        return Response(
+            profile.collapsed(),
+            media_type="text/plain",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'}
+        )
+    return Response(
+        json.dumps(profile.speedscope()),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'}
+    )
@@ -0,0 +1,170 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List
+from datetime import datetime
+
+from database_simple import get_db
+from models.models import (
+    Collection, CollectionStatus, PaymentAuthorization, RecurringContribution, RecurringInterval,
+    RecurringStatus, User
+)
+from routers.auth import get_current_admin, get_current_user
+from schemas.recurring import (
+    PaymentAuthorizationResponse, RecurringContributionCreate, RecurringContributionUpdate,
+    RecurringContributionResponse
+)
+from services.recurring import recurring_scheduler
+
+router = APIRouter()
+
+
+def _get_authorization(db: Session, user: User, authorization_id: int) -> PaymentAuthorization:
+    authorization = db.query(PaymentAuthorization).filter(
+        PaymentAuthorization.id == authorization_id,
+        PaymentAuthorization.user_id == user.id,
+        PaymentAuthorization.is_active == True
+    ).first()
+    if not authorization:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Payment authorization not found"
+        )
+    return authorization
+
+
+def _get_schedule(db: Session, user: User, schedule_id: int) -> RecurringContribution:
+    schedule = db.query(RecurringContribution).filter(
+        RecurringContribution.id == schedule_id,
+        RecurringContribution.user_id == user.id
+    ).first()
+    if not schedule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recurring contribution not found"
+        )
+    return schedule
+
+
+@router.get("/authorizations", response_model=List[PaymentAuthorizationResponse])
+async def list_authorizations(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cards and wallets saved from the current user's successful payments"""
+    return db.query(PaymentAuthorization).filter(
+        PaymentAuthorization.user_id == current_user.id,
+        PaymentAuthorization.is_active == True
+    ).order_by(PaymentAuthorization.created_at.desc()).all()
+
+
+@router.delete("/authorizations/{authorization_id}")
+async def delete_authorization(
+    authorization_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Forget a saved authorization; schedules using it are paused when next due"""
+    authorization = _get_authorization(db, current_user, authorization_id)
+    authorization.is_active = False
+    db.commit()
+    return {"message": "Payment authorization removed"}
+
+
+@router.post("/", response_model=RecurringContributionResponse, status_code=status.HTTP_201_CREATED)
+async def create_recurring_contribution(
+    schedule_data: RecurringContributionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Contribute to a collection every week or month from a saved authorization"""
+    authorization = _get_authorization(db, current_user, schedule_data.authorization_id)
+    collection = db.query(Collection).filter(
+        Collection.id == schedule_data.collection_id,
+        Collection.status == CollectionStatus.ACTIVE
+    ).first()
+    if not collection:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Collection not found or not active"
+        )
+
+    now = datetime.utcnow()
+    start_at = schedule_data.start_at.replace(tzinfo=None) if schedule_data.start_at else now
+    schedule = RecurringContribution(
+        user_id=current_user.id,
+        collection_id=collection.id,
+        authorization_id=authorization.id,
+        amount=schedule_data.amount,
+        interval=schedule_data.interval,
+        day_of_month=start_at.day if schedule_data.interval == RecurringInterval.MONTHLY else None,
+        status=RecurringStatus.ACTIVE,
+        next_charge_at=max(start_at, now),
+        created_at=now
+    )
+    db.add(schedule)
+    db.commit()
+    db.refresh(schedule)
+    return schedule
+
+
+@router.get("/", response_model=List[RecurringContributionResponse])
+async def list_recurring_contributions(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """The current user's recurring contributions, cancelled ones excluded"""
+    return db.query(RecurringContribution).filter(
+        RecurringContribution.user_id == current_user.id,
+        RecurringContribution.status != RecurringStatus.CANCELLED
+    ).order_by(RecurringContribution.created_at.desc()).all()
+
+
+@router.put("/{schedule_id}", response_model=RecurringContributionResponse)
+async def update_recurring_contribution(
+    schedule_id: int,
+    schedule_data: RecurringContributionUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Change the amount, or pause and resume"""
+    schedule = _get_schedule(db, current_user, schedule_id)
+    if schedule.status == RecurringStatus.CANCELLED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Recurring contribution is cancelled"
+        )
+
+    now = datetime.utcnow()
+    if schedule_data.amount is not None:
+        schedule.amount = schedule_data.amount
+    if schedule_data.status == "paused":
+        schedule.status = RecurringStatus.PAUSED
+    elif schedule_data.status == "active" and schedule.status != RecurringStatus.ACTIVE:
+        # Resuming starts afresh: earlier failures are forgotten and nothing is charged in arrears
+        schedule.status = RecurringStatus.ACTIVE
+        schedule.failure_count = 0
+        schedule.next_charge_at = max(schedule.next_charge_at, now)
+    schedule.updated_at = now
+    db.commit()
+    db.refresh(schedule)
+    return schedule
+
+
+@router.delete("/{schedule_id}")
+async def cancel_recurring_contribution(
+    schedule_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Stop a recurring contribution for good"""
+    schedule = _get_schedule(db, current_user, schedule_id)
+    schedule.status = RecurringStatus.CANCELLED
+    schedule.updated_at = datetime.utcnow()
+    db.commit()
+    return {"message": "Recurring contribution cancelled"}
+
+
+@router.get("/scheduler")
+async def get_scheduler_metrics(current_admin: User = Depends(get_current_admin)):
+    """Recurring charge counters for this worker and its last run"""
+    return {"metrics": recurring_scheduler.metrics, "last_run": recurring_scheduler.last_run}
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from datetime import datetime
 
 from database_simple import get_db
+from services.collection_cache import invalidate_collection
+from services.ledger import post_entry
 from models.models import Collection
 
 router = APIRouter(prefix="/api/simple-test", tags=["simple-test"])
@@ -23,9 +24,9 @@ async def update_collection_amount(
             detail="Collection not found"
         )
 
-    collection.current_amount += amount
-    collection.updated_at = datetime.utcnow()
+    post_entry(db, collection, amount, "manual")
     db.commit()
+    await invalidate_collection(collection_id)
 
     return {
         "success": True,
@@ -4,6 +4,11 @@ from datetime import datetime
 import secrets
 
 from database_simple import get_db
+from services.collection_cache import invalidate_collection
+from services.ledger import post_entry
+from services.analytics import record_transition
+from services.notifications import enqueue_payment_succeeded, notification_dispatcher
+from services.trending import trending_ranker
 from models.models import Payment, Collection, PaymentStatus, PaymentMethod
 
 router = APIRouter(prefix="/api/test", tags=["test"])
@@ -42,13 +47,17 @@ async def create_test_payment(
     )
 
     db.add(payment)
+    record_transition(db, payment, None)
     db.commit()
     db.refresh(payment)
 
     # Update collection amount
-    collection.current_amount += amount
-    collection.updated_at = datetime.utcnow()
+    post_entry(db, collection, amount, "payment", payment_id=payment.id)
+    enqueue_payment_succeeded(db, payment, collection)
     db.commit()
+    await invalidate_collection(collection_id)
+    notification_dispatcher.wake()
+    trending_ranker.wake()
 
     return {
         "success": True,
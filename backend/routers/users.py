@@ -1,21 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Dict, List, Optional
 
-from database_simple import get_db
+from database_simple import get_db, SessionLocal
 from models.models import User
 from schemas.user import UserResponse, UserUpdate
+from core.cache import cache, cached
+from core.etag import resource_validators, list_validators, conditional_response
 
 router = APIRouter()
 
 
+# Unknown ids are not cached, so an account is found as soon as it exists
+@cached("user:{user_id}", tags=["user:{user_id}"], none_ttl=0)
+def _load_user(user_id: int) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        return UserResponse.model_validate(user).model_dump() if user else None
+    finally:
+        db.close()
+
+
 @router.get("/", response_model=List[UserResponse])
 async def get_users(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
     """Get all users"""
+    total, last_modified = db.query(
+        func.count(User.id),
+        func.max(func.coalesce(User.updated_at, User.created_at))
+    ).one()
+    validators = list_validators("users", total, last_modified, skip, limit)
+    not_modified = conditional_response(request, response, validators)
+    if not_modified:
+        return not_modified
+
     users = db.query(User).offset(skip).limit(limit).all()
     return users
 
@@ -23,15 +48,21 @@ async def get_users(
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response
 ):
     """Get a specific user"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await _load_user(user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+
+    validators = resource_validators("user", user_id, user["updated_at"], user["created_at"])
+    not_modified = conditional_response(request, response, validators)
+    if not_modified:
+        return not_modified
     return user
 
 
@@ -56,6 +87,7 @@ async def update_user(
 
     db.commit()
     db.refresh(user)
+    await cache.invalidate(f"user:{user_id}")
     return user
 
 
@@ -74,4 +106,5 @@ async def delete_user(
 
     db.delete(user)
     db.commit()
+    await cache.invalidate(f"user:{user_id}")
     return {"message": "User deleted successfully"}
\ No newline at end of file
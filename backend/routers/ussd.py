@@ -0,0 +1,62 @@
+import ipaddress
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
+
+from core.config import settings
+from models.models import User
+from routers.auth import get_current_admin
+from services.ussd import ussd_charges, ussd_engine
+from services.velocity import client_ip
+
+router = APIRouter()
+
+GATEWAY_NETWORKS = [ipaddress.ip_network(entry, strict=False) for entry in settings.USSD_GATEWAY_IPS]
+
+
+def _gateway_address(ip: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(ip or "")
+    except ValueError:
+        return False
+    return any(address in network for network in GATEWAY_NETWORKS)
+
+
+def _check_gateway(ip: Optional[str], token: Optional[str]) -> None:
+    """Refuse hops that do not come from the configured gateway"""
+    allowed = bool(settings.USSD_GATEWAY_TOKEN or GATEWAY_NETWORKS)
+    if settings.USSD_GATEWAY_TOKEN and not secrets.compare_digest(
+        (token or "").encode(), settings.USSD_GATEWAY_TOKEN.encode()
+    ):
+        allowed = False
+    if GATEWAY_NETWORKS and not _gateway_address(ip):
+        allowed = False
+    if not allowed:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unknown USSD gateway")
+
+
+@router.post("/callback", response_class=PlainTextResponse)
+async def ussd_callback(
+    request: Request,
+    session_id: str = Form(..., alias="sessionId", max_length=128),
+    phone_number: str = Form(..., alias="phoneNumber", max_length=20),
+    text: str = Form(""),
+    service_code: Optional[str] = Form(None, alias="serviceCode"),
+    network_code: Optional[str] = Form(None, alias="networkCode"),
+    token: Optional[str] = Query(None, max_length=255)
+):
+    """USSD gateway hop (Africa's Talking format); replies "CON ..." to continue or "END ..." to close"""
+    ip = client_ip(request)
+    _check_gateway(ip, token)
+    # The gateway's own address says nothing about the caller, so only other addresses are counted
+    return await ussd_engine.handle(
+        session_id, phone_number, text, network_code, ip=None if _gateway_address(ip) else ip
+    )
+
+
+@router.get("/metrics")
+async def ussd_metrics(current_user: User = Depends(get_current_admin)):
+    """Hop and charge hand-off counters for this worker"""
+    return {"sessions": ussd_engine.metrics, "charges": ussd_charges.metrics}
@@ -0,0 +1,39 @@
+"""
+Expiry sweep for AgaPay
+
+Expires collections whose end_date has passed and cancels payments left
+PENDING/PROCESSING longer than PAYMENT_PENDING_TIMEOUT_MINUTES. The API runs
+this on a timer (SWEEPER_ENABLED); use this script for a one-off pass or from
+cron when the in-process sweeper is disabled.
+"""
+import argparse
+import asyncio
+from database_simple import engine
+from models import models
+from services.payment_events import payment_events
+from services.sweeper import expiry_sweeper
+
+
+async def run_sweeper(force=False):
+    models.Base.metadata.create_all(bind=engine)
+    try:
+        result = await expiry_sweeper.run(force=force)
+        if result is None:
+            print("Another worker holds the sweeper lease; use --force to sweep anyway")
+            return
+        print(f"Expired {len(result['collections_expired'])} collections")
+        print(f"Cancelled {len(result['payments_cancelled'])} stale payments")
+        print(f"Purged {result['idempotency_keys_purged']} expired idempotency keys")
+        print(f"Finished in {result['duration_ms']}ms")
+    except Exception as e:
+        print(f"Error running sweeper: {e}")
+    finally:
+        expiry_sweeper.release()
+        await payment_events.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expire ended collections and cancel stale payments")
+    parser.add_argument("--force", action="store_true", help="sweep even if another worker holds the lease")
+    args = parser.parse_args()
+    asyncio.run(run_sweeper(args.force))
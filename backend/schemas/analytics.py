@@ -0,0 +1,24 @@
+from pydantic import BaseModel
+from typing import Optional, List, Literal
+from datetime import datetime
+from decimal import Decimal
+
+
+class TimeseriesPoint(BaseModel):
+    bucket_start: datetime
+    collection_id: Optional[int] = None
+    payment_method: Optional[str] = None
+    mobile_money_provider: Optional[str] = None
+    success_count: int
+    failed_count: int
+    cancelled_count: int
+    revenue: Decimal
+    success_rate: float
+
+
+class TimeseriesResponse(BaseModel):
+    granularity: Literal["hour", "day"]
+    start: datetime
+    end: datetime
+    group_by: Optional[str] = None
+    points: List[TimeseriesPoint]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 from models import models
 
@@ -38,4 +38,28 @@ class CollectionResponse(CollectionBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class TrendingCollection(CollectionResponse):
+    trending_score: float
+
+
+class ContributionSummary(BaseModel):
+    amount: float
+    customer_name: str
+    processed_at: Optional[datetime] = None
+
+
+class CollectionSummary(BaseModel):
+    collection_id: int
+    title: str
+    target_amount: Optional[float] = None
+    current_amount: float
+    progress_percent: Optional[float] = None
+    contribution_count: int
+    contributor_count: int
+    total_amount: float
+    average_amount: float
+    last_contribution_at: Optional[datetime] = None
+    recent_contributions: List[ContributionSummary]
\ No newline at end of file
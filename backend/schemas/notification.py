@@ -0,0 +1,43 @@
+from pydantic import BaseModel, field_validator
+from typing import Optional, List
+from datetime import datetime
+
+
+class NotificationEndpointUpdate(BaseModel):
+    url: str
+    is_active: bool = True
+    rotate_secret: bool = False
+
+    @field_validator("url")
+    @classmethod
+    def validate_url(cls, v):
+        if not v.startswith(("https://", "http://")):
+            raise ValueError("Callback URL must start with https:// or http://")
+        return v
+
+
+class NotificationEndpointResponse(BaseModel):
+    url: str
+    is_active: bool
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    # Only returned when the secret is first created or rotated
+    secret: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class NotificationDelivery(BaseModel):
+    id: int
+    event_type: str
+    status: str
+    attempts: int
+    next_attempt_at: datetime
+    last_error: Optional[str] = None
+    created_at: datetime
+    delivered_at: Optional[datetime] = None
+
+
+class NotificationDeliveryList(BaseModel):
+    deliveries: List[NotificationDelivery]
@@ -1,8 +1,10 @@
-from pydantic import BaseModel, EmailStr, validator
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, validator, model_validator
+from typing import Optional, List, Literal
 from datetime import datetime
 from decimal import Decimal
 from models.models import PaymentStatus, PaymentMethod, MobileMoneyProvider
+from core.config import settings
+from services.phone import route_mobile_money
 
 
 class PaymentBase(BaseModel):
@@ -42,21 +44,57 @@ class PaymentResponse(PaymentBase):
         from_attributes = True
 
 
+class PaymentFilter(BaseModel):
+    status: Optional[PaymentStatus] = None
+    payment_method: Optional[PaymentMethod] = None
+    mobile_money_provider: Optional[MobileMoneyProvider] = None
+    collection_id: Optional[int] = None
+    user_id: Optional[int] = None
+    customer_email: Optional[str] = None
+    min_amount: Optional[Decimal] = None
+    max_amount: Optional[Decimal] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    sort: Literal["created_at", "-created_at", "amount", "-amount", "id", "-id"] = "-created_at"
+
+
 class PaymentInitialize(BaseModel):
     amount: Decimal
     email: EmailStr
     payment_method: PaymentMethod
     callback_url: Optional[str] = None
     collection_id: Optional[int] = None
+    # Mobile money only; the network is detected from the number when omitted
+    phone: Optional[str] = None
+    provider: Optional[MobileMoneyProvider] = None
+
+    @model_validator(mode="after")
+    def route_phone(self):
+        if self.payment_method == PaymentMethod.MOBILE_MONEY:
+            if not self.phone:
+                raise ValueError("phone is required for mobile money payments")
+            self.phone, self.provider = route_mobile_money(
+                self.phone, self.provider, settings.MOBILE_MONEY_ENFORCE_PREFIX
+            )
+        return self
 
 
 class MobileMoneyPayment(BaseModel):
     amount: Decimal
     phone: str
-    provider: MobileMoneyProvider
+    # Detected from the number when omitted
+    provider: Optional[MobileMoneyProvider] = None
     email: EmailStr
     name: str
 
+    @model_validator(mode="after")
+    def route_phone(self):
+        # Normalized to E.164 and checked against the network before anything is stored or charged
+        self.phone, self.provider = route_mobile_money(
+            self.phone, self.provider, settings.MOBILE_MONEY_ENFORCE_PREFIX
+        )
+        return self
+
 
 class PaymentVerification(BaseModel):
     reference: str
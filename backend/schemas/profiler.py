@@ -0,0 +1,45 @@
+from pydantic import BaseModel, field_validator
+from typing import Optional, List
+from datetime import datetime
+
+
+class ProfilerUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    slow_ms: Optional[float] = None
+    # Path prefixes whose requests are profiled from the start; replaces the current list
+    routes: Optional[List[str]] = None
+
+    @field_validator("slow_ms")
+    @classmethod
+    def validate_slow_ms(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("slow_ms must be positive")
+        return v
+
+    @field_validator("routes")
+    @classmethod
+    def validate_routes(cls, v):
+        if v is not None and any(not route.startswith("/") for route in v):
+            raise ValueError("Routes must be path prefixes starting with /")
+        return v
+
+
+class ProfileSummary(BaseModel):
+    id: int
+    method: str
+    path: str
+    route: Optional[str] = None
+    reason: str
+    status_code: int
+    duration_ms: float
+    samples: int
+    captured_at: datetime
+
+
+class ProfilerStatus(BaseModel):
+    enabled: bool
+    slow_ms: float
+    interval_ms: float
+    routes: List[str]
+    active_requests: int
+    profiles: List[ProfileSummary]
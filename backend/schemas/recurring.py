@@ -0,0 +1,66 @@
+from pydantic import BaseModel, field_validator
+from typing import Literal, Optional
+from datetime import datetime
+from decimal import Decimal
+
+from models.models import RecurringInterval, RecurringStatus
+
+
+class PaymentAuthorizationResponse(BaseModel):
+    id: int
+    channel: Optional[str] = None
+    card_type: Optional[str] = None
+    last4: Optional[str] = None
+    exp_month: Optional[str] = None
+    exp_year: Optional[str] = None
+    bank: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class RecurringContributionCreate(BaseModel):
+    collection_id: int
+    authorization_id: int
+    amount: Decimal
+    interval: RecurringInterval
+    # First charge; defaults to now, and monthly charges keep to its day of the month
+    start_at: Optional[datetime] = None
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, v):
+        if v <= 0:
+            raise ValueError("Amount must be greater than 0")
+        return v
+
+
+class RecurringContributionUpdate(BaseModel):
+    amount: Optional[Decimal] = None
+    status: Optional[Literal["active", "paused"]] = None
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Amount must be greater than 0")
+        return v
+
+
+class RecurringContributionResponse(BaseModel):
+    id: int
+    collection_id: int
+    authorization_id: int
+    amount: Decimal
+    interval: RecurringInterval
+    day_of_month: Optional[int] = None
+    status: RecurringStatus
+    next_charge_at: datetime
+    failure_count: int
+    last_payment_id: Optional[int] = None
+    last_charged_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,256 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, delete, func
+from sqlalchemy.orm import Session
+
+from models.models import Payment, PaymentRollup, PaymentStatus
+from services.archive import archived_through
+
+GRANULARITIES = ("hour", "day")
+
+OUTCOME_COLUMNS = {
+    PaymentStatus.SUCCESS: "success_count",
+    PaymentStatus.FAILED: "failed_count",
+    PaymentStatus.CANCELLED: "cancelled_count",
+}
+COUNTER_COLUMNS = ("success_count", "failed_count", "cancelled_count", "revenue")
+KEY_COLUMNS = ("granularity", "bucket_start", "collection_id", "payment_method", "mobile_money_provider")
+
+GROUP_BY_COLUMNS = {
+    "collection": PaymentRollup.collection_id,
+    "payment_method": PaymentRollup.payment_method,
+    "mobile_money_provider": PaymentRollup.mobile_money_provider,
+}
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    value = _naive_utc(value).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+
+def _upsert(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Add counter deltas onto existing buckets, creating them as needed"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    table = PaymentRollup.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={name: table.c[name] + statement.excluded[name] for name in COUNTER_COLUMNS}
+    )
+    db.execute(statement, rows)
+
+
+def _outcome_delta(status: Optional[PaymentStatus], amount: Decimal, sign: int) -> Dict[str, Any]:
+    delta = {"success_count": 0, "failed_count": 0, "cancelled_count": 0, "revenue": Decimal("0")}
+    if status in OUTCOME_COLUMNS:
+        delta[OUTCOME_COLUMNS[status]] = sign
+        if status == PaymentStatus.SUCCESS:
+            delta["revenue"] = sign * Decimal(amount)
+    return delta
+
+
+def _transition_rows(
+    payment: Any, previous_status: Optional[PaymentStatus], previous_at: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    if payment.status == previous_status:
+        return []
+    if payment.status not in OUTCOME_COLUMNS and previous_status not in OUTCOME_COLUMNS:
+        return []
+
+    occurred_at = payment.processed_at or datetime.utcnow()
+    # The old outcome comes off the bucket it was counted in
+    deltas = [(occurred_at, _outcome_delta(payment.status, payment.amount, 1))]
+    if previous_status in OUTCOME_COLUMNS:
+        deltas.append((previous_at or occurred_at, _outcome_delta(previous_status, payment.amount, -1)))
+
+    rows: Dict[tuple, Dict[str, Any]] = {}
+    for at, delta in deltas:
+        for granularity in GRANULARITIES:
+            row = {
+                "granularity": granularity,
+                "bucket_start": bucket_start(at, granularity),
+                "collection_id": payment.collection_id or 0,
+                "payment_method": payment.payment_method.value,
+                "mobile_money_provider": payment.mobile_money_provider.value if payment.mobile_money_provider else "",
+                **delta,
+            }
+            key = tuple(row[name] for name in KEY_COLUMNS)
+            if key in rows:
+                for name in COUNTER_COLUMNS:
+                    rows[key][name] += row[name]
+            else:
+                rows[key] = row
+    return list(rows.values())
+
+
+def record_transition(
+    db: Session, payment: Payment, previous_status: Optional[PaymentStatus], previous_at: Optional[datetime] = None
+) -> None:
+    """Fold a payment status change into the rollups, in the caller's transaction.
+
+    Moving out of a terminal status (e.g. a late success after a failure)
+    subtracts the old outcome from the bucket of ``previous_at``, when it was
+    reached, so the buckets always match the payments table.
+    """
+    rows = _transition_rows(payment, previous_status, previous_at)
+    if rows:
+        _upsert(db, rows)
+
+
+def record_transitions(db: Session, payments: List[Any], previous_status: Optional[PaymentStatus]) -> None:
+    """Bulk form of record_transition for set-based updates (e.g. RETURNING rows).
+
+    Deltas for the same bucket are merged first: Postgres rejects an upsert
+    that touches the same row twice in one statement.
+    """
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for payment in payments:
+        for row in _transition_rows(payment, previous_status):
+            key = tuple(row[name] for name in KEY_COLUMNS)
+            if key in merged:
+                for name in COUNTER_COLUMNS:
+                    merged[key][name] += row[name]
+            else:
+                merged[key] = row
+    if merged:
+        _upsert(db, list(merged.values()))
+
+
+def _bucket_expression(db: Session, column, granularity: str):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(granularity, column)
+    pattern = "%Y-%m-%d %H:00:00" if granularity == "hour" else "%Y-%m-%d 00:00:00"
+    return func.strftime(pattern, column)
+
+
+def backfill(db: Session, start: datetime, end: datetime) -> int:
+    """Recompute rollups for [start, end) from the payments table.
+
+    The range is widened to whole days so day buckets are never half rebuilt.
+    Intended for closed ranges; live increments landing in the range while it
+    is being rebuilt would be lost. Raises ValueError for ranges reaching
+    days with archived payments, which are no longer in the table and would
+    drop out of the rebuilt buckets.
+    """
+    start = bucket_start(start, "day")
+    day_end = bucket_start(end, "day")
+    end = day_end if day_end == _naive_utc(end) else day_end + timedelta(days=1)
+
+    through = archived_through(db)
+    if through is not None and start <= through:
+        earliest = bucket_start(through, "day") + timedelta(days=1)
+        raise ValueError(
+            f"Payments up to {through:%Y-%m-%d %H:%M} are archived; start the backfill on {earliest:%Y-%m-%d} or later"
+        )
+
+    occurred_at = func.coalesce(Payment.processed_at, Payment.updated_at, Payment.created_at)
+    written = 0
+    for granularity in GRANULARITIES:
+        db.execute(delete(PaymentRollup.__table__).where(
+            PaymentRollup.granularity == granularity,
+            PaymentRollup.bucket_start >= start,
+            PaymentRollup.bucket_start < end
+        ))
+
+        bucket = _bucket_expression(db, occurred_at, granularity).label("bucket")
+        groups = db.query(
+            bucket,
+            Payment.collection_id,
+            Payment.payment_method,
+            Payment.mobile_money_provider,
+            func.sum(case((Payment.status == PaymentStatus.SUCCESS, 1), else_=0)),
+            func.sum(case((Payment.status == PaymentStatus.FAILED, 1), else_=0)),
+            func.sum(case((Payment.status == PaymentStatus.CANCELLED, 1), else_=0)),
+            func.sum(case((Payment.status == PaymentStatus.SUCCESS, Payment.amount), else_=0)),
+        ).filter(
+            Payment.status.in_(list(OUTCOME_COLUMNS)),
+            occurred_at >= start,
+            occurred_at < end
+        ).group_by(
+            bucket, Payment.collection_id, Payment.payment_method, Payment.mobile_money_provider
+        ).all()
+
+        rows = [
+            {
+                "granularity": granularity,
+                "bucket_start": datetime.fromisoformat(b) if isinstance(b, str) else _naive_utc(b),
+                "collection_id": collection_id or 0,
+                "payment_method": method.value,
+                "mobile_money_provider": provider.value if provider else "",
+                "success_count": success,
+                "failed_count": failed,
+                "cancelled_count": cancelled,
+                "revenue": Decimal(revenue or 0),
+            }
+            for b, collection_id, method, provider, success, failed, cancelled, revenue in groups
+        ]
+        if rows:
+            _upsert(db, rows)
+        written += len(rows)
+
+    db.commit()
+    return written
+
+
+def timeseries(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+    collection_id: Optional[int] = None,
+    payment_method: Optional[str] = None,
+    mobile_money_provider: Optional[str] = None,
+    group_by: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Revenue and outcome counts per bucket, answered from the rollups only"""
+
+    dimension = GROUP_BY_COLUMNS.get(group_by)
+    columns = [PaymentRollup.bucket_start] + ([dimension] if dimension is not None else [])
+
+    query = db.query(
+        *columns,
+        func.sum(PaymentRollup.success_count),
+        func.sum(PaymentRollup.failed_count),
+        func.sum(PaymentRollup.cancelled_count),
+        func.sum(PaymentRollup.revenue),
+    ).filter(
+        PaymentRollup.granularity == granularity,
+        PaymentRollup.bucket_start >= bucket_start(start, granularity),
+        PaymentRollup.bucket_start < _naive_utc(end)
+    )
+    if collection_id is not None:
+        query = query.filter(PaymentRollup.collection_id == collection_id)
+    if payment_method is not None:
+        query = query.filter(PaymentRollup.payment_method == payment_method)
+    if mobile_money_provider is not None:
+        query = query.filter(PaymentRollup.mobile_money_provider == mobile_money_provider)
+
+    points = []
+    for row in query.group_by(*columns).order_by(*columns).all():
+        success, failed, cancelled, revenue = row[-4:]
+        point = {
+            "bucket_start": row[0],
+            "success_count": success,
+            "failed_count": failed,
+            "cancelled_count": cancelled,
+            "revenue": revenue or Decimal("0"),
+            "success_rate": (success / (success + failed) * 100) if success + failed else 0.0,
+        }
+        if group_by == "collection":
+            point["collection_id"] = row[1] or None
+        elif group_by is not None:
+            point[group_by] = row[1] or None
+        points.append(point)
+    return points
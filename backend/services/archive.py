@@ -0,0 +1,241 @@
+import enum
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.models import Payment, PaymentLog, ArchivedPayment, PaymentStatus
+from core.config import settings
+
+TERMINAL_STATUSES = (PaymentStatus.SUCCESS, PaymentStatus.FAILED, PaymentStatus.CANCELLED)
+# A late charge.success can still move these to SUCCESS, so they are only archived once settled
+UNSETTLED_STATUSES = (PaymentStatus.FAILED, PaymentStatus.CANCELLED)
+
+PAYMENT_COLUMNS = [column.name for column in Payment.__table__.columns]
+LOG_COLUMNS = [column.name for column in PaymentLog.__table__.columns]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _to_columns(rows: List[Any], columns: List[str]) -> Dict[str, List[Any]]:
+    """Pivot result rows into one list per column (compresses far better than rows)"""
+    return {name: [_encode(getattr(row, name)) for row in rows] for name in columns}
+
+
+@lru_cache(maxsize=32)
+def _load_segment(path: str) -> Dict[str, Any]:
+    # Segments are immutable once written, so decoded copies can be cached
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+class ArchiveConflict(Exception):
+    """A batch changed underneath the archiver and was rolled back"""
+
+
+class PaymentArchiver:
+    """Moves terminal payments out of the hot tables into monthly gzip segments.
+
+    Successful payments are archived once older than the cutoff. Failed and
+    cancelled ones must also have been left alone for ``settlement_days``,
+    as Paystack can still report them paid and the webhook only settles
+    payments in the hot table. Every batch is written to disk first and then removed from ``payments`` and
+    ``payment_logs`` in one short transaction, together with the
+    ``archived_payments`` index rows used for lookups. Ledger entries and
+    recurring schedules keep the payment id, which stays valid there. A crash
+    between the two steps leaves the rows in the hot table; the next run
+    selects the same ids and rewrites the same segment file, so runs are
+    resumable.
+    """
+
+    def __init__(
+        self,
+        archive_dir: Optional[str] = None,
+        older_than_days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        settlement_days: Optional[int] = None
+    ):
+        self.archive_dir = archive_dir or settings.ARCHIVE_DIR
+        self.older_than_days = older_than_days if older_than_days is not None else settings.ARCHIVE_AFTER_DAYS
+        self.batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        self.settlement_days = settlement_days if settlement_days is not None else settings.ARCHIVE_SETTLEMENT_DAYS
+
+    def cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(days=self.older_than_days)
+
+    def settled_before(self) -> datetime:
+        """Failed and cancelled payments last changed before this are past settlement"""
+        return datetime.utcnow() - timedelta(days=self.settlement_days)
+
+    def run(self, db: Session, max_batches: Optional[int] = None) -> Dict[str, int]:
+        """Archive batches until nothing old enough is left"""
+
+        archived = 0
+        batches = 0
+        conflict = None
+        while max_batches is None or batches < max_batches:
+            try:
+                count = self.archive_batch(db)
+            except ArchiveConflict as e:
+                # Leave the conflicting rows for the next run instead of spinning on them
+                conflict = str(e)
+                break
+            if count == 0:
+                break
+            archived += count
+            batches += 1
+
+        return {"archived": archived, "batches": batches, "conflict": conflict}
+
+    def archive_batch(self, db: Session) -> int:
+        """Archive a single chunk of settled payments, oldest id first"""
+
+        payments = db.execute(
+            select(Payment.__table__)
+            .where(
+                Payment.created_at < self.cutoff(),
+                or_(
+                    Payment.status == PaymentStatus.SUCCESS,
+                    and_(
+                        Payment.status.in_(UNSETTLED_STATUSES),
+                        func.coalesce(Payment.updated_at, Payment.created_at) < self.settled_before()
+                    )
+                )
+            )
+            .order_by(Payment.id)
+            .limit(self.batch_size)
+        ).all()
+        if not payments:
+            return 0
+
+        ids = [payment.id for payment in payments]
+        logs = db.execute(
+            select(PaymentLog.__table__)
+            .where(PaymentLog.payment_id.in_(ids))
+            .order_by(PaymentLog.id)
+        ).all()
+
+        index_rows = []
+        for partition, rows in self._partition(payments).items():
+            segment = f"{rows[0].id:012d}-{rows[-1].id:012d}.json.gz"
+            row_ids = {row.id for row in rows}
+            self._write_segment(partition, segment, {
+                "payments": _to_columns(rows, PAYMENT_COLUMNS),
+                "payment_logs": _to_columns(
+                    [log for log in logs if log.payment_id in row_ids], LOG_COLUMNS
+                ),
+            })
+            index_rows.extend(
+                {"id": row.id, "reference": row.reference, "partition": partition, "segment": segment}
+                for row in rows
+            )
+
+        try:
+            db.execute(insert(ArchivedPayment.__table__), index_rows)
+            db.execute(delete(PaymentLog.__table__).where(PaymentLog.payment_id.in_(ids)))
+            # Only the versions that were written out; a payment moved since then stays
+            result = db.execute(
+                delete(Payment.__table__).where(
+                    tuple_(Payment.id, Payment.version).in_([(payment.id, payment.version) for payment in payments]),
+                    Payment.status.in_(TERMINAL_STATUSES)
+                )
+            )
+            if result.rowcount != len(ids):
+                raise ArchiveConflict(f"{len(ids) - result.rowcount} payments changed during archival")
+            db.commit()
+        except IntegrityError as e:
+            # Another archiver indexed the batch first; its transaction takes the rows out
+            db.rollback()
+            raise ArchiveConflict(f"payments {ids[0]}-{ids[-1]} were already archived by another run") from e
+        except Exception:
+            db.rollback()
+            raise
+
+        return len(ids)
+
+    def _partition(self, payments: List[Any]) -> Dict[str, List[Any]]:
+        partitions: Dict[str, List[Any]] = {}
+        for payment in payments:
+            created_at = payment.created_at or datetime.utcnow()
+            partitions.setdefault(created_at.strftime("%Y-%m"), []).append(payment)
+        return partitions
+
+    def _write_segment(self, partition: str, segment: str, data: Dict[str, Any]) -> None:
+        directory = os.path.join(self.archive_dir, partition)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, segment)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as handle:
+            json.dump(data, handle, separators=(",", ":"))
+        # Atomic rename so readers never see a half-written segment
+        os.replace(tmp_path, path)
+        _load_segment.cache_clear()
+
+    def segment_path(self, entry: ArchivedPayment) -> str:
+        return os.path.join(self.archive_dir, entry.partition, entry.segment)
+
+
+def find_archived_payment(
+    db: Session,
+    payment_id: Optional[int] = None,
+    reference: Optional[str] = None,
+    archive_dir: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Look up an archived payment by id or reference, returning it as a dict"""
+
+    query = db.query(ArchivedPayment)
+    if payment_id is not None:
+        entry = query.filter(ArchivedPayment.id == payment_id).first()
+    elif reference is not None:
+        entry = query.filter(ArchivedPayment.reference == reference).first()
+    else:
+        return None
+    if entry is None:
+        return None
+
+    path = PaymentArchiver(archive_dir=archive_dir).segment_path(entry)
+    try:
+        columns = _load_segment(path)["payments"]
+    except FileNotFoundError:
+        return None
+    position = columns["id"].index(entry.id)
+    return {name: values[position] for name, values in columns.items()}
+
+
+def archived_through(db: Session, archive_dir: Optional[str] = None) -> Optional[datetime]:
+    """Latest status change (processed, else updated, else created) among archived payments.
+
+    None when nothing is archived. Reads every segment, so it is meant for
+    offline tools such as the analytics backfill.
+    """
+    archiver = PaymentArchiver(archive_dir=archive_dir)
+    latest = None
+    for partition, segment in db.query(ArchivedPayment.partition, ArchivedPayment.segment).distinct():
+        try:
+            columns = _load_segment(os.path.join(archiver.archive_dir, partition, segment))["payments"]
+        except FileNotFoundError:
+            continue
+        for values in zip(columns["processed_at"], columns["updated_at"], columns["created_at"]):
+            occurred_at = next((value for value in values if value), None)
+            if occurred_at is None:
+                continue
+            occurred_at = datetime.fromisoformat(occurred_at)
+            if occurred_at.tzinfo is not None:
+                occurred_at = occurred_at.astimezone(timezone.utc).replace(tzinfo=None)
+            latest = occurred_at if latest is None else max(latest, occurred_at)
+    return latest
@@ -0,0 +1,111 @@
+from typing import Any, Dict, List, Optional
+
+from core.cache import cache, cached
+from core.config import settings
+from database_simple import SessionLocal
+from models.models import Collection, CollectionStatus
+from schemas.collection import CollectionResponse
+from services.collection_summary import load_summaries
+
+# Tags: LISTINGS covers every cached page of collections, collection:<id> one collection's entries
+LISTINGS = "collections"
+
+
+def _tag(collection_id: int) -> str:
+    return f"collection:{collection_id}"
+
+
+# Loaders own their session: background refreshes outlive the request that started them
+
+@cached(
+    "collections:public:{skip}:{limit}",
+    ttl=settings.COLLECTION_CACHE_TTL_SECONDS,
+    tags=[LISTINGS],
+    stale_ttl=settings.COLLECTION_CACHE_STALE_SECONDS
+)
+def get_public_collections(skip: int, limit: int) -> List[Dict[str, Any]]:
+    """Cached public collection listing"""
+    db = SessionLocal()
+    try:
+        collections = db.query(Collection).filter(
+            Collection.is_public == True,
+            Collection.status == CollectionStatus.ACTIVE
+        ).offset(skip).limit(limit).all()
+        return [CollectionResponse.model_validate(c).model_dump() for c in collections]
+    finally:
+        db.close()
+
+
+@cached(
+    "collection:{collection_id}",
+    ttl=settings.COLLECTION_CACHE_TTL_SECONDS,
+    tags=["collection:{collection_id}"],
+    stale_ttl=settings.COLLECTION_CACHE_STALE_SECONDS
+)
+def get_cached_collection(collection_id: int) -> Optional[Dict[str, Any]]:
+    """Cached single collection, None if it does not exist"""
+    db = SessionLocal()
+    try:
+        collection = db.query(Collection).filter(Collection.id == collection_id).first()
+        return CollectionResponse.model_validate(collection).model_dump() if collection else None
+    finally:
+        db.close()
+
+
+def _load_collections(collection_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+    db = SessionLocal()
+    try:
+        collections = db.query(Collection).filter(Collection.id.in_(collection_ids)).all()
+        found = {c.id: CollectionResponse.model_validate(c).model_dump() for c in collections}
+        return {collection_id: found.get(collection_id) for collection_id in collection_ids}
+    finally:
+        db.close()
+
+
+async def get_cached_collections(collection_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+    """Cached details for several collections; misses are loaded in one query"""
+    # Same keys as get_cached_collection, so either fills the cache for the other
+    keys = {f"collection:{collection_id}": collection_id for collection_id in collection_ids}
+    values = await cache.get_many(
+        list(keys),
+        lambda missing: {
+            f"collection:{collection_id}": detail
+            for collection_id, detail in _load_collections([keys[key] for key in missing]).items()
+        },
+        ttl=settings.COLLECTION_CACHE_TTL_SECONDS,
+        tags=lambda key: [_tag(keys[key])]
+    )
+    return {keys[key]: value for key, value in values.items()}
+
+
+def _load_summaries(collection_ids: List[int], recent: int) -> Dict[int, Optional[Dict[str, Any]]]:
+    db = SessionLocal()
+    try:
+        return load_summaries(db, collection_ids, recent)
+    finally:
+        db.close()
+
+
+async def get_collection_summaries(collection_ids: List[int], recent: int) -> Dict[int, Optional[Dict[str, Any]]]:
+    """Cached contribution summaries; misses are loaded together in one query"""
+    keys = {f"collection:{collection_id}:summary:{recent}": collection_id for collection_id in collection_ids}
+    values = await cache.get_many(
+        list(keys),
+        lambda missing: {
+            f"collection:{collection_id}:summary:{recent}": summary
+            for collection_id, summary in _load_summaries([keys[key] for key in missing], recent).items()
+        },
+        ttl=settings.COLLECTION_CACHE_TTL_SECONDS,
+        tags=lambda key: [_tag(keys[key])]
+    )
+    return {keys[key]: value for key, value in values.items()}
+
+
+async def invalidate_collection(collection_id: Optional[int] = None) -> None:
+    """Drop a collection's cached detail and summaries and every cached listing, in every worker"""
+    await cache.invalidate(LISTINGS, *([_tag(collection_id)] if collection_id is not None else []))
+
+
+async def invalidate_collections(collection_ids: List[int]) -> None:
+    """Bulk form of invalidate_collection, one broadcast"""
+    await cache.invalidate(LISTINGS, *(_tag(collection_id) for collection_id in set(collection_ids)))
@@ -0,0 +1,94 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models.models import Collection, Payment, PaymentStatus
+
+
+def load_summaries(db: Session, collection_ids: Iterable[int], recent: int = 5) -> Dict[int, Dict[str, Any]]:
+    """Contribution aggregates and the latest ``recent`` contributions per collection.
+
+    One statement for any number of collections: a grouped subquery for the
+    totals and a row_number() window for the recent contributions, both
+    outer-joined to the collections so ones without payments still appear.
+    Unknown ids are absent from the result. ``is_public`` and ``created_by``
+    are included for the caller's visibility check, not for display.
+    """
+    ids = sorted(set(collection_ids))
+    if not ids:
+        return {}
+
+    succeeded = (Payment.status == PaymentStatus.SUCCESS) & Payment.collection_id.in_(ids)
+    totals = select(
+        Payment.collection_id,
+        func.count(Payment.id).label("contribution_count"),
+        func.count(func.distinct(Payment.customer_email)).label("contributor_count"),
+        func.sum(Payment.amount).label("total_amount"),
+        func.max(Payment.processed_at).label("last_contribution_at")
+    ).where(succeeded).group_by(Payment.collection_id).subquery()
+
+    columns = [
+        Collection.id,
+        Collection.title,
+        Collection.target_amount,
+        Collection.current_amount,
+        Collection.is_public,
+        Collection.created_by,
+        totals.c.contribution_count,
+        totals.c.contributor_count,
+        totals.c.total_amount,
+        totals.c.last_contribution_at,
+    ]
+    query = db.query(*columns).outerjoin(totals, totals.c.collection_id == Collection.id)
+
+    if recent > 0:
+        ranked = select(
+            Payment.collection_id,
+            Payment.id,
+            Payment.amount,
+            Payment.customer_name,
+            Payment.processed_at,
+            func.row_number().over(
+                partition_by=Payment.collection_id,
+                order_by=(Payment.processed_at.desc(), Payment.id.desc())
+            ).label("position")
+        ).where(succeeded).subquery()
+        query = query.add_columns(
+            ranked.c.id.label("payment_id"), ranked.c.amount, ranked.c.customer_name, ranked.c.processed_at
+        ).outerjoin(
+            ranked, (ranked.c.collection_id == Collection.id) & (ranked.c.position <= recent)
+        ).order_by(Collection.id, ranked.c.position)
+
+    summaries: Dict[int, Dict[str, Any]] = {}
+    for row in query.filter(Collection.id.in_(ids)).all():
+        summary = summaries.get(row.id)
+        if summary is None:
+            count = row.contribution_count or 0
+            total = Decimal(row.total_amount or 0)
+            target = float(row.target_amount) if row.target_amount else None
+            current = float(row.current_amount or 0)
+            summary = summaries[row.id] = {
+                "collection_id": row.id,
+                "title": row.title,
+                "is_public": bool(row.is_public),
+                "created_by": row.created_by,
+                "target_amount": target,
+                "current_amount": current,
+                "progress_percent": round(current / target * 100, 2) if target else None,
+                "contribution_count": count,
+                "contributor_count": row.contributor_count or 0,
+                "total_amount": float(total),
+                "average_amount": float(round(total / count, 2)) if count else 0.0,
+                "last_contribution_at": row.last_contribution_at,
+                "recent_contributions": [],
+            }
+        # No payment references: they would open verify and the status streams to anyone
+        if recent > 0 and row.payment_id is not None:
+            summary["recent_contributions"].append({
+                "amount": float(row.amount),
+                "customer_name": row.customer_name,
+                "processed_at": row.processed_at,
+            })
+    return summaries
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.models import IdempotencyRecord
+from core.config import settings
+
+POLL_INTERVAL_SECONDS = 0.1
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: Any
+    expires_at: datetime
+
+
+class CommittedError(HTTPException):
+    """An error raised after a request's effects were committed or sent.
+
+    Releasing the key would let a retry repeat them (a second payment, a
+    second charge), so the store keeps the key and replays this response.
+    Without an Idempotency-Key it is an ordinary HTTPException.
+    """
+
+
+def fingerprint(payload: BaseModel) -> str:
+    """Stable hash of a request body, to reject keys reused for a different request"""
+    canonical = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """Idempotency-Key handling: LRU memory front, DB backing, TTL eviction.
+
+    Within a worker, concurrent requests with the same key await the first
+    one's future. Across workers, the first request claims the key by
+    inserting a pending row; others poll that row until the response is stored.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_entries: int,
+        lock_seconds: float,
+        wait_seconds: float
+    ):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self.lock = timedelta(seconds=lock_seconds)
+        self.wait_seconds = wait_seconds
+        self._memory: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def run(
+        self,
+        db: Session,
+        endpoint: str,
+        client_key: str,
+        payload: BaseModel,
+        handler: Callable[[], Awaitable[Any]],
+        before_claim: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> JSONResponse:
+        """Replay the stored response for this key, or claim the key and run ``handler``.
+
+        ``before_claim`` runs only for requests that are neither a replay nor
+        waiting on one in this worker, before the key is written; if it
+        raises, nothing is stored and the key stays free.
+        """
+        key = f"{endpoint}:{client_key}"
+        request_hash = fingerprint(payload)
+
+        stored = self._lookup(db, key)
+        if stored is not None:
+            return self._replay(stored, request_hash)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Same worker, same key: share the first request's outcome (or error)
+            return self._replay(await asyncio.shield(inflight), request_hash)
+
+        if before_claim is not None:
+            await before_claim()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            stored, replayed = await self._execute(db, key, request_hash, handler)
+        except Exception as exc:
+            future.set_exception(exc)
+            # Waiters re-raise it; mark it retrieved so the loop does not warn when there are none
+            future.exception()
+            raise
+        else:
+            future.set_result(stored)
+        finally:
+            self._inflight.pop(key, None)
+
+        if replayed:
+            return self._replay(stored, request_hash)
+        return JSONResponse(content=stored.body, status_code=stored.status_code)
+
+    async def _execute(
+        self,
+        db: Session,
+        key: str,
+        request_hash: str,
+        handler: Callable[[], Awaitable[Any]]
+    ) -> Tuple[StoredResponse, bool]:
+        deadline = time.monotonic() + self.wait_seconds
+        while not self._claim(db, key, request_hash):
+            # Another worker owns the key; wait for it to store its response
+            stored = self._lookup(db, key)
+            if stored is not None:
+                return stored, True
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still being processed"
+                )
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+        try:
+            result = await handler()
+        except CommittedError as e:
+            db.rollback()
+            stored = StoredResponse(
+                request_hash, e.status_code, jsonable_encoder({"detail": e.detail}), datetime.utcnow() + self.ttl
+            )
+            self._complete(db, key, stored)
+            return stored, False
+        except Exception:
+            # Requests that failed before doing anything are not stored, so the client can retry with the same key
+            self._release(db, key)
+            raise
+
+        stored = StoredResponse(
+            request_hash, status.HTTP_200_OK, jsonable_encoder(result), datetime.utcnow() + self.ttl
+        )
+        self._complete(db, key, stored)
+        return stored, False
+
+    def _replay(self, stored: StoredResponse, request_hash: str) -> JSONResponse:
+        if stored.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different request"
+            )
+        return JSONResponse(
+            content=stored.body,
+            status_code=stored.status_code,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    def _remember(self, key: str, stored: StoredResponse) -> None:
+        self._memory[key] = stored
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, db: Session, key: str) -> Optional[StoredResponse]:
+        now = datetime.utcnow()
+        stored = self._memory.get(key)
+        if stored is not None:
+            if stored.expires_at > now:
+                self._memory.move_to_end(key)
+                return stored
+            del self._memory[key]
+
+        db.expire_all()
+        record = db.query(IdempotencyRecord).filter(IdempotencyRecord.key == key).first()
+        if record is None or record.status_code is None or record.expires_at <= now:
+            return None
+        stored = StoredResponse(
+            record.request_hash, record.status_code, json.loads(record.response_body), record.expires_at
+        )
+        self._remember(key, stored)
+        return stored
+
+    def _claim(self, db: Session, key: str, request_hash: str) -> bool:
+        now = datetime.utcnow()
+        db.add(IdempotencyRecord(
+            key=key, request_hash=request_hash, created_at=now, expires_at=now + self.ttl
+        ))
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+
+        # Take over rows that expired or whose owner died mid-request
+        abandoned = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.key == key,
+            (IdempotencyRecord.expires_at <= now)
+            | (IdempotencyRecord.status_code.is_(None) & (IdempotencyRecord.created_at < now - self.lock))
+        ).delete(synchronize_session=False)
+        db.commit()
+        if abandoned:
+            return self._claim(db, key, request_hash)
+        return False
+
+    def _complete(self, db: Session, key: str, stored: StoredResponse) -> None:
+        db.query(IdempotencyRecord).filter(IdempotencyRecord.key == key).update({
+            "status_code": stored.status_code,
+            "response_body": json.dumps(stored.body),
+            "expires_at": stored.expires_at,
+        }, synchronize_session=False)
+        db.commit()
+        self._remember(key, stored)
+
+    def _release(self, db: Session, key: str) -> None:
+        db.rollback()
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.key == key,
+            IdempotencyRecord.status_code.is_(None)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    def purge_expired(self, db: Session) -> int:
+        """Delete expired records; memory entries expire lazily on lookup"""
+        deleted = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    lock_seconds=settings.IDEMPOTENCY_LOCK_SECONDS,
+    wait_seconds=settings.IDEMPOTENCY_WAIT_SECONDS
+)
@@ -0,0 +1,42 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.models import JobLease
+
+# Unique per process, so two workers on the same host never share a lease
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(db: Session, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+    """Take or renew the named lease; False if another worker holds an unexpired one"""
+
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    renewed = db.query(JobLease).filter(
+        JobLease.name == name,
+        (JobLease.owner == owner) | (JobLease.expires_at < now)
+    ).update({"owner": owner, "expires_at": expires_at}, synchronize_session=False)
+    if renewed:
+        db.commit()
+        return True
+
+    db.add(JobLease(name=name, owner=owner, expires_at=expires_at))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+def release_lease(db: Session, name: str, owner: str = WORKER_ID) -> None:
+    db.query(JobLease).filter(
+        JobLease.name == name,
+        JobLease.owner == owner
+    ).update({"expires_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
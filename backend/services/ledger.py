@@ -0,0 +1,249 @@
+import asyncio
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Union
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session, aliased
+from starlette.concurrency import run_in_threadpool
+
+from database_simple import SessionLocal
+from models.models import Collection, LedgerEntry, BalanceSnapshot
+from core.config import settings
+from services.leases import acquire_lease, release_lease, WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+Amount = Union[Decimal, float, int, str]
+
+COMPACTOR_LEASE = "ledger_compactor"
+
+
+def _decimal(amount: Amount) -> Decimal:
+    # str() first so floats from query params become 100.1, not 100.0999999...
+    return amount if isinstance(amount, Decimal) else Decimal(str(amount))
+
+
+def post_entry(
+    db: Session,
+    collection: Collection,
+    amount: Amount,
+    source: str,
+    payment_id: Optional[int] = None,
+    note: Optional[str] = None
+) -> LedgerEntry:
+    """Append a credit (positive) or debit (negative) in the caller's transaction.
+
+    ``Collection.current_amount`` is kept as a denormalised copy of the balance
+    so existing readers keep working; the ledger is the source of truth. It is
+    incremented in SQL, so concurrent credits to one collection all land; the
+    attribute reloads on next access.
+    """
+    amount = _decimal(amount)
+    entry = LedgerEntry(
+        collection_id=collection.id,
+        amount=amount,
+        source=source,
+        payment_id=payment_id,
+        note=note,
+        created_at=datetime.utcnow()
+    )
+    db.add(entry)
+    # Write any balance the caller has just assigned before adding to it
+    db.flush()
+    db.execute(
+        update(Collection).where(Collection.id == collection.id).values(
+            current_amount=func.coalesce(Collection.current_amount, 0) + amount,
+            updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+    db.expire(collection, ["current_amount", "updated_at"])
+    return entry
+
+
+def set_balance(db: Session, collection: Collection, new_balance: Amount, source: str) -> Optional[LedgerEntry]:
+    """Record an overwrite of the balance as an adjusting entry for the difference.
+
+    The column and the ledger are levelled first, as ``reconcile(repair=True)``
+    would, so both end at ``new_balance``.
+    """
+    ledger_balance = balance(db, collection.id)
+    current = _decimal(collection.current_amount or 0)
+    if current != ledger_balance:
+        unledgered = db.query(LedgerEntry.id).filter(LedgerEntry.collection_id == collection.id).first() is None
+        collection.current_amount = ledger_balance
+        if unledgered:
+            # Balances from before the ledger existed become its opening entry
+            post_entry(db, collection, current, "opening_balance")
+            ledger_balance = current
+    delta = _decimal(new_balance) - ledger_balance
+    if delta == 0:
+        return None
+    return post_entry(db, collection, delta, source, note=f"balance set to {new_balance}")
+
+
+def _latest_snapshot(db: Session, collection_id: int, at: Optional[datetime] = None) -> Optional[BalanceSnapshot]:
+    query = db.query(BalanceSnapshot).filter(BalanceSnapshot.collection_id == collection_id)
+    if at is not None:
+        query = query.filter(BalanceSnapshot.as_of <= at)
+    return query.order_by(BalanceSnapshot.last_entry_id.desc()).first()
+
+
+def balance(db: Session, collection_id: int, at: Optional[datetime] = None) -> Decimal:
+    """Balance now, or as of ``at``: latest snapshot plus the ledger tail after it"""
+    snapshot = _latest_snapshot(db, collection_id, at)
+    tail = db.query(func.coalesce(func.sum(LedgerEntry.amount), 0)).filter(
+        LedgerEntry.collection_id == collection_id,
+        LedgerEntry.id > (snapshot.last_entry_id if snapshot else 0)
+    )
+    if at is not None:
+        tail = tail.filter(LedgerEntry.created_at <= at)
+    return (snapshot.balance if snapshot else Decimal("0")) + _decimal(tail.scalar())
+
+
+def compact(db: Session, min_tail: Optional[int] = None) -> int:
+    """Snapshot every collection whose ledger tail has reached ``min_tail`` entries.
+
+    One grouped query finds the tails and their sums on top of each
+    collection's latest snapshot, so compaction cost does not grow with the
+    number of collections that need no work.
+    """
+    min_tail = min_tail or settings.LEDGER_SNAPSHOT_EVERY
+    latest = db.query(
+        BalanceSnapshot.collection_id,
+        func.max(BalanceSnapshot.last_entry_id).label("last_entry_id")
+    ).group_by(BalanceSnapshot.collection_id).subquery()
+    base = aliased(BalanceSnapshot)
+
+    tails = db.query(
+        LedgerEntry.collection_id,
+        func.max(LedgerEntry.id),
+        func.max(LedgerEntry.created_at),
+        func.sum(LedgerEntry.amount),
+        func.max(func.coalesce(base.balance, 0))
+    ).outerjoin(
+        latest, latest.c.collection_id == LedgerEntry.collection_id
+    ).outerjoin(
+        base, (base.collection_id == latest.c.collection_id) & (base.last_entry_id == latest.c.last_entry_id)
+    ).filter(
+        LedgerEntry.id > func.coalesce(latest.c.last_entry_id, 0)
+    ).group_by(LedgerEntry.collection_id).having(func.count(LedgerEntry.id) >= min_tail).all()
+
+    snapshots = [
+        {
+            "collection_id": collection_id,
+            "balance": _decimal(base_balance) + _decimal(tail_sum),
+            "last_entry_id": last_entry_id,
+            "as_of": as_of,
+            "created_at": datetime.utcnow(),
+        }
+        for collection_id, last_entry_id, as_of, tail_sum, base_balance in tails
+    ]
+    if snapshots:
+        db.execute(insert(BalanceSnapshot.__table__), snapshots)
+    db.commit()
+    return len(snapshots)
+
+
+class LedgerCompactor:
+    """Runs ``compact`` every ``interval_seconds`` on one worker at a time.
+
+    A DB lease elects the worker, as for the expiry sweeper; a compaction
+    running twice would only write an extra snapshot.
+    """
+
+    def __init__(self, interval_seconds: float, owner: str = WORKER_ID):
+        self.interval_seconds = interval_seconds
+        self.owner = owner
+        self.metrics = {"runs": 0, "skipped": 0, "snapshots": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def compact(self) -> Optional[int]:
+        """One pass; None if another worker holds the lease"""
+        db = SessionLocal()
+        try:
+            if not acquire_lease(db, COMPACTOR_LEASE, max(self.interval_seconds * 3, 60), self.owner):
+                self.metrics["skipped"] += 1
+                return None
+            written = compact(db)
+            self.metrics["runs"] += 1
+            self.metrics["snapshots"] += written
+            return written
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                written = await run_in_threadpool(self.compact)
+                if written:
+                    logger.info("Wrote %d balance snapshots", written)
+            except Exception as e:
+                logger.exception("Ledger compaction failed: %s", e)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        db = SessionLocal()
+        try:
+            release_lease(db, COMPACTOR_LEASE, self.owner)
+        finally:
+            db.close()
+
+
+def verify(db: Session, repair: bool = False) -> List[Dict[str, Any]]:
+    """Recompute every balance from the full ledger in one grouped pass.
+
+    Returns collections whose ``current_amount`` disagrees with the ledger. With
+    ``repair``, unledgered balances get an opening entry and the rest are reset
+    to the ledger total.
+    """
+    totals = dict(
+        db.query(LedgerEntry.collection_id, func.sum(LedgerEntry.amount))
+        .group_by(LedgerEntry.collection_id)
+        .all()
+    )
+
+    mismatches = []
+    for collection_id, current_amount in db.query(Collection.id, Collection.current_amount).yield_per(1000):
+        ledger_total = _decimal(totals.get(collection_id, 0))
+        current = _decimal(current_amount or 0)
+        if ledger_total == current:
+            continue
+        mismatches.append({
+            "collection_id": collection_id,
+            "current_amount": current,
+            "ledger_balance": ledger_total,
+            "unledgered": collection_id not in totals,
+        })
+
+    if repair and mismatches:
+        for mismatch in mismatches:
+            collection = db.query(Collection).filter(Collection.id == mismatch["collection_id"]).first()
+            if mismatch["unledgered"]:
+                # Balances from before the ledger existed become its opening entry
+                collection.current_amount = Decimal("0")
+                post_entry(db, collection, mismatch["current_amount"], "opening_balance")
+            else:
+                collection.current_amount = mismatch["ledger_balance"]
+        db.commit()
+
+    return mismatches
+
+
+ledger_compactor = LedgerCompactor(interval_seconds=settings.LEDGER_COMPACT_INTERVAL_SECONDS)
@@ -0,0 +1,438 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import secrets
+import socket
+import ssl
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from database_simple import SessionLocal
+from models.models import Collection, NotificationEndpoint, NotificationOutbox, OutboxStatus, Payment
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-AgaPay-Signature"
+
+
+def generate_secret() -> str:
+    return f"whsec_{secrets.token_hex(24)}"
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    """Signature header value: HMAC-SHA256 of "<timestamp>.<body>" keyed by the endpoint secret"""
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256)
+    return f"t={timestamp},v1={digest.hexdigest()}"
+
+
+def verify_signature(secret: str, header: str, body: bytes, tolerance_seconds: int = 300) -> bool:
+    """Receiver-side check, shared with notification_sink.py"""
+    try:
+        parts = dict(part.split("=", 1) for part in header.split(","))
+        timestamp = int(parts["t"])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance_seconds:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), header)
+
+
+def _allowed_host(host: str) -> bool:
+    return host.lower() in {allowed.lower() for allowed in settings.NOTIFICATION_ALLOWED_HOSTS}
+
+
+async def _public_addresses(host: str, port: int) -> List[str]:
+    """Every address ``host`` resolves to; ValueError unless all of them are public"""
+    try:
+        resolved = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Callback host {host} does not resolve") from e
+    addresses = []
+    for *_, sockaddr in resolved:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Callback host {host} resolves to a non-public address")
+        if str(address) not in addresses:
+            addresses.append(str(address))
+    return addresses
+
+
+async def check_callback_url(url: str) -> None:
+    """Raise ValueError unless every address ``url``'s host resolves to is public.
+
+    Callbacks are signed POSTs sent from inside our network, so they must not
+    reach loopback, private, link-local (cloud metadata) or reserved hosts.
+    Checked when the URL is set; sends are held to the same rule by
+    ``PublicAddressBackend``, as DNS can change in between. Hosts in
+    NOTIFICATION_ALLOWED_HOSTS are exempt.
+    """
+    parts = urlsplit(url)
+    host = parts.hostname
+    if parts.scheme not in ("http", "https") or not host:
+        raise ValueError("Callback URL must be an http:// or https:// URL with a host")
+    if not _allowed_host(host):
+        await _public_addresses(host, parts.port or (443 if parts.scheme == "https" else 80))
+
+
+class PublicAddressBackend(httpcore.AsyncNetworkBackend):
+    """Resolves callback hosts itself and connects only to the public addresses it checked.
+
+    Checking a name and then letting the client resolve it again would let a
+    host answer with a public address for the check and a private one for the
+    connection (DNS rebinding). TLS still verifies the certificate against,
+    and sends SNI for, the host name from the URL.
+    """
+
+    def __init__(self):
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[Any]] = None
+    ) -> httpcore.AsyncNetworkStream:
+        addresses = [host] if _allowed_host(host) else await _public_addresses(host, port)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options=None):
+        raise httpcore.ConnectError("Callbacks are only sent over TCP")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class PublicAddressTransport(httpx.AsyncHTTPTransport):
+    """httpx transport whose connections go through ``PublicAddressBackend``"""
+
+    def __init__(self, limits: httpx.Limits):
+        super().__init__(limits=limits, trust_env=False)
+        # httpx has no option for the network backend, so the pool is built here with the same limits
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=ssl.create_default_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=PublicAddressBackend()
+        )
+
+
+def enqueue_event(db: Session, user_id: int, event_type: str, data: Dict[str, Any]) -> Optional[NotificationOutbox]:
+    """Queue an event for the user's endpoint in the caller's transaction; None if they have none"""
+    endpoint = db.query(NotificationEndpoint).filter(
+        NotificationEndpoint.user_id == user_id,
+        NotificationEndpoint.is_active == True
+    ).first()
+    if endpoint is None:
+        return None
+
+    now = datetime.utcnow()
+    event = {
+        "id": f"evt_{uuid.uuid4().hex}",
+        "type": event_type,
+        "created_at": now.isoformat(),
+        "data": data,
+    }
+    row = NotificationOutbox(
+        endpoint_id=endpoint.id,
+        event_type=event_type,
+        payload=json.dumps(event),
+        next_attempt_at=now,
+        created_at=now
+    )
+    db.add(row)
+    return row
+
+
+def enqueue_payment_succeeded(db: Session, payment: Payment, collection: Collection) -> Optional[NotificationOutbox]:
+    return enqueue_event(db, collection.created_by, "payment.succeeded", {
+        "reference": payment.reference,
+        "amount": str(payment.amount),
+        "currency": payment.currency,
+        "payment_method": payment.payment_method.value,
+        "customer_name": payment.customer_name,
+        "collection_id": collection.id,
+        "collection_title": collection.title,
+        "processed_at": payment.processed_at.isoformat() if payment.processed_at else None,
+    })
+
+
+class Destination(NamedTuple):
+    endpoint_id: int
+    url: str
+    secret: Optional[str]
+
+
+class NotificationDispatcher:
+    """Delivers outbox events to merchant endpoints as signed, batched callbacks.
+
+    Each pass claims due rows by pushing their next_attempt_at past a lock
+    window, so several workers can dispatch without sending an event twice.
+    Claimed events are grouped per endpoint and posted in batches over one
+    shared keep-alive client, bounded both globally and per endpoint.
+    Failures are retried with exponential backoff and jitter.
+    """
+
+    def __init__(
+        self,
+        claim_size: int,
+        batch_size: int,
+        workers: int,
+        per_destination: int,
+        timeout_seconds: float,
+        lock_seconds: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float,
+        poll_seconds: float
+    ):
+        self.claim_size = claim_size
+        self.batch_size = batch_size
+        self.workers = workers
+        self.per_destination = per_destination
+        self.timeout_seconds = timeout_seconds
+        self.lock = timedelta(seconds=lock_seconds)
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_seconds = poll_seconds
+        self.metrics = {"delivered": 0, "retried": 0, "failed": 0, "requests": 0, "blocked": 0}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._destination_slots: Dict[int, asyncio.Semaphore] = {}
+        self._destination_users: Dict[int, int] = defaultdict(int)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _claim(self) -> Dict[Destination, List[Tuple[int, int, str]]]:
+        """Lock a page of due rows for this worker, grouped by endpoint"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            due = select(NotificationOutbox.id).where(
+                NotificationOutbox.status == OutboxStatus.PENDING,
+                NotificationOutbox.next_attempt_at <= now
+            ).order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id).limit(
+                self.claim_size
+            ).with_for_update(skip_locked=True)
+            claimed = db.execute(
+                update(NotificationOutbox).where(
+                    NotificationOutbox.id.in_(due.scalar_subquery()),
+                    NotificationOutbox.status == OutboxStatus.PENDING,
+                    NotificationOutbox.next_attempt_at <= now
+                ).values(next_attempt_at=now + self.lock).returning(
+                    NotificationOutbox.id, NotificationOutbox.endpoint_id,
+                    NotificationOutbox.attempts, NotificationOutbox.payload
+                )
+            ).all()
+            db.commit()
+            if not claimed:
+                return {}
+
+            endpoints = {
+                endpoint.id: endpoint
+                for endpoint in db.query(NotificationEndpoint).filter(
+                    NotificationEndpoint.id.in_({row.endpoint_id for row in claimed})
+                )
+            }
+            groups: Dict[Destination, List[Tuple[int, int, str]]] = defaultdict(list)
+            for row in sorted(claimed, key=lambda row: row.id):
+                endpoint = endpoints.get(row.endpoint_id)
+                if endpoint is not None and endpoint.is_active:
+                    destination = Destination(endpoint.id, endpoint.url, endpoint.secret)
+                else:
+                    # Endpoint removed or disabled since the event was queued
+                    destination = Destination(row.endpoint_id, "", None)
+                groups[destination].append((row.id, row.attempts, row.payload))
+            return groups
+        finally:
+            db.close()
+
+    async def _post(self, destination: Destination, events: List[str]) -> Optional[str]:
+        """Send one batch; the error message, or None on a 2xx"""
+        if destination.secret is None:
+            return "endpoint disabled"
+
+        body = ('{"events":[' + ",".join(events) + "]}").encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            SIGNATURE_HEADER: sign(destination.secret, int(time.time()), body),
+        }
+        endpoint_id = destination.endpoint_id
+        slots = self._destination_slots.setdefault(endpoint_id, asyncio.Semaphore(self.per_destination))
+        self._destination_users[endpoint_id] += 1
+        try:
+            async with slots, self._slots:
+                self.metrics["requests"] += 1
+                try:
+                    response = await self._client.post(destination.url, content=body, headers=headers)
+                except ValueError as e:
+                    # Refused by PublicAddressBackend, or not a usable URL
+                    self.metrics["blocked"] += 1
+                    return str(e)[:500]
+                except httpx.HTTPError as e:
+                    return f"{type(e).__name__}: {e}"[:500]
+        finally:
+            self._destination_users[endpoint_id] -= 1
+            if not self._destination_users[endpoint_id]:
+                # Only endpoints with requests in flight keep a semaphore
+                del self._destination_users[endpoint_id]
+                del self._destination_slots[endpoint_id]
+        if 200 <= response.status_code < 300:
+            return None
+        return f"HTTP {response.status_code}"
+
+    async def _deliver(self, destination: Destination, rows: List[Tuple[int, int, str]]) -> List[Tuple[int, int, Optional[str]]]:
+        batches = [rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size)]
+        errors = await asyncio.gather(
+            *(self._post(destination, [payload for _, _, payload in batch]) for batch in batches)
+        )
+        return [
+            (outbox_id, attempts, error)
+            for batch, error in zip(batches, errors)
+            for outbox_id, attempts, _ in batch
+        ]
+
+    def _backoff(self, attempts: int) -> timedelta:
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+        # Full jitter on the upper half so retries from one outage spread out
+        return timedelta(seconds=delay / 2 + random.uniform(0, delay / 2))
+
+    def _record(self, outcomes: List[Tuple[int, int, Optional[str]]]) -> None:
+        now = datetime.utcnow()
+        delivered = [outbox_id for outbox_id, _, error in outcomes if error is None]
+        changes = []
+        for outbox_id, attempts, error in outcomes:
+            if error is None:
+                continue
+            attempts += 1
+            if attempts >= self.max_attempts or error == "endpoint disabled":
+                changes.append({
+                    "id": outbox_id, "attempts": attempts, "last_error": error,
+                    "status": OutboxStatus.FAILED, "next_attempt_at": now,
+                })
+                self.metrics["failed"] += 1
+            else:
+                changes.append({
+                    "id": outbox_id, "attempts": attempts, "last_error": error,
+                    "next_attempt_at": now + self._backoff(attempts),
+                })
+                self.metrics["retried"] += 1
+
+        db = SessionLocal()
+        try:
+            if delivered:
+                db.query(NotificationOutbox).filter(NotificationOutbox.id.in_(delivered)).update({
+                    "status": OutboxStatus.DELIVERED,
+                    "delivered_at": now,
+                    "last_error": None,
+                }, synchronize_session=False)
+            if changes:
+                # Bulk UPDATE by primary key, one executemany
+                db.execute(update(NotificationOutbox), changes)
+            db.commit()
+        finally:
+            db.close()
+        self.metrics["delivered"] += len(delivered)
+
+    async def dispatch_once(self) -> int:
+        """Claim and deliver one page of due events; the number claimed"""
+        groups = await run_in_threadpool(self._claim)
+        if not groups:
+            return 0
+        results = await asyncio.gather(
+            *(self._deliver(destination, rows) for destination, rows in groups.items())
+        )
+        outcomes = [outcome for result in results for outcome in result]
+        await run_in_threadpool(self._record, outcomes)
+        return len(outcomes)
+
+    def wake(self) -> None:
+        """Deliver newly committed events now rather than at the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                claimed = await self.dispatch_once()
+            except Exception as e:
+                logger.exception("Notification dispatch failed: %s", e)
+                claimed = 0
+            if claimed >= self.claim_size:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        """Open the shared client and run the dispatch loop in the background"""
+        if self._task is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout_seconds,
+            transport=PublicAddressTransport(
+                httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers)
+            ),
+            # A proxy from the environment would resolve callback hosts itself, unchecked
+            trust_env=False,
+            headers={"User-Agent": "AgaPay-Notifications/1.0"}
+        )
+        self._slots = asyncio.Semaphore(self.workers)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._client.aclose()
+        self._client = None
+
+
+notification_dispatcher = NotificationDispatcher(
+    claim_size=settings.NOTIFICATION_CLAIM_SIZE,
+    batch_size=settings.NOTIFICATION_BATCH_SIZE,
+    workers=settings.NOTIFICATION_WORKERS,
+    per_destination=settings.NOTIFICATION_PER_DESTINATION,
+    timeout_seconds=settings.NOTIFICATION_TIMEOUT_SECONDS,
+    lock_seconds=settings.NOTIFICATION_LOCK_SECONDS,
+    max_attempts=settings.NOTIFICATION_MAX_ATTEMPTS,
+    retry_base_seconds=settings.NOTIFICATION_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.NOTIFICATION_RETRY_MAX_SECONDS,
+    poll_seconds=settings.NOTIFICATION_POLL_SECONDS
+)
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from core.cache.backends import ChannelListener
+from core.config import settings
+from database_simple import SessionLocal
+from models.models import Payment
+from services.payment_state import TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+# Statuses a payment never leaves. A failed or cancelled payment can still
+# succeed late, so streams stay open on those.
+FINAL_STATUSES = {status.value for status, targets in TRANSITIONS.items() if not targets}
+
+
+class Subscription:
+    """A single listener for one payment reference.
+
+    Only the latest event is kept (a listener only needs the current status),
+    and a future is allocated only while the listener is actually waiting, so
+    idle subscriptions cost a few slots rather than a queue each.
+    """
+
+    __slots__ = ("reference", "_pending", "_waiter")
+
+    def __init__(self, reference: str):
+        self.reference = reference
+        self._pending: Optional[Dict[str, Any]] = None
+        self._waiter: Optional[asyncio.Future] = None
+
+    def push(self, event: Dict[str, Any]) -> None:
+        self._pending = event
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the next event, returning None on timeout"""
+        if self._pending is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        event, self._pending = self._pending, None
+        return event
+
+
+class LocalBackend:
+    """Single-process backend; also the stand-in used when Redis is unavailable"""
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    async def start(
+        self,
+        deliver: Callable[[Dict[str, Any]], None],
+        on_reconnect: Optional[Callable[[], None]] = None
+    ) -> None:
+        self._deliver = deliver
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        self._deliver(message)
+
+    async def close(self) -> None:
+        self._deliver = None
+
+
+class RedisBackend:
+    """Fans events out to every worker through a Redis pub/sub channel"""
+
+    def __init__(self, url: str, channel: str):
+        # Imported lazily so redis stays optional for single-worker deployments
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._channel = channel
+        self._listener: Optional[ChannelListener] = None
+
+    async def start(
+        self,
+        deliver: Callable[[Dict[str, Any]], None],
+        on_reconnect: Optional[Callable[[], None]] = None
+    ) -> None:
+        """Listen for events; ``on_reconnect`` runs after a dropped channel is resubscribed"""
+        def receive(data: bytes) -> None:
+            try:
+                deliver(json.loads(data))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Dropping malformed payment event: %r", data)
+
+        self._listener = ChannelListener(self._client, self._channel, receive, on_reconnect)
+        await self._listener.start()
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        # Every worker, including this one, receives it back through _listen
+        await self._client.publish(self._channel, json.dumps(message))
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        await self._client.close()
+
+
+def create_backend():
+    if settings.PAYMENT_EVENTS_BACKEND == "redis":
+        return RedisBackend(settings.REDIS_URL, settings.PAYMENT_EVENTS_CHANNEL)
+    return LocalBackend()
+
+
+class PaymentEventHub:
+    """In-process pub/sub of payment status changes keyed by reference"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalBackend()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._started = False
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._resyncs: Set[asyncio.Task] = set()
+
+    async def _ensure_started(self) -> None:
+        if self._started:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if not self._started:
+                await self.backend.start(self._deliver, on_reconnect=self._resync)
+                self._started = True
+
+    async def subscribe(self, reference: str) -> Subscription:
+        await self._ensure_started()
+        subscription = Subscription(reference)
+        self._subscribers.setdefault(reference, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.reference)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.reference]
+
+    async def publish(self, reference: str, status: str, **data: Any) -> None:
+        """Announce a payment status change to every subscriber of ``reference``"""
+        await self._ensure_started()
+        message = {"reference": reference, "status": status}
+        for key, value in data.items():
+            message[key] = value.isoformat() if isinstance(value, datetime) else value
+        try:
+            await self.backend.publish(message)
+        except Exception as e:
+            # Pushing events is best-effort; clients can still fall back to /verify
+            logger.warning("Failed to publish payment event for %s: %s", reference, e)
+
+    def _deliver(self, message: Dict[str, Any]) -> None:
+        for subscription in tuple(self._subscribers.get(message.get("reference"), ())):
+            subscription.push(message)
+
+    def _current_statuses(self, references: List[str]) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            rows = db.query(Payment.reference, Payment.status, Payment.processed_at).filter(
+                Payment.reference.in_(references)
+            ).all()
+        finally:
+            db.close()
+        return [
+            {
+                "reference": row.reference,
+                "status": row.status.value,
+                "processed_at": row.processed_at.isoformat() if row.processed_at else None
+            }
+            for row in rows
+        ]
+
+    def _resync(self) -> None:
+        """Push the current status of every watched payment, covering events lost while disconnected"""
+        references = list(self._subscribers)
+        if references:
+            task = asyncio.create_task(self._push_current(references))
+            self._resyncs.add(task)
+            task.add_done_callback(self._resyncs.discard)
+
+    async def _push_current(self, references: List[str]) -> None:
+        try:
+            events = await run_in_threadpool(self._current_statuses, references)
+        except Exception as e:
+            logger.warning("Could not resync %d payment streams: %s", len(references), e)
+            return
+        for event in events:
+            self._deliver(event)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def close(self) -> None:
+        if self._started:
+            await self.backend.close()
+            self._started = False
+
+
+payment_events = PaymentEventHub(create_backend())
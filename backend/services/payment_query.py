@@ -0,0 +1,101 @@
+import logging
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+
+from models.models import Payment
+from schemas.payment import PaymentFilter
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Equality filters; each leads a (column, created_at) index in models.Payment.
+# The database's planner picks among them, and slow queries log its EXPLAIN.
+EQUALITY_FILTERS = ("customer_email", "user_id", "collection_id", "payment_method", "status")
+
+SORT_COLUMNS = {
+    "created_at": Payment.created_at,
+    "amount": Payment.amount,
+    "id": Payment.id,
+}
+
+EXPLAIN_PREFIX = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+}
+
+
+class PaymentQuery:
+    """Builds filtered, sorted payment queries over the payments indexes, logging slow ones"""
+
+    def __init__(self, db: Session, filters: PaymentFilter):
+        self.db = db
+        self.filters = filters
+
+    def _apply_filters(self, query: Query) -> Query:
+        f = self.filters
+        for field in EQUALITY_FILTERS:
+            value = getattr(f, field)
+            if value is not None:
+                query = query.filter(getattr(Payment, field) == value)
+        if f.mobile_money_provider is not None:
+            query = query.filter(Payment.mobile_money_provider == f.mobile_money_provider)
+        if f.created_from is not None:
+            query = query.filter(Payment.created_at >= f.created_from)
+        if f.created_to is not None:
+            query = query.filter(Payment.created_at < f.created_to)
+        if f.min_amount is not None:
+            query = query.filter(Payment.amount >= f.min_amount)
+        if f.max_amount is not None:
+            query = query.filter(Payment.amount <= f.max_amount)
+        return query
+
+    def summary(self) -> Tuple[int, Any]:
+        """Count and max(updated_at) of the filtered set, for validators and totals"""
+        query = self._apply_filters(self.db.query(
+            func.count(Payment.id),
+            func.max(func.coalesce(Payment.updated_at, Payment.created_at))
+        ))
+        return self._timed(query, "summary", lambda: query.one())
+
+    def page(self, skip: int = 0, limit: int = 100) -> List[Payment]:
+        descending = self.filters.sort.startswith("-")
+        column = SORT_COLUMNS[self.filters.sort.lstrip("-")]
+        order = [column.desc(), Payment.id.desc()] if descending else [column.asc(), Payment.id.asc()]
+
+        query = self._apply_filters(self.db.query(Payment)).order_by(*order).offset(skip).limit(limit)
+        return self._timed(query, "page", lambda: query.all())
+
+    def _timed(self, query: Query, name: str, run: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        result = run()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms > settings.SLOW_QUERY_MS:
+            self._log_slow_query(query, name, elapsed_ms)
+        return result
+
+    def _log_slow_query(self, query: Query, name: str, elapsed_ms: float) -> None:
+        bind = self.db.get_bind()
+        try:
+            sql = str(query.statement.compile(bind, compile_kwargs={"literal_binds": True}))
+        except Exception:
+            sql = str(query.statement.compile(bind))
+        logger.warning(
+            "Slow payment %s query (%.1fms, filters %s): %s\n%s",
+            name,
+            elapsed_ms,
+            self.filters.model_dump(exclude_none=True),
+            sql,
+            self._explain(sql)
+        )
+
+    def _explain(self, sql: str) -> Optional[str]:
+        prefix = EXPLAIN_PREFIX.get(self.db.get_bind().dialect.name, "EXPLAIN ")
+        try:
+            # Driver-level, so literal timestamps are not mistaken for :bind params
+            rows = self.db.connection().exec_driver_sql(prefix + sql).all()
+        except Exception as e:
+            return f"EXPLAIN unavailable: {e}"
+        return "\n".join(" | ".join(str(value) for value in row) for row in rows)
@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, NamedTuple, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models.models import Payment, PaymentStatus
+
+PENDING, PROCESSING, SUCCESS, FAILED, CANCELLED = (
+    PaymentStatus.PENDING, PaymentStatus.PROCESSING, PaymentStatus.SUCCESS,
+    PaymentStatus.FAILED, PaymentStatus.CANCELLED
+)
+
+# Where each status may go next. SUCCESS is final: nothing, however late,
+# takes a credited payment back. A success reported after the payment was
+# given up on (failed, or cancelled as stale) still wins, since the money moved.
+TRANSITIONS: Dict[PaymentStatus, FrozenSet[PaymentStatus]] = {
+    PENDING: frozenset({PROCESSING, SUCCESS, FAILED, CANCELLED}),
+    PROCESSING: frozenset({SUCCESS, FAILED, CANCELLED}),
+    SUCCESS: frozenset(),
+    FAILED: frozenset({SUCCESS}),
+    CANCELLED: frozenset({SUCCESS}),
+}
+
+# Statuses a payment can be moved to each of these from, for set-based updates
+SOURCES: Dict[PaymentStatus, FrozenSet[PaymentStatus]] = {
+    target: frozenset(source for source, targets in TRANSITIONS.items() if target in targets)
+    for target in PaymentStatus
+}
+
+
+class Moved(NamedTuple):
+    """What a payment left: the status and when that status was reached"""
+    status: PaymentStatus
+    processed_at: Optional[datetime]
+
+
+MAX_ATTEMPTS = 5  # a payment only has a handful of states to move through
+
+
+def can_transition(current: Optional[PaymentStatus], target: PaymentStatus) -> bool:
+    return target in TRANSITIONS.get(current, ())
+
+
+def transition(db: Session, payment: Payment, target: PaymentStatus, **values: Any) -> Optional[Moved]:
+    """Move ``payment`` to ``target`` in the caller's transaction; what it left, or None.
+
+    Each attempt is one UPDATE conditioned on the status and version the
+    payment was read with, so no row lock is held while deciding. If another
+    request moved the payment first, it is reloaded and the move re-checked
+    against the table, so of two racing requests exactly one applies a
+    given move. ``values`` are set along with the status (processed_at,
+    paystack_transaction_id, ...). The payment object is kept in step
+    without another SELECT.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        previous = Moved(payment.status, payment.processed_at)
+        if not can_transition(previous.status, target):
+            return None
+        now = datetime.utcnow()
+        result = db.execute(
+            update(Payment).where(
+                Payment.id == payment.id,
+                Payment.status == previous.status,
+                Payment.version == payment.version
+            ).values(
+                status=target, version=Payment.version + 1, updated_at=now, **values
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            changed = {"status": target, "version": payment.version + 1, "updated_at": now, **values}
+            for name, value in changed.items():
+                set_committed_value(payment, name, value)
+            return previous
+        db.refresh(payment, ["status", "version", "processed_at"])
+    return None
@@ -2,18 +2,30 @@ import httpx
 import base64
 import hashlib
 import hmac
-from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, Optional
 from core.config import settings
+from core.tracing import TracingTransport
 
 
 class PaystackService:
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.secret_key = settings.PAYSTACK_SECRET_KEY
         self.base_url = "https://api.paystack.co"
         self.headers = {
             "Authorization": f"Bearer {self.secret_key}",
             "Content-Type": "application/json"
         }
+        # Bulk callers pass one pooled client; otherwise each call opens its own
+        self.client = client
+
+    @asynccontextmanager
+    async def _client(self) -> AsyncIterator[httpx.AsyncClient]:
+        if self.client is not None:
+            yield self.client
+            return
+        async with httpx.AsyncClient(transport=TracingTransport()) as client:
+            yield client
 
     async def initialize_transaction(
         self,
@@ -34,7 +46,7 @@ class PaystackService:
         if callback_url:
             payload["callback_url"] = callback_url
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/transaction/initialize",
                 headers=self.headers,
@@ -62,7 +74,7 @@ class PaystackService:
             }
         }
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/charge",
                 headers=self.headers,
@@ -92,7 +104,7 @@ class PaystackService:
             }
         }
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/charge",
                 headers=self.headers,
@@ -104,7 +116,7 @@ class PaystackService:
     async def verify_transaction(self, reference: str) -> Dict[str, Any]:
         """Verify a transaction"""
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.get(
                 f"{self.base_url}/transaction/verify/{reference}",
                 headers=self.headers
@@ -115,7 +127,7 @@ class PaystackService:
     async def get_transaction(self, transaction_id: str) -> Dict[str, Any]:
         """Get transaction details"""
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.get(
                 f"{self.base_url}/transaction/{transaction_id}",
                 headers=self.headers
@@ -142,7 +154,7 @@ class PaystackService:
         if to_date:
             params["to"] = to_date
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.get(
                 f"{self.base_url}/transaction",
                 headers=self.headers,
@@ -155,7 +167,8 @@ class PaystackService:
         self,
         authorization_code: str,
         email: str,
-        amount: int
+        amount: int,
+        reference: Optional[str] = None
     ) -> Dict[str, Any]:
         """Charge a customer using authorization code"""
 
@@ -166,7 +179,10 @@ class PaystackService:
             "currency": "GHS"
         }
 
-        async with httpx.AsyncClient() as client:
+        if reference:
+            payload["reference"] = reference
+
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/transaction/charge_authorization",
                 headers=self.headers,
@@ -189,7 +205,7 @@ class PaystackService:
     async def get_banks(self, country: str = "ghana") -> Dict[str, Any]:
         """Get list of banks for Ghana"""
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.get(
                 f"{self.base_url}/bank?country={country}",
                 headers=self.headers
@@ -209,7 +225,7 @@ class PaystackService:
             "bank_code": bank_code
         }
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/bank/resolve",
                 headers=self.headers,
@@ -234,7 +250,7 @@ class PaystackService:
             "currency": "GHS"
         }
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/transferrecipient",
                 headers=self.headers,
@@ -261,7 +277,7 @@ class PaystackService:
         if reason:
             payload["reason"] = reason
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/transfer",
                 headers=self.headers,
@@ -282,7 +298,7 @@ class PaystackService:
             "otp": otp
         }
 
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.post(
                 f"{self.base_url}/transfer/finalize_transfer",
                 headers=self.headers,
@@ -0,0 +1,112 @@
+from typing import Dict, NamedTuple, Optional
+
+from models.models import MobileMoneyProvider
+
+COUNTRY_CODE = "233"
+NATIONAL_LENGTH = 9  # digits after the trunk 0 or +233
+SEPARATORS = str.maketrans("", "", " -.()/")
+
+# Mobile ranges by national prefix (the digits after the trunk 0). A longer
+# prefix wins over a shorter one, so a block carved out of another
+# operator's range only needs its own line.
+PREFIXES = {
+    "24": MobileMoneyProvider.MTN,
+    "25": MobileMoneyProvider.MTN,
+    "53": MobileMoneyProvider.MTN,
+    "54": MobileMoneyProvider.MTN,
+    "55": MobileMoneyProvider.MTN,
+    "59": MobileMoneyProvider.MTN,
+    "20": MobileMoneyProvider.VODAFONE,  # Telecel, formerly Vodafone
+    "50": MobileMoneyProvider.VODAFONE,
+    "26": MobileMoneyProvider.AIRTELTIGO,
+    "27": MobileMoneyProvider.AIRTELTIGO,
+    "56": MobileMoneyProvider.AIRTELTIGO,
+    "57": MobileMoneyProvider.AIRTELTIGO,
+}
+
+PROVIDER_NAMES = {
+    MobileMoneyProvider.MTN: "MTN",
+    MobileMoneyProvider.VODAFONE: "Telecel",
+    MobileMoneyProvider.AIRTELTIGO: "AirtelTigo",
+}
+
+_PROVIDER = ""  # trie key holding the provider of the prefix ending at that node
+
+
+def _compile(prefixes: Dict[str, MobileMoneyProvider]) -> Dict[str, object]:
+    root: Dict[str, object] = {}
+    for prefix, provider in prefixes.items():
+        node = root
+        for digit in prefix:
+            node = node.setdefault(digit, {})
+        node[_PROVIDER] = provider
+    return root
+
+
+_TRIE = _compile(PREFIXES)
+
+
+class PhoneNumber(NamedTuple):
+    e164: str  # +233XXXXXXXXX
+    provider: Optional[MobileMoneyProvider]  # None outside the mobile money ranges
+
+    @property
+    def local(self) -> str:
+        return local_number(self.e164)
+
+
+def local_number(e164: str) -> str:
+    """0XXXXXXXXX, the form Paystack's mobile money charge expects"""
+    return "0" + e164[4:]
+
+
+def normalize_phone(phone: str) -> str:
+    """+233XXXXXXXXX for a Ghana number written as +233..., 00233... or 0...; ValueError otherwise"""
+    number = phone.strip().translate(SEPARATORS)
+    if number.startswith("+" + COUNTRY_CODE):
+        national = number[4:]
+    elif number.startswith("00" + COUNTRY_CODE):
+        national = number[5:]
+    elif number.startswith("0"):
+        national = number[1:]
+    else:
+        raise ValueError("Phone number must start with +233 or 0")
+    if len(national) != NATIONAL_LENGTH or not national.isdigit() or national[0] == "0":
+        raise ValueError("Invalid phone number length for Ghana")
+    return "+" + COUNTRY_CODE + national
+
+
+def detect_provider(e164: str) -> Optional[MobileMoneyProvider]:
+    """Network of a normalized number from its prefix; the longest matching prefix wins"""
+    node = _TRIE
+    found = None
+    for digit in e164[4:]:
+        node = node.get(digit)
+        if node is None:
+            break
+        found = node.get(_PROVIDER, found)
+    return found
+
+
+def parse_phone(phone: str) -> PhoneNumber:
+    e164 = normalize_phone(phone)
+    return PhoneNumber(e164, detect_provider(e164))
+
+
+def route_mobile_money(phone: str, provider: Optional[MobileMoneyProvider], enforce: bool = True) -> PhoneNumber:
+    """The number and the network to charge it on.
+
+    The network is detected from the prefix when not given. A given network
+    that disagrees with the prefix raises ValueError unless ``enforce`` is
+    off, in which case it is trusted (a number ported between networks keeps
+    its old prefix).
+    """
+    number = parse_phone(phone)
+    if provider is None:
+        if number.provider is None:
+            raise ValueError("Not a mobile money number; choose the network")
+        return number
+    if enforce and number.provider != provider:
+        expected = PROVIDER_NAMES.get(number.provider, "no mobile money network")
+        raise ValueError(f"{number.local} is on {expected}, not {PROVIDER_NAMES[provider]}")
+    return PhoneNumber(number.e164, provider)
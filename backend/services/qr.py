@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import segno
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+BORDER = 4  # quiet zone, in modules
+# Bump when render_qr's output changes, so cached files are not served for the new look
+RENDER_VERSION = 1
+
+
+def payment_link(collection_id: int) -> str:
+    return f"{settings.PAYMENT_LINK_BASE_URL}?collection={collection_id}"
+
+
+def render_qr(data: str, fmt: str, size: int) -> bytes:
+    """QR code for ``data`` at most ``size`` pixels wide; runs in the render pool"""
+    qr = segno.make(data, error="m", micro=False)
+    width, _ = qr.symbol_size(scale=1, border=BORDER)
+    out = io.BytesIO()
+    if fmt == "svg":
+        qr.save(out, kind="svg", scale=max(1, size // width), border=BORDER, xmldecl=False, svgclass=None, lineclass=None)
+    else:
+        qr.save(out, kind="png", scale=max(1, size // width), border=BORDER)
+    return out.getvalue()
+
+
+def _write(path: str, body: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Readers never see a partly written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def _remove(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _scan(directory: str) -> List[Tuple[str, int]]:
+    """Cached renders on disk as (name, bytes), oldest first"""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            stat = os.stat(os.path.join(root, name))
+            found.append((stat.st_mtime, name, stat.st_size))
+    return [(name, size) for _, name, size in sorted(found)]
+
+
+class QrCodeCache:
+    """QR code renders cached on local disk.
+
+    Files are named by a hash of what they depict (payload, format, size and
+    RENDER_VERSION), so a file never needs invalidating and its name doubles
+    as the ETag. Renders run in a process pool, off the event loop, and
+    concurrent requests for the same missing file share one render. The
+    directory is kept under ``max_bytes`` by dropping the least recently
+    served files; recency is tracked in memory and starts from file age
+    after a restart.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, workers: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workers = workers or os.cpu_count() or 1
+        self.metrics = {"hits": 0, "renders": 0, "evictions": 0}
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # file name -> bytes, least recently served first
+        self._bytes = 0
+        self._loaded = False
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded server process is not safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        for task in self._background:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @staticmethod
+    def name(data: str, fmt: str, size: int) -> str:
+        digest = hashlib.sha256(f"{RENDER_VERSION}:{fmt}:{size}:{data}".encode("utf-8")).hexdigest()
+        return f"{digest}.{fmt}"
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name[:2], name)
+
+    async def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        for name, size in await run_in_threadpool(_scan, self.directory):
+            self._entries[name] = size
+            self._bytes += size
+        await self._evict()
+
+    async def _evict(self) -> None:
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            evicted.append(self.path(name))
+        if evicted:
+            self.metrics["evictions"] += len(evicted)
+            await run_in_threadpool(_remove, evicted)
+
+    async def get(self, data: str, fmt: str, size: int) -> Tuple[str, str]:
+        """(file name, path) of the rendered QR code, rendering it on a miss"""
+        await self._load()
+        name = self.name(data, fmt, size)
+        path = self.path(name)
+        if name in self._entries and os.path.exists(path):
+            self._entries.move_to_end(name)
+            self.metrics["hits"] += 1
+            return name, path
+
+        rendering = self._rendering.get(name)
+        if rendering is None:
+            rendering = asyncio.ensure_future(self._render(name, data, fmt, size))
+            self._rendering[name] = rendering
+            rendering.add_done_callback(lambda _: self._rendering.pop(name, None))
+        await asyncio.shield(rendering)
+        return name, path
+
+    async def _render(self, name: str, data: str, fmt: str, size: int) -> None:
+        body = await asyncio.get_running_loop().run_in_executor(self.pool, render_qr, data, fmt, size)
+        await run_in_threadpool(_write, self.path(name), body)
+        self.metrics["renders"] += 1
+        self._bytes += len(body) - self._entries.pop(name, 0)
+        self._entries[name] = len(body)
+        await self._evict()
+
+    def prerender(self, data: str) -> None:
+        """Render ``data`` in every pre-rendered size and format in the background"""
+        for fmt in FORMATS:
+            for size in settings.QR_PRERENDER_SIZES:
+                task = asyncio.create_task(self.get(data, fmt, size))
+                self._background.add(task)
+                task.add_done_callback(self._prerendered)
+
+    def _prerendered(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("QR pre-render failed: %s", task.exception())
+
+
+qr_cache = QrCodeCache(
+    directory=settings.QR_CACHE_DIR,
+    max_bytes=settings.QR_CACHE_MAX_BYTES,
+    workers=settings.QR_RENDER_WORKERS
+)
@@ -0,0 +1,493 @@
+import asyncio
+import calendar
+import logging
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from database_simple import SessionLocal
+from models.models import (
+    Collection, CollectionStatus, NotificationEndpoint, Payment, PaymentAuthorization, PaymentMethod,
+    PaymentStatus, RecurringContribution, RecurringInterval, RecurringStatus, User
+)
+from services.analytics import record_transition, record_transitions
+from services.collection_cache import invalidate_collections
+from services.leases import acquire_lease, release_lease, WORKER_ID
+from services.ledger import post_entry
+from services.notifications import enqueue_payment_succeeded, notification_dispatcher
+from services.payment_events import payment_events
+from services.payment_state import transition
+from services.paystack import PaystackService
+from services.trending import trending_ranker
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "recurring_charges"
+OPEN_STATUSES = (PaymentStatus.PENDING, PaymentStatus.PROCESSING)
+
+# Charge outcomes
+SUCCESS = "success"
+FAILED = "failed"
+PENDING = "pending"  # accepted by Paystack, settled later by the webhook
+UNKNOWN = "unknown"  # no answer; the schedule stays claimed and is retried by reference
+SKIPPED = "skipped"  # authorization revoked or collection closed
+
+PAYSTACK_FAILED = {"failed", "abandoned", "reversed"}
+RETURNING = (
+    Payment.id, Payment.reference, Payment.status, Payment.amount, Payment.currency, Payment.processed_at,
+    Payment.collection_id, Payment.payment_method, Payment.mobile_money_provider, Payment.customer_name
+)
+
+
+def next_occurrence(after: datetime, interval: RecurringInterval, day_of_month: Optional[int]) -> datetime:
+    """The charge date following ``after``; monthly dates keep to day_of_month where the month has it"""
+    if interval == RecurringInterval.WEEKLY:
+        return after + timedelta(weeks=1)
+    year, month = (after.year + 1, 1) if after.month == 12 else (after.year, after.month + 1)
+    day = min(day_of_month or after.day, calendar.monthrange(year, month)[1])
+    return after.replace(year=year, month=month, day=day)
+
+
+def save_authorization(db: Session, user_id: int, email: str, authorization: Dict[str, Any]) -> Optional[PaymentAuthorization]:
+    """Store a reusable authorization from a charge.success payload, in the caller's transaction"""
+    code = authorization.get("authorization_code")
+    if not code or not authorization.get("reusable"):
+        return None
+    existing = db.query(PaymentAuthorization).filter(PaymentAuthorization.authorization_code == code).first()
+    if existing is not None:
+        return existing
+    stored = PaymentAuthorization(
+        user_id=user_id,
+        authorization_code=code,
+        email=email,
+        channel=authorization.get("channel"),
+        card_type=(authorization.get("card_type") or "").strip() or None,
+        last4=authorization.get("last4"),
+        exp_month=authorization.get("exp_month"),
+        exp_year=authorization.get("exp_year"),
+        bank=authorization.get("bank"),
+        created_at=datetime.utcnow()
+    )
+    db.add(stored)
+    return stored
+
+
+def reference_for(schedule_id: int, due_at: datetime) -> str:
+    """The same for every attempt at one due date, so a resumed run finds its own charge"""
+    return f"AGA_REC_{schedule_id}_{due_at:%Y%m%d%H%M%S}"
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart; O(1) per call"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        at = max(now, self._next)
+        self._next = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+class RecurringScheduler:
+    """Charges due recurring contributions through Paystack's charge_authorization.
+
+    Each batch is claimed with one indexed UPDATE (status, next_charge_at)
+    that pushes locked_until forward, so a run that dies only delays its
+    schedules until the lock lapses. Payment rows are written in bulk before
+    anything is charged, under a reference derived from the schedule and its
+    due date: a resumed batch finds them again, asks Paystack what became of
+    any still open and only charges those Paystack has never seen. Charges
+    run concurrently under a semaphore and a per-second rate, and outcomes
+    are written back in a handful of set-based statements per batch.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        concurrency: int,
+        rate_per_second: float,
+        max_charges_per_run: int,
+        lock_seconds: float,
+        retry_hours: float,
+        max_failures: int,
+        poll_seconds: float,
+        owner: str = WORKER_ID
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self.max_charges_per_run = max_charges_per_run
+        self.lock = timedelta(seconds=lock_seconds)
+        self.retry = timedelta(hours=retry_hours)
+        self.max_failures = max_failures
+        self.poll_seconds = poll_seconds
+        self.owner = owner
+        self.client: Optional[httpx.AsyncClient] = None  # shared keep-alive client while running
+        self.metrics = {"runs": 0, "skipped": 0, "charged": 0, "succeeded": 0, "failed": 0, "pending": 0, "unknown": 0, "resumed": 0}
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _claim(self, limit: int) -> List[Dict[str, Any]]:
+        """Claim up to ``limit`` due schedules and make sure each has its payment row"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            unlocked = or_(RecurringContribution.locked_until.is_(None), RecurringContribution.locked_until < now)
+            due = select(RecurringContribution.id).where(
+                RecurringContribution.status == RecurringStatus.ACTIVE,
+                RecurringContribution.next_charge_at <= now,
+                unlocked
+            ).order_by(RecurringContribution.next_charge_at).limit(limit).with_for_update(skip_locked=True)
+            ids = db.execute(
+                update(RecurringContribution).where(
+                    RecurringContribution.id.in_(due.scalar_subquery()),
+                    unlocked
+                ).values(locked_until=now + self.lock).returning(RecurringContribution.id)
+            ).scalars().all()
+            db.commit()
+            if not ids:
+                return []
+
+            rows = db.execute(
+                select(
+                    RecurringContribution.id,
+                    RecurringContribution.user_id,
+                    RecurringContribution.collection_id,
+                    RecurringContribution.amount,
+                    RecurringContribution.interval,
+                    RecurringContribution.day_of_month,
+                    RecurringContribution.next_charge_at,
+                    RecurringContribution.failure_count,
+                    PaymentAuthorization.authorization_code,
+                    PaymentAuthorization.email,
+                    PaymentAuthorization.channel,
+                    PaymentAuthorization.is_active.label("authorization_active"),
+                    Collection.status.label("collection_status"),
+                    User.full_name
+                ).join(PaymentAuthorization, PaymentAuthorization.id == RecurringContribution.authorization_id)
+                .join(Collection, Collection.id == RecurringContribution.collection_id)
+                .join(User, User.id == RecurringContribution.user_id)
+                .where(RecurringContribution.id.in_(ids))
+            ).all()
+            charges = [
+                {**row._asdict(), "reference": reference_for(row.id, row.next_charge_at)}
+                for row in rows
+            ]
+            self._ensure_payments(db, [c for c in charges if self._chargeable(c)])
+            db.commit()
+            return charges
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _chargeable(charge: Dict[str, Any]) -> bool:
+        return charge["authorization_active"] and charge["collection_status"] == CollectionStatus.ACTIVE
+
+    @staticmethod
+    def _ensure_payments(db: Session, charges: List[Dict[str, Any]]) -> None:
+        """Find payments left by an earlier attempt at the same due date, insert the rest in one statement"""
+        if not charges:
+            return
+        existing = {
+            row.reference: row for row in db.execute(
+                select(Payment.id, Payment.reference, Payment.status).where(
+                    Payment.reference.in_([c["reference"] for c in charges])
+                )
+            )
+        }
+        new = []
+        for charge in charges:
+            row = existing.get(charge["reference"])
+            charge["payment_id"] = row.id if row else None
+            charge["payment_status"] = row.status if row else None
+            if row is None:
+                new.append({
+                    "reference": charge["reference"],
+                    "user_id": charge["user_id"],
+                    "collection_id": charge["collection_id"],
+                    "amount": charge["amount"],
+                    "currency": "GHS",
+                    "payment_method": PaymentMethod.MOBILE_MONEY if charge["channel"] == "mobile_money" else PaymentMethod.CARD,
+                    "status": PaymentStatus.PROCESSING,
+                    "description": "Recurring contribution",
+                    "customer_email": charge["email"],
+                    "customer_name": charge["full_name"],
+                })
+        if new:
+            inserted = dict(
+                (reference, payment_id) for payment_id, reference in
+                db.execute(insert(Payment).returning(Payment.id, Payment.reference), new).all()
+            )
+            for charge in charges:
+                if charge["payment_id"] is None:
+                    charge["payment_id"] = inserted[charge["reference"]]
+
+    async def _attempt(
+        self,
+        paystack: PaystackService,
+        charge: Dict[str, Any],
+        slots: asyncio.Semaphore,
+        limiter: RateLimiter
+    ) -> Tuple[str, Optional[str]]:
+        """(outcome, Paystack transaction id) for one claimed schedule"""
+        if not self._chargeable(charge):
+            return SKIPPED, None
+        previous = charge["payment_status"]
+        if previous == PaymentStatus.SUCCESS:
+            return SUCCESS, None
+        if previous == PaymentStatus.FAILED:
+            return FAILED, None
+        # A CANCELLED payment is one the expiry sweeper gave up on after an
+        # unanswered charge, which Paystack may still have taken: it is
+        # verified by reference like any resumed charge, never written off
+
+        async with slots:
+            try:
+                if previous is not None:
+                    # An earlier run got this far; Paystack knows whether it charged
+                    self.metrics["resumed"] += 1
+                    await limiter.wait()
+                    verified = await paystack.verify_transaction(charge["reference"])
+                    data = verified.get("data") or {}
+                    if verified.get("status") and data.get("status") == "success":
+                        return SUCCESS, str(data.get("id"))
+                    if verified.get("status") and data.get("status") in PAYSTACK_FAILED:
+                        return FAILED, None
+                    if verified.get("status"):
+                        return PENDING, None
+
+                await limiter.wait()
+                self.metrics["charged"] += 1
+                response = await paystack.charge_authorization(
+                    authorization_code=charge["authorization_code"],
+                    email=charge["email"],
+                    amount=int(Decimal(charge["amount"]) * 100),
+                    reference=charge["reference"]
+                )
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning("Recurring charge %s got no answer: %s", charge["reference"], e)
+                return UNKNOWN, None
+
+        data = response.get("data") or {}
+        if response.get("status") and data.get("status") == "success":
+            return SUCCESS, str(data.get("id"))
+        if not response.get("status") or data.get("status") in PAYSTACK_FAILED:
+            return FAILED, None
+        return PENDING, None
+
+    def _record(self, charges: List[Dict[str, Any]], outcomes: List[Tuple[str, Optional[str]]]) -> Dict[str, Any]:
+        """Write a batch's outcomes to payments, the ledger and the schedules in one transaction"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            by_outcome: Dict[str, List[Dict[str, Any]]] = {}
+            for charge, (outcome, transaction_id) in zip(charges, outcomes):
+                charge["transaction_id"] = transaction_id
+                by_outcome.setdefault(outcome, []).append(charge)
+
+            # Guarded by status, so a payment the webhook settled first is left alone and never credited twice
+            settled = {}
+            for outcome, status in ((SUCCESS, PaymentStatus.SUCCESS), (FAILED, PaymentStatus.FAILED)):
+                ids = [c["payment_id"] for c in by_outcome.get(outcome, []) if c["payment_status"] in (None, *OPEN_STATUSES)]
+                rows = db.execute(
+                    update(Payment).where(
+                        Payment.id.in_(ids),
+                        Payment.status.in_(OPEN_STATUSES)
+                    ).values(
+                        status=status, version=Payment.version + 1, processed_at=now, updated_at=now
+                    ).returning(*RETURNING)
+                ).all() if ids else []
+                record_transitions(db, rows, None)
+                settled[outcome] = rows
+
+            # Cancelled payments Paystack did charge move one by one, so the rollups drop the cancellation
+            for charge in by_outcome.get(SUCCESS, []):
+                if charge["payment_status"] != PaymentStatus.CANCELLED:
+                    continue
+                payment = db.get(Payment, charge["payment_id"])
+                moved = transition(db, payment, PaymentStatus.SUCCESS, processed_at=now) if payment else None
+                if moved is not None:
+                    record_transition(db, payment, moved.status, moved.processed_at)
+                    settled[SUCCESS].append(payment)
+
+            transaction_ids = [
+                {"id": c["payment_id"], "paystack_transaction_id": c["transaction_id"]}
+                for c in by_outcome.get(SUCCESS, []) if c["transaction_id"]
+            ]
+            if transaction_ids:
+                db.execute(update(Payment), transaction_ids)
+
+            credited = settled[SUCCESS]
+            if credited:
+                collections = {
+                    c.id: c for c in db.query(Collection).filter(
+                        Collection.id.in_({row.collection_id for row in credited})
+                    )
+                }
+                notified = set(db.execute(
+                    select(NotificationEndpoint.user_id).where(
+                        NotificationEndpoint.user_id.in_({c.created_by for c in collections.values()}),
+                        NotificationEndpoint.is_active == True
+                    )
+                ).scalars())
+                for row in credited:
+                    collection = collections[row.collection_id]
+                    post_entry(db, collection, row.amount, "payment", payment_id=row.id)
+                    if collection.created_by in notified:
+                        enqueue_payment_succeeded(db, row, collection)
+
+            schedules = []
+            for outcome, group in by_outcome.items():
+                for charge in group:
+                    if outcome == UNKNOWN:
+                        continue  # stays claimed; the next claim after the lock resumes it by reference
+                    values = {"id": charge["id"], "locked_until": None, "updated_at": now}
+                    if outcome == SKIPPED:
+                        values["status"] = RecurringStatus.PAUSED
+                    elif outcome == FAILED:
+                        failures = charge["failure_count"] + 1
+                        values.update(failure_count=failures, next_charge_at=now + self.retry, last_payment_id=charge["payment_id"])
+                        if failures >= self.max_failures:
+                            values["status"] = RecurringStatus.PAUSED
+                    else:
+                        # Periods missed while nothing ran are skipped, not charged in arrears
+                        due = next_occurrence(charge["next_charge_at"], charge["interval"], charge["day_of_month"])
+                        while due <= now:
+                            due = next_occurrence(due, charge["interval"], charge["day_of_month"])
+                        values.update(
+                            failure_count=0, next_charge_at=due, last_payment_id=charge["payment_id"], last_charged_at=now
+                        )
+                    schedules.append(values)
+            if schedules:
+                db.execute(update(RecurringContribution), schedules)
+            db.commit()
+
+            return {
+                "counts": {outcome: len(group) for outcome, group in by_outcome.items()},
+                "collections": sorted({row.collection_id for row in credited}),
+                "events": [(row.reference, row.status.value, row.processed_at) for rows in settled.values() for row in rows],
+            }
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _lease(self) -> bool:
+        db = SessionLocal()
+        try:
+            return acquire_lease(db, LEASE_NAME, max(self.lock.total_seconds(), self.poll_seconds * 3), self.owner)
+        finally:
+            db.close()
+
+    async def run(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Charge everything due, batch by batch; None if another worker holds the lease"""
+        if not force and not await run_in_threadpool(self._lease):
+            self.metrics["skipped"] += 1
+            return None
+
+        started = time.perf_counter()
+        client = self.client or httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        )
+        paystack = PaystackService(client)
+        slots = asyncio.Semaphore(self.concurrency)
+        limiter = RateLimiter(self.rate_per_second)
+        totals: Dict[str, int] = {}
+        attempted = 0
+        try:
+            while attempted < self.max_charges_per_run:
+                charges = await run_in_threadpool(self._claim, min(self.batch_size, self.max_charges_per_run - attempted))
+                if not charges:
+                    break
+                attempted += len(charges)
+                outcomes = await asyncio.gather(*(self._attempt(paystack, c, slots, limiter) for c in charges))
+                result = await run_in_threadpool(self._record, charges, outcomes)
+
+                for outcome, count in result["counts"].items():
+                    totals[outcome] = totals.get(outcome, 0) + count
+                if result["collections"]:
+                    await invalidate_collections(result["collections"])
+                    notification_dispatcher.wake()
+                    trending_ranker.wake()
+                for reference, status, processed_at in result["events"]:
+                    await payment_events.publish(reference, status, processed_at=processed_at)
+                # Long runs keep the lease for as long as they work
+                if not force:
+                    await run_in_threadpool(self._lease)
+        finally:
+            if client is not self.client:
+                await client.aclose()
+
+        self.metrics["runs"] += 1
+        for outcome in (SUCCESS, FAILED, PENDING, UNKNOWN):
+            self.metrics[{SUCCESS: "succeeded"}.get(outcome, outcome)] += totals.get(outcome, 0)
+        self.last_run = {
+            "started_at": datetime.utcnow(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "schedules": attempted,
+            **totals,
+        }
+        if attempted:
+            logger.info("Recurring run: %s", self.last_run)
+        return self.last_run
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.exception("Recurring charge run failed: %s", e)
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.release()
+
+    def release(self) -> None:
+        """Let another worker take over without waiting for the lease to lapse"""
+        db = SessionLocal()
+        try:
+            release_lease(db, LEASE_NAME, self.owner)
+        finally:
+            db.close()
+
+
+recurring_scheduler = RecurringScheduler(
+    batch_size=settings.RECURRING_BATCH_SIZE,
+    concurrency=settings.RECURRING_CONCURRENCY,
+    rate_per_second=settings.RECURRING_RATE_PER_SECOND,
+    max_charges_per_run=settings.RECURRING_MAX_CHARGES_PER_RUN,
+    lock_seconds=settings.RECURRING_LOCK_SECONDS,
+    retry_hours=settings.RECURRING_RETRY_HOURS,
+    max_failures=settings.RECURRING_MAX_FAILURES,
+    poll_seconds=settings.RECURRING_POLL_SECONDS
+)
@@ -0,0 +1,111 @@
+import re
+from typing import List
+
+from sqlalchemy import column, func, inspect, literal_column, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models.models import Collection, CollectionStatus
+
+MAX_QUERY_TERMS = 8
+
+# SQLite: external-content FTS5 table over collections, kept in sync by triggers
+SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS collections_fts USING fts5(
+        title, description,
+        content='collections', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS collections_fts_ai AFTER INSERT ON collections BEGIN
+        INSERT INTO collections_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS collections_fts_ad AFTER DELETE ON collections BEGIN
+        INSERT INTO collections_fts(collections_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS collections_fts_au AFTER UPDATE OF title, description ON collections BEGIN
+        INSERT INTO collections_fts(collections_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO collections_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+# Postgres: expression GIN index, so there is nothing to keep in sync. The
+# query below must use the exact same expression for the planner to pick it.
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(collections.title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(collections.description, '')), 'B')"
+)
+POSTGRES_FTS_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_collections_search ON collections USING GIN (({POSTGRES_DOCUMENT}))",
+]
+
+
+def ensure_search_index(engine: Engine) -> None:
+    """Create the collection text index for the current dialect (idempotent)"""
+
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            is_new = not inspect(conn).has_table("collections_fts")
+            for statement in SQLITE_FTS_DDL:
+                conn.execute(text(statement))
+            if is_new:
+                # Index collections that existed before the FTS table
+                conn.execute(text("INSERT INTO collections_fts(collections_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for statement in POSTGRES_FTS_DDL:
+                conn.execute(text(statement))
+
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())[:MAX_QUERY_TERMS]
+
+
+def search_collections(db: Session, query: str, skip: int = 0, limit: int = 20) -> List[Collection]:
+    """Ranked prefix search over public, active collections' title and description"""
+
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    collections = db.query(Collection).filter(
+        Collection.is_public == True,
+        Collection.status == CollectionStatus.ACTIVE
+    )
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        fts = table("collections_fts", column("rowid"))
+        match = " ".join(f'"{term}"*' for term in terms)
+        collections = collections.join(fts, fts.c.rowid == Collection.id).filter(
+            literal_column("collections_fts").op("MATCH")(match)
+        ).order_by(
+            # bm25 is lower-is-better; weight title hits above description hits
+            func.bm25(literal_column("collections_fts"), 10.0, 1.0)
+        )
+    elif dialect == "postgresql":
+        document = literal_column(POSTGRES_DOCUMENT)
+        tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        collections = collections.filter(document.op("@@")(tsquery)).order_by(
+            func.ts_rank_cd(document, tsquery).desc()
+        )
+    else:
+        for term in terms:
+            pattern = f"%{term}%"
+            collections = collections.filter(
+                Collection.title.ilike(pattern) | Collection.description.ilike(pattern)
+            )
+        collections = collections.order_by(Collection.id)
+
+    return collections.offset(skip).limit(limit).all()
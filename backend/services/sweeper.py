@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from database_simple import SessionLocal
+from models.models import Collection, CollectionStatus, Payment, PaymentStatus
+from services.analytics import record_transitions
+from services.collection_cache import invalidate_collections
+from services.idempotency import idempotency_store
+from services.leases import acquire_lease, release_lease, WORKER_ID
+from services.payment_events import payment_events
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "expiry_sweeper"
+STALE_PAYMENT_STATUSES = (PaymentStatus.PENDING, PaymentStatus.PROCESSING)
+
+
+class ExpirySweeper:
+    """Expires ended collections and cancels abandoned payments in batches.
+
+    Each batch is one set-based UPDATE over the lowest matching ids, guarded
+    by the status it expects, and committed on its own so locks stay short
+    and a crash loses at most one batch. A DB lease elects a single worker to
+    sweep; the status guards make a concurrent sweep harmless anyway.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        pending_timeout_minutes: int,
+        interval_seconds: float,
+        owner: str = WORKER_ID
+    ):
+        self.batch_size = batch_size
+        self.pending_timeout = timedelta(minutes=pending_timeout_minutes)
+        self.interval_seconds = interval_seconds
+        self.owner = owner
+        self.metrics = {
+            "runs": 0,
+            "skipped": 0,
+            "collections_expired": 0,
+            "payments_cancelled": 0,
+            "idempotency_keys_purged": 0,
+        }
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def expire_collections(self, db: Session, now: datetime) -> List[int]:
+        expired = []
+        while True:
+            batch = select(Collection.id).where(
+                Collection.status == CollectionStatus.ACTIVE,
+                Collection.end_date < now
+            ).order_by(Collection.id).limit(self.batch_size).with_for_update(skip_locked=True)
+            ids = db.execute(
+                update(Collection).where(
+                    Collection.id.in_(batch.scalar_subquery()),
+                    Collection.status == CollectionStatus.ACTIVE
+                ).values(status=CollectionStatus.EXPIRED, updated_at=now).returning(Collection.id)
+            ).scalars().all()
+            db.commit()
+            expired.extend(ids)
+            if ids:
+                logger.info("Expired %d collections (%d so far)", len(ids), len(expired))
+            if len(ids) < self.batch_size:
+                return expired
+
+    def cancel_stale_payments(self, db: Session, now: datetime) -> List[Any]:
+        cancelled = []
+        cutoff = now - self.pending_timeout
+        while True:
+            batch = select(Payment.id).where(
+                Payment.status.in_(STALE_PAYMENT_STATUSES),
+                Payment.created_at < cutoff
+            ).order_by(Payment.id).limit(self.batch_size).with_for_update(skip_locked=True)
+            rows = db.execute(
+                update(Payment).where(
+                    Payment.id.in_(batch.scalar_subquery()),
+                    Payment.status.in_(STALE_PAYMENT_STATUSES)
+                ).values(
+                    status=PaymentStatus.CANCELLED, version=Payment.version + 1, processed_at=now, updated_at=now
+                ).returning(
+                    Payment.reference,
+                    Payment.status,
+                    Payment.amount,
+                    Payment.processed_at,
+                    Payment.collection_id,
+                    Payment.payment_method,
+                    Payment.mobile_money_provider
+                )
+            ).all()
+            # Neither PENDING nor PROCESSING is counted in the rollups, so
+            # every row is a plain new cancellation
+            record_transitions(db, rows, None)
+            db.commit()
+            cancelled.extend(rows)
+            if rows:
+                logger.info("Cancelled %d stale payments (%d so far)", len(rows), len(cancelled))
+            if len(rows) < self.batch_size:
+                return cancelled
+
+    def sweep(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """One full pass; None if another worker holds the sweeper lease"""
+        db = SessionLocal()
+        try:
+            lease_seconds = max(self.interval_seconds * 3, 60)
+            if not force and not acquire_lease(db, LEASE_NAME, lease_seconds, self.owner):
+                self.metrics["skipped"] += 1
+                return None
+
+            started = time.perf_counter()
+            now = datetime.utcnow()
+            expired = self.expire_collections(db, now)
+            cancelled = self.cancel_stale_payments(db, now)
+            purged = idempotency_store.purge_expired(db)
+
+            result = {
+                "started_at": now,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "collections_expired": expired,
+                "payments_cancelled": cancelled,
+                "idempotency_keys_purged": purged,
+            }
+            self.metrics["runs"] += 1
+            self.metrics["collections_expired"] += len(expired)
+            self.metrics["payments_cancelled"] += len(cancelled)
+            self.metrics["idempotency_keys_purged"] += purged
+            self.last_run = {
+                **result,
+                "collections_expired": len(expired),
+                "payments_cancelled": len(cancelled),
+            }
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def run(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Sweep off the event loop, then notify caches and subscribers"""
+        result = await run_in_threadpool(self.sweep, force)
+        if result is None:
+            return None
+
+        if result["collections_expired"]:
+            await invalidate_collections(result["collections_expired"])
+        for row in result["payments_cancelled"]:
+            await payment_events.publish(row.reference, row.status.value, processed_at=row.processed_at)
+
+        logger.info(
+            "Sweep finished in %.1fms: %d collections expired, %d payments cancelled, %d idempotency keys purged",
+            result["duration_ms"],
+            len(result["collections_expired"]),
+            len(result["payments_cancelled"]),
+            result["idempotency_keys_purged"]
+        )
+        return result
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.exception("Expiry sweep failed: %s", e)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.release()
+
+    def release(self) -> None:
+        """Let another worker take over without waiting for the lease to lapse"""
+        db = SessionLocal()
+        try:
+            release_lease(db, LEASE_NAME, self.owner)
+        finally:
+            db.close()
+
+
+expiry_sweeper = ExpirySweeper(
+    batch_size=settings.SWEEPER_BATCH_SIZE,
+    pending_timeout_minutes=settings.PAYMENT_PENDING_TIMEOUT_MINUTES,
+    interval_seconds=settings.SWEEPER_INTERVAL_SECONDS
+)
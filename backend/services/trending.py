@@ -0,0 +1,234 @@
+import asyncio
+import bisect
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, or_
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from database_simple import SessionLocal
+from models.models import CollectionTrending, LedgerEntry, Payment, PaymentStatus
+from services.leases import acquire_lease
+
+logger = logging.getLogger(__name__)
+
+# Scores are kept as log(sum(weight * e^(rate * (t - EPOCH)))). The order of
+# collections then never changes just because time passes, so nothing has to
+# be re-decayed, and log space cannot overflow however long the process runs.
+EPOCH = datetime(2024, 1, 1)
+LEASE_NAME = "trending_persist"
+# Collections whose current score falls below this are forgotten
+MIN_SCORE = 1e-3
+
+
+def _weight(amount) -> float:
+    """Each gift counts, with diminishing returns on its size"""
+    return math.log1p(max(float(amount), 0.0))
+
+
+class TrendingRanker:
+    """Exponentially time-decayed contribution velocity per collection, with a top-K.
+
+    Every worker tails the collection ledger for payment credits, so each
+    credit updates every worker's ranking once, in O(log K), whichever worker
+    handled it. On startup the ranking is rebuilt from recent successful
+    payments in one streamed pass. One worker at a time persists the top-K to
+    ``collection_trending``, which also serves requests until the rebuild is done.
+    """
+
+    def __init__(self, half_life_hours: float, top_k: int, poll_seconds: float, persist_seconds: float):
+        self.rate = math.log(2) / (half_life_hours * 3600)
+        self.window = timedelta(hours=half_life_hours * math.log2(1 / MIN_SCORE) + half_life_hours)
+        self.top_k = top_k
+        self.poll_seconds = poll_seconds
+        self.persist_seconds = persist_seconds
+        self._scores: Dict[int, float] = {}
+        self._top: List[Tuple[float, int]] = []  # ascending (log score, collection id)
+        self._last_entry_id = 0
+        self._ready = False
+        self._persisted: List[Tuple[int, float]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _log_score(self, weight: float, at: datetime) -> float:
+        return math.log(weight) + self.rate * (at - EPOCH).total_seconds()
+
+    def record(self, collection_id: int, amount, at: datetime) -> None:
+        """Add one credit. Scores only grow, which keeps top-K maintenance local"""
+        weight = _weight(amount)
+        if weight <= 0:
+            return
+        added = self._log_score(weight, at)
+        old = self._scores.get(collection_id)
+        new = added if old is None else max(old, added) + math.log1p(math.exp(-abs(old - added)))
+        self._scores[collection_id] = new
+
+        top = self._top
+        if old is not None:
+            index = bisect.bisect_left(top, (old, collection_id))
+            if index < len(top) and top[index] == (old, collection_id):
+                del top[index]
+                bisect.insort(top, (new, collection_id))
+                return
+        # Every collection outside the top-K scores at most the top-K minimum,
+        # so only this one can displace it
+        if len(top) < self.top_k:
+            bisect.insort(top, (new, collection_id))
+        elif new > top[0][0]:
+            bisect.insort(top, (new, collection_id))
+            del top[0]
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        """Highest current scores first, as (collection id, score)"""
+        if not self._ready:
+            return self._persisted[:limit]
+        offset = self.rate * (datetime.utcnow() - EPOCH).total_seconds()
+        return [
+            (collection_id, math.exp(log_score - offset))
+            for log_score, collection_id in reversed(self._top[-limit:] if limit else [])
+        ]
+
+    def _prune(self) -> None:
+        cutoff = math.log(MIN_SCORE) + self.rate * (datetime.utcnow() - EPOCH).total_seconds()
+        members = {collection_id for _, collection_id in self._top}
+        self._scores = {
+            collection_id: score
+            for collection_id, score in self._scores.items()
+            if score >= cutoff or collection_id in members
+        }
+
+    def _load_persisted(self) -> None:
+        db = SessionLocal()
+        try:
+            self._persisted = [
+                (row.collection_id, row.score)
+                for row in db.query(CollectionTrending).order_by(CollectionTrending.rank)
+            ]
+        finally:
+            db.close()
+
+    def rebuild(self) -> int:
+        """Recompute every score from successful payments inside the decay window"""
+        db = SessionLocal()
+        try:
+            # Credits after this entry are picked up by tailing the ledger
+            last_entry_id = db.query(func.coalesce(func.max(LedgerEntry.id), 0)).scalar()
+            self._scores = {}
+            self._top = []
+            since = datetime.utcnow() - self.window
+            # A payment settled after the read above has its credit past
+            # last_entry_id; leave it to poll() so it is not counted twice.
+            # Payments from before the ledger have no credit and are kept.
+            rows = db.query(
+                Payment.collection_id,
+                Payment.amount,
+                func.coalesce(Payment.processed_at, Payment.created_at)
+            ).outerjoin(
+                LedgerEntry, (LedgerEntry.payment_id == Payment.id) & (LedgerEntry.source == "payment")
+            ).filter(
+                Payment.status == PaymentStatus.SUCCESS,
+                Payment.collection_id.isnot(None),
+                func.coalesce(Payment.processed_at, Payment.created_at) >= since,
+                or_(LedgerEntry.id.is_(None), LedgerEntry.id <= last_entry_id)
+            ).yield_per(10_000)
+            count = 0
+            for collection_id, amount, at in rows:
+                self.record(collection_id, amount, at.replace(tzinfo=None))
+                count += 1
+            self._last_entry_id = last_entry_id
+            self._ready = True
+            return count
+        finally:
+            db.close()
+
+    def poll(self) -> int:
+        """Apply payment credits added to the ledger since the last poll"""
+        db = SessionLocal()
+        try:
+            entries = db.query(
+                LedgerEntry.id, LedgerEntry.collection_id, LedgerEntry.amount, LedgerEntry.created_at
+            ).filter(
+                LedgerEntry.id > self._last_entry_id,
+                LedgerEntry.source == "payment"
+            ).order_by(LedgerEntry.id).limit(10_000).all()
+        finally:
+            db.close()
+        for entry_id, collection_id, amount, created_at in entries:
+            self.record(collection_id, amount, (created_at or datetime.utcnow()).replace(tzinfo=None))
+            self._last_entry_id = entry_id
+        return len(entries)
+
+    def persist(self) -> bool:
+        """Write the current top-K, if this worker holds the persist lease"""
+        db = SessionLocal()
+        try:
+            if not acquire_lease(db, LEASE_NAME, self.persist_seconds * 2):
+                return False
+            now = datetime.utcnow()
+            db.execute(delete(CollectionTrending.__table__))
+            rows = [
+                {"collection_id": collection_id, "rank": rank, "score": score, "computed_at": now}
+                for rank, (collection_id, score) in enumerate(self.top(self.top_k), start=1)
+            ]
+            if rows:
+                db.execute(insert(CollectionTrending.__table__), rows)
+            db.commit()
+            return True
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def wake(self) -> None:
+        """Pick up a credit committed by this worker without waiting for the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self) -> None:
+        await run_in_threadpool(self._load_persisted)
+        count = await run_in_threadpool(self.rebuild)
+        logger.info("Trending ranking rebuilt from %d payments", count)
+
+        loop = asyncio.get_running_loop()
+        next_persist = loop.time()
+        while True:
+            try:
+                await run_in_threadpool(self.poll)
+                if loop.time() >= next_persist:
+                    self._prune()
+                    await run_in_threadpool(self.persist)
+                    next_persist = loop.time() + self.persist_seconds
+            except Exception as e:
+                logger.exception("Trending update failed: %s", e)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+trending_ranker = TrendingRanker(
+    half_life_hours=settings.TRENDING_HALF_LIFE_HOURS,
+    top_k=settings.TRENDING_TOP_K,
+    poll_seconds=settings.TRENDING_POLL_SECONDS,
+    persist_seconds=settings.TRENDING_PERSIST_SECONDS
+)
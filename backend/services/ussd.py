@@ -0,0 +1,496 @@
+import asyncio
+import json
+import logging
+import re
+import secrets
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from core.cache import cached, create_backend
+from core.config import settings
+from database_simple import SessionLocal
+from models.models import CollectionStatus, MobileMoneyProvider, Payment, PaymentMethod, PaymentStatus, User
+from services.analytics import record_transition
+from services.collection_cache import LISTINGS, get_cached_collection, get_cached_collections, get_public_collections
+from services.payment_events import payment_events
+from services.payment_state import transition
+from services.paystack import PaystackService
+from services.phone import PROVIDER_NAMES, parse_phone
+from services.trending import trending_ranker
+from services.velocity import velocity_limiter
+
+logger = logging.getLogger(__name__)
+
+# Menu steps a session moves through
+COLLECTION = "collection"
+COLLECTION_ID = "collection_id"
+AMOUNT = "amount"
+OTHER_AMOUNT = "other_amount"
+NETWORK = "network"
+CONFIRM = "confirm"
+DONE = "done"
+
+ENTER_ID, NEXT_PAGE, PREVIOUS_PAGE = "8", "9", "0"
+AMOUNT_PATTERN = re.compile(r"^\d{1,7}(\.\d{1,2})?$")
+TITLE_WIDTH = 18  # keeps a full page of collections inside a 182 character USSD screen
+
+# Gateways that send the subscriber's network (MCC+MNC) spare them the network menu
+NETWORK_CODES = {
+    "62001": MobileMoneyProvider.MTN,
+    "62002": MobileMoneyProvider.VODAFONE,
+    "62003": MobileMoneyProvider.AIRTELTIGO,
+    "62006": MobileMoneyProvider.AIRTELTIGO,
+}
+NETWORKS = [MobileMoneyProvider.MTN, MobileMoneyProvider.VODAFONE, MobileMoneyProvider.AIRTELTIGO]
+NETWORK_MENU = "Select your mobile money network:\n" + "\n".join(
+    f"{number}. {PROVIDER_NAMES[network]}" for number, network in enumerate(NETWORKS, 1)
+)
+
+
+def _label(title: str, width: int) -> str:
+    title = " ".join(title.split())
+    return title if len(title) <= width else title[:width - 1].rstrip() + "~"
+
+
+def _caller(phone: str, network_code: Optional[str]) -> Tuple[str, Optional[MobileMoneyProvider]]:
+    """Paystack's local form of the caller's number, and their network if known.
+
+    The gateway's network code comes from the subscriber's SIM and also holds
+    for ported numbers, so it wins over the number's prefix.
+    """
+    try:
+        number = parse_phone(phone)
+    except ValueError:
+        return "".join(ch for ch in phone if ch.isdigit()), NETWORK_CODES.get(network_code or "")
+    return number.local, NETWORK_CODES.get(network_code or "") or number.provider
+
+
+def _amount_menu(presets: List[int]) -> str:
+    lines = [f"{number}. GHS {amount}" for number, amount in enumerate(presets, 1)]
+    lines.append(f"{len(presets) + 1}. Other amount")
+    return "Choose amount:\n" + "\n".join(lines)
+
+
+def _render_pages(entries: List[Dict[str, Any]], page_size: int) -> List[Dict[str, Any]]:
+    """Menu screens for the offered collections, with the ids each number maps to"""
+    chunks = [entries[start:start + page_size] for start in range(0, len(entries), page_size)] or [[]]
+    pages = []
+    for number, chunk in enumerate(chunks):
+        lines = ["Choose a collection:" if chunk else "No collections listed."]
+        lines += [f"{index}. {entry['label']}" for index, entry in enumerate(chunk, 1)]
+        lines.append(f"{ENTER_ID}. Enter collection ID")
+        if number + 1 < len(chunks):
+            lines.append(f"{NEXT_PAGE}. More")
+        if number > 0:
+            lines.append(f"{PREVIOUS_PAGE}. Back")
+        pages.append({"text": "\n".join(lines), "ids": [entry["id"] for entry in chunk]})
+    return pages
+
+
+# Served stale while one background load rebuilds it, so no hop waits on an expired menu
+@cached(
+    "ussd:collection-menu",
+    ttl=settings.USSD_MENU_TTL_SECONDS,
+    tags=[LISTINGS],
+    stale_ttl=settings.USSD_MENU_TTL_SECONDS
+)
+async def get_collection_menu() -> List[Dict[str, Any]]:
+    """Pre-rendered collection menu pages: trending collections, topped up from the public listing"""
+    wanted = settings.USSD_MENU_COLLECTIONS
+    ranked = [collection_id for collection_id, _ in trending_ranker.top(wanted * 2)]
+    details = await get_cached_collections(ranked) if ranked else {}
+    candidates = [details.get(collection_id) for collection_id in ranked]
+    if len(candidates) < wanted * 2:
+        candidates += await get_public_collections(0, wanted * 2)
+
+    entries, seen = [], set()
+    for collection in candidates:
+        if (
+            collection and collection["id"] not in seen
+            and collection["is_public"] and collection["status"] == CollectionStatus.ACTIVE
+        ):
+            seen.add(collection["id"])
+            entries.append({"id": collection["id"], "label": _label(collection["title"], TITLE_WIDTH)})
+    return _render_pages(entries[:wanted], settings.USSD_MENU_PAGE_SIZE)
+
+
+class UssdSessionStore:
+    """Session state in the cache backend (memory or Redis), expiring after ``ttl`` idle seconds"""
+
+    def __init__(self, backend, namespace: str, ttl: float):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.namespace}:ussd:{session_id}"
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        value = (await self.backend.get_many([self._key(session_id)]))[0]
+        return json.loads(value) if value is not None else None
+
+    async def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        await self.backend.set_many({self._key(session_id): json.dumps(state).encode()}, self.ttl)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+class UssdCharge(NamedTuple):
+    reference: str
+    collection_id: int
+    amount: Decimal
+    phone: str
+    provider: MobileMoneyProvider
+
+
+class UssdChargeQueue:
+    """Hands confirmed USSD payments to background workers.
+
+    The hop that confirms a payment records it as PENDING before replying,
+    so the payment outlives a restart, and queues its reference. A worker
+    then claims it by moving it to PROCESSING and asks Paystack to push the
+    approval prompt to the phone; the webhook settles it like any other
+    mobile money payment. On start, payments recorded within a session TTL
+    but never claimed are queued again; older ones are left to the expiry
+    sweeper.
+    """
+
+    DRAIN_SECONDS = 10.0
+
+    def __init__(self, workers: int, queue_size: int, recover_seconds: float):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.recover_after = timedelta(seconds=recover_seconds)
+        self.metrics = {"queued": 0, "rejected": 0, "recovered": 0, "submitted": 0, "failed": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def accepting(self) -> bool:
+        return self._queue is not None and not self._queue.full()
+
+    def submit(self, reference: str) -> bool:
+        """Queue a recorded payment; False when not running or already full"""
+        if self._queue is None:
+            self.metrics["rejected"] += 1
+            return False
+        try:
+            self._queue.put_nowait(reference)
+        except asyncio.QueueFull:
+            self.metrics["rejected"] += 1
+            return False
+        self.metrics["queued"] += 1
+        return True
+
+    def record(self, charge: UssdCharge) -> None:
+        """Store the confirmed payment as PENDING, before the caller is told to expect a prompt"""
+        db = SessionLocal()
+        try:
+            payer = db.query(User).filter(User.phone == charge.phone).first()
+            db.add(Payment(
+                reference=charge.reference,
+                # Unregistered payers fall back to the same placeholder user as the web flows
+                user_id=payer.id if payer else 1,
+                collection_id=charge.collection_id,
+                amount=charge.amount,
+                currency="GHS",
+                payment_method=PaymentMethod.USSD,
+                status=PaymentStatus.PENDING,
+                description="USSD contribution",
+                mobile_money_provider=charge.provider,
+                mobile_money_number=charge.phone,
+                customer_email=payer.email if payer else f"{charge.phone}@ussd.agapay.com",
+                customer_name=payer.full_name if payer else charge.phone
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim(self, reference: str) -> Optional[Dict[str, Any]]:
+        """Move a recorded payment to PROCESSING; what Paystack needs, or None if it was claimed or settled"""
+        db = SessionLocal()
+        try:
+            payment = db.query(Payment).filter(Payment.reference == reference).first()
+            if payment is None or transition(db, payment, PaymentStatus.PROCESSING) is None:
+                return None
+            db.commit()
+            return {
+                "amount": int(payment.amount * 100),
+                "email": payment.customer_email,
+                "phone": payment.mobile_money_number,
+                "provider": payment.mobile_money_provider.value,
+                "reference": reference,
+            }
+        finally:
+            db.close()
+
+    def _unclaimed(self) -> List[str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(Payment.reference).filter(
+                Payment.payment_method == PaymentMethod.USSD,
+                Payment.status == PaymentStatus.PENDING,
+                Payment.created_at >= datetime.utcnow() - self.recover_after
+            ).order_by(Payment.id).all()
+            return [reference for reference, in rows]
+        finally:
+            db.close()
+
+    def fail_payment(self, reference: str) -> bool:
+        db = SessionLocal()
+        try:
+            payment = db.query(Payment).filter(Payment.reference == reference).first()
+            # A webhook may already have settled it; only an open payment is failed here
+            if payment is None or payment.status not in (PaymentStatus.PENDING, PaymentStatus.PROCESSING):
+                return False
+            moved = transition(db, payment, PaymentStatus.FAILED)
+            if moved is None:
+                return False
+            record_transition(db, payment, moved.status, moved.processed_at)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    async def _charge(self, reference: str) -> None:
+        claimed = await run_in_threadpool(self._claim, reference)
+        if claimed is None:
+            return
+        try:
+            response = await PaystackService().submit_mobile_money(**claimed)
+        except (httpx.HTTPError, ValueError) as e:
+            response = {"status": False, "message": str(e)}
+        if response.get("status"):
+            self.metrics["submitted"] += 1
+            return
+        logger.warning("USSD charge %s was refused: %s", reference, response.get("message"))
+        self.metrics["failed"] += 1
+        if await run_in_threadpool(self.fail_payment, reference):
+            await payment_events.publish(reference, PaymentStatus.FAILED.value)
+
+    async def _work(self) -> None:
+        while True:
+            reference = await self._queue.get()
+            try:
+                await self._charge(reference)
+            except Exception as e:
+                logger.exception("USSD charge %s failed: %s", reference, e)
+                self.metrics["failed"] += 1
+            finally:
+                self._queue.task_done()
+
+    async def _recover(self) -> None:
+        try:
+            references = await run_in_threadpool(self._unclaimed)
+        except Exception as e:
+            logger.exception("Could not reload unclaimed USSD charges: %s", e)
+            return
+        for reference in references:
+            # Another worker may claim it first; the claim lets only one of them charge
+            if self.submit(reference):
+                self.metrics["recovered"] += 1
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._recover()))
+
+    async def stop(self) -> None:
+        """Finish queued charges (for a while), then stop the workers"""
+        if self._queue is None:
+            return
+        queue, self._queue = self._queue, None
+        try:
+            await asyncio.wait_for(queue.join(), self.DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping with %d USSD charges still queued", queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+class UssdEngine:
+    """Menu state machine behind the USSD callback.
+
+    Gateways send the whole input so far (``"2*1*20"``) on every hop; the
+    session remembers how many inputs it has answered, so a retried hop gets
+    the same reply instead of advancing twice. Each hop reads and writes one
+    session key and otherwise only touches cached menus, keeping it far
+    inside the gateway's timeout; only the confirming hop writes to the
+    database, to record the payment.
+    """
+
+    def __init__(self, sessions: UssdSessionStore, charges: UssdChargeQueue):
+        self.sessions = sessions
+        self.charges = charges
+        self.presets = [Decimal(amount) for amount in settings.USSD_PRESET_AMOUNTS]
+        self.amount_menu = _amount_menu(settings.USSD_PRESET_AMOUNTS)
+        self.metrics = {"hops": 0, "replayed": 0, "over_budget": 0}
+
+    async def handle(
+        self,
+        session_id: str,
+        phone: str,
+        text: str,
+        network_code: Optional[str] = None,
+        ip: Optional[str] = None
+    ) -> str:
+        """Reply to one hop: "CON <menu>" to continue the session, "END <message>" to close it.
+
+        ``ip`` is counted with the caller's number against the velocity limits
+        when the payment is confirmed.
+        """
+        started = time.perf_counter()
+        inputs = text.split("*") if text else []
+        state = await self.sessions.get(session_id)
+        if state is not None and len(inputs) <= state["hops"]:
+            self.metrics["replayed"] += 1
+            return state["reply"]
+
+        if state is None:
+            number, provider = _caller(phone, network_code)
+            state = {"step": COLLECTION, "page": 0, "hops": 0, "phone": number, "provider": provider and provider.value}
+            reply = await self._collection_page(state)
+        else:
+            reply = state["reply"]  # stands if the session has already ended
+        for value in inputs[state["hops"]:]:
+            if state["step"] == DONE:
+                break
+            reply = await self._advance(state, value.strip(), ip)
+        state["hops"] = len(inputs)
+        state["reply"] = reply
+        await self.sessions.save(session_id, state)
+
+        self.metrics["hops"] += 1
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms > settings.USSD_HOP_BUDGET_MS:
+            self.metrics["over_budget"] += 1
+            logger.warning("USSD hop for session %s took %.0fms", session_id, elapsed_ms)
+        return reply
+
+    async def _advance(self, state: Dict[str, Any], value: str, ip: Optional[str]) -> str:
+        step = state["step"]
+        if step == COLLECTION:
+            return await self._choose_from_page(state, value)
+        if step == COLLECTION_ID:
+            return await self._enter_collection_id(state, value)
+        if step == AMOUNT:
+            return self._choose_amount(state, value)
+        if step == OTHER_AMOUNT:
+            return self._enter_amount(state, value)
+        if step == NETWORK:
+            return self._choose_network(state, value)
+        return await self._confirm(state, value, ip)
+
+    async def _collection_page(self, state: Dict[str, Any], error: str = "") -> str:
+        pages = await get_collection_menu()
+        state["page"] = min(state["page"], len(pages) - 1)
+        page = pages[state["page"]]
+        # Remember what this screen offered; the menu may be rebuilt before the reply
+        state["choices"] = page["ids"]
+        state["last_page"] = len(pages) - 1
+        return f"CON {error}{page['text']}"
+
+    async def _choose_from_page(self, state: Dict[str, Any], value: str) -> str:
+        if value == ENTER_ID:
+            state["step"] = COLLECTION_ID
+            return "CON Enter collection ID:"
+        if value == NEXT_PAGE and state["page"] < state["last_page"]:
+            state["page"] += 1
+            return await self._collection_page(state)
+        if value == PREVIOUS_PAGE and state["page"] > 0:
+            state["page"] -= 1
+            return await self._collection_page(state)
+        if value.isdigit() and 1 <= int(value) <= len(state["choices"]):
+            collection = await get_cached_collection(state["choices"][int(value) - 1])
+            if collection and collection["status"] == CollectionStatus.ACTIVE:
+                return self._select_collection(state, collection)
+            return await self._collection_page(state, "That collection has closed.\n")
+        return await self._collection_page(state, "Invalid choice.\n")
+
+    async def _enter_collection_id(self, state: Dict[str, Any], value: str) -> str:
+        collection = await get_cached_collection(int(value)) if value.isdigit() else None
+        if collection and collection["status"] == CollectionStatus.ACTIVE:
+            return self._select_collection(state, collection)
+        return "CON Collection not found.\nEnter collection ID:"
+
+    def _select_collection(self, state: Dict[str, Any], collection: Dict[str, Any]) -> str:
+        state.update(step=AMOUNT, collection_id=collection["id"], title=_label(collection["title"], 40))
+        return f"CON {state['title']}\n{self.amount_menu}"
+
+    def _choose_amount(self, state: Dict[str, Any], value: str) -> str:
+        if value.isdigit() and 1 <= int(value) <= len(self.presets):
+            return self._set_amount(state, self.presets[int(value) - 1])
+        if value == str(len(self.presets) + 1):
+            state["step"] = OTHER_AMOUNT
+            return "CON Enter amount (GHS):"
+        return f"CON Invalid choice.\n{self.amount_menu}"
+
+    def _enter_amount(self, state: Dict[str, Any], value: str) -> str:
+        amount = Decimal(value) if AMOUNT_PATTERN.match(value) else None
+        if amount is None or not settings.USSD_MIN_AMOUNT <= amount <= settings.USSD_MAX_AMOUNT:
+            return f"CON Enter an amount from GHS {settings.USSD_MIN_AMOUNT:.0f} to {settings.USSD_MAX_AMOUNT:.0f}:"
+        return self._set_amount(state, amount)
+
+    def _set_amount(self, state: Dict[str, Any], amount: Decimal) -> str:
+        state["amount"] = str(amount.quantize(Decimal("0.01")))
+        if state["provider"] is None:
+            state["step"] = NETWORK
+            return f"CON {NETWORK_MENU}"
+        return self._confirmation(state)
+
+    def _choose_network(self, state: Dict[str, Any], value: str) -> str:
+        if value.isdigit() and 1 <= int(value) <= len(NETWORKS):
+            state["provider"] = NETWORKS[int(value) - 1].value
+            return self._confirmation(state)
+        return f"CON Invalid choice.\n{NETWORK_MENU}"
+
+    def _confirmation(self, state: Dict[str, Any], error: str = "") -> str:
+        state["step"] = CONFIRM
+        return f"CON {error}Pay GHS {state['amount']} to {state['title']}?\n1. Confirm\n2. Cancel"
+
+    async def _confirm(self, state: Dict[str, Any], value: str, ip: Optional[str]) -> str:
+        if value == "2":
+            state["step"] = DONE
+            return "END Payment cancelled."
+        if value != "1":
+            return self._confirmation(state, "Invalid choice.\n")
+
+        state["step"] = DONE
+        if settings.VELOCITY_ENABLED and await velocity_limiter.check(phone=state["phone"], ip=ip):
+            return "END Too many payment attempts. Please try again later."
+        if not self.charges.accepting():
+            return "END Service is busy. Please try again shortly."
+        reference = f"AGA_USSD_{secrets.token_hex(8).upper()}"
+        await run_in_threadpool(self.charges.record, UssdCharge(
+            reference=reference,
+            collection_id=state["collection_id"],
+            amount=Decimal(state["amount"]),
+            phone=state["phone"],
+            provider=MobileMoneyProvider(state["provider"])
+        ))
+        if not self.charges.submit(reference):
+            # Filled up while the payment was being recorded
+            await run_in_threadpool(self.charges.fail_payment, reference)
+            return "END Service is busy. Please try again shortly."
+        state["reference"] = reference
+        return f"END Approve the GHS {state['amount']} prompt on your phone to complete payment.\nRef: {reference}"
+
+
+ussd_charges = UssdChargeQueue(
+    workers=settings.USSD_CHARGE_WORKERS,
+    queue_size=settings.USSD_CHARGE_QUEUE_SIZE,
+    recover_seconds=settings.USSD_SESSION_TTL_SECONDS
+)
+
+ussd_engine = UssdEngine(
+    UssdSessionStore(create_backend(), settings.CACHE_NAMESPACE, settings.USSD_SESSION_TTL_SECONDS),
+    ussd_charges
+)
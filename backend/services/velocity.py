@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from core.cache import create_backend
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Violation(NamedTuple):
+    key: str  # "email", "phone" or "ip"
+    limit: int
+    window: int  # seconds
+    retry_after: int  # seconds until the attempt would be allowed
+
+
+class SlidingWindow:
+    """Hits over the last ``window`` seconds, counted in a ring of sub-buckets.
+
+    Buckets that have slid out of the window are cleared when the next hit
+    arrives, at most once round the ring, so a hit costs O(buckets) at worst
+    whatever the traffic.
+    """
+
+    __slots__ = ("counts", "total", "tick")
+
+    def __init__(self, buckets: int, tick: int):
+        self.counts = [0] * buckets
+        self.total = 0
+        self.tick = tick  # bucket number of the latest hit
+
+    def hit(self, tick: int) -> int:
+        """Record a hit in bucket number ``tick``; the hits now in the window"""
+        if tick > self.tick:
+            size = len(self.counts)
+            if tick - self.tick >= size:
+                self.counts = [0] * size
+                self.total = 0
+            else:
+                for passed in range(self.tick + 1, tick + 1):
+                    self.total -= self.counts[passed % size]
+                    self.counts[passed % size] = 0
+            self.tick = tick
+        self.counts[self.tick % len(self.counts)] += 1
+        self.total += 1
+        return self.total
+
+    def buckets_until_below(self, limit: int) -> int:
+        """Buckets to wait before fewer than ``limit`` hits remain in the window"""
+        size = len(self.counts)
+        remaining = self.total
+        for waited in range(1, size + 1):
+            remaining -= self.counts[(self.tick + waited) % size]
+            if remaining < limit:
+                return waited
+        return size
+
+
+class LocalCounters:
+    """Windows per key in this process, the least recently seen keys evicted past ``max_keys``"""
+
+    def __init__(self, limits: Dict[str, Dict[int, int]], buckets: int, max_keys: int):
+        # (window, limit, bucket length) per key
+        self.limits = {
+            key: [(window, limit, window / buckets) for window, limit in sorted(windows.items())]
+            for key, windows in limits.items()
+        }
+        self.buckets = buckets
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._windows: "OrderedDict[Tuple[str, str], List[SlidingWindow]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    async def hit(self, values: Dict[str, str], now: float) -> Optional[Violation]:
+        violation = None
+        for key, value in values.items():
+            limits = self.limits[key]
+            windows = self._windows.get((key, value))
+            if windows is None:
+                windows = [SlidingWindow(self.buckets, int(now // bucket)) for _, _, bucket in limits]
+                self._windows[(key, value)] = windows
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._windows.move_to_end((key, value))
+            for (window, limit, bucket), counter in zip(limits, windows):
+                tick = int(now // bucket)
+                if counter.hit(tick) > limit and violation is None:
+                    retry_after = math.ceil((tick + counter.buckets_until_below(limit)) * bucket - now)
+                    violation = Violation(key, limit, window, max(1, retry_after))
+        return violation
+
+
+class SharedCounters:
+    """Windows per key in the cache backend, so all workers count together.
+
+    Each window is approximated from two fixed-window counters: the current
+    one plus the previous one weighted by how much of it still overlaps the
+    sliding window. Both are read and bumped concurrently, in one round
+    trip's time.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[int, int]], backend, namespace: str):
+        self.limits = {key: sorted(windows.items()) for key, windows in limits.items()}
+        self.backend = backend
+        self.namespace = namespace
+
+    def _key(self, key: str, value: str, window: int, index: int) -> str:
+        # Hashed so emails and phone numbers are not stored in the clear
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=12).hexdigest()
+        return f"{self.namespace}:velocity:{key}:{window}:{digest}:{index}"
+
+    async def hit(self, values: Dict[str, str], now: float) -> Optional[Violation]:
+        checks = []
+        for key, value in values.items():
+            for window, limit in self.limits[key]:
+                index = int(now // window)
+                checks.append((key, window, limit, index, self._key(key, value, window, index), self._key(key, value, window, index - 1)))
+        previous, current = await asyncio.gather(
+            self.backend.get_many([check[5] for check in checks]),
+            self.backend.incr([check[4] for check in checks], ttl=2 * max(check[1] for check in checks))
+        )
+        for (key, window, limit, index, _, _), before, count in zip(checks, previous, current):
+            elapsed = now / window - index  # share of the current window gone by
+            before = int(before or 0)
+            if before * (1 - elapsed) + count <= limit:
+                continue
+            # The previous window's weight must fall far enough for one more attempt
+            if count >= limit or not before:
+                retry_after = (1 - elapsed) * window
+            else:
+                retry_after = (1 - (limit - count) / before - elapsed) * window
+            return Violation(key, limit, window, max(1, math.ceil(retry_after)))
+        return None
+
+
+class VelocityLimiter:
+    """Caps payment creation attempts per email, phone number and client IP.
+
+    Every attempt counts, including refused ones, so a client that keeps
+    retrying stays refused until it slows down. Counting is in memory unless
+    ``shared`` is on. A shared backend that cannot be reached lets the
+    request through rather than failing payments.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[int, int]], buckets: int, max_keys: int, shared: bool = False):
+        self.limits = limits
+        self.counters = (
+            SharedCounters(limits, create_backend(), settings.CACHE_NAMESPACE) if shared
+            else LocalCounters(limits, buckets, max_keys)
+        )
+        self.metrics = {"checked": 0, "refused": 0, "backend_errors": 0}
+
+    async def check(self, email: Optional[str] = None, phone: Optional[str] = None, ip: Optional[str] = None) -> Optional[Violation]:
+        values = {
+            key: value for key, value in (("email", email and email.lower()), ("phone", phone), ("ip", ip))
+            if value and self.limits.get(key)
+        }
+        if not values:
+            return None
+        self.metrics["checked"] += 1
+        try:
+            violation = await self.counters.hit(values, time.time())
+        except Exception as e:
+            self.metrics["backend_errors"] += 1
+            logger.warning("Velocity check skipped: %s", e)
+            return None
+        if violation is not None:
+            self.metrics["refused"] += 1
+        return violation
+
+    async def enforce(self, request: Request, email: Optional[str] = None, phone: Optional[str] = None) -> None:
+        """Raise 429 with Retry-After if this attempt is over any limit"""
+        if not settings.VELOCITY_ENABLED:
+            return
+        violation = await self.check(email, phone, client_ip(request))
+        if violation is not None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many payment attempts for this {violation.key}; try again in {violation.retry_after}s",
+                headers={"Retry-After": str(violation.retry_after)}
+            )
+
+    async def close(self) -> None:
+        if isinstance(self.counters, SharedCounters):
+            await self.counters.backend.close()
+
+
+def client_ip(request: Request) -> Optional[str]:
+    if settings.VELOCITY_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+velocity_limiter = VelocityLimiter(
+    limits=settings.VELOCITY_LIMITS,
+    buckets=settings.VELOCITY_BUCKETS,
+    max_keys=settings.VELOCITY_MAX_KEYS,
+    shared=settings.VELOCITY_SHARED
+)